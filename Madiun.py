@@ -9,6 +9,8 @@ import hashlib
 import time
 import json
 
+from backend import classify_sheet_type
+
 # ============= SISTEM LOGIN - FUNGSI UTILITAS =============
 
 def load_config():
@@ -686,32 +688,22 @@ class MadiunDataVisualizer:
             st.warning("Kolom DESA tidak ditemukan. Beberapa fitur mungkin tidak berfungsi.")
             df_copy['DESA'] = 'Unknown'
         
-        # Apply appropriate filter based on sheet name
-        # Check multiple variants of names to handle different Excel formats
-        if any(akta_keyword in sheet_name.upper() for akta_keyword in ['AKTA', 'AKTA 0', 'AKTA 0 SD 17']):
-            filtered_df = self.add_akta_filters(df_copy)
-        elif 'KTP' in sheet_name.upper():
-            filtered_df = self.add_ktp_filters(df_copy)
-        elif 'AGAMA' in sheet_name.upper():
-            filtered_df = self.add_agama_filters(df_copy)
-        elif 'KIA' in sheet_name.upper():
-            filtered_df = self.add_kia_filters(df_copy)
-        elif any(kk_keyword in sheet_name.upper() for kk_keyword in ['KARTU KELUARGA', 'KK']):
-            # Make sure it's actually KK data and not KK KAWIN data
-            if 'KAWIN' not in sheet_name.upper():
-                filtered_df = self.add_kartu_keluarga_filters(df_copy)
-            else:  # This is for KK KAWIN sheets
-                filtered_df = self.add_perkawinan_filters(df_copy)
-        elif 'PENDUDUK' in sheet_name.upper():
-            filtered_df = self.add_penduduk_filters(df_copy)
-        elif 'PENDIDIKAN' in sheet_name.upper():
-            filtered_df = self.add_pendidikan_filters(df_copy)
-        elif 'PEKERJAAN' in sheet_name.upper():
-            filtered_df = self.add_pekerjaan_filters(df_copy)
-        elif any(kawin_keyword in sheet_name.upper() for kawin_keyword in ['PERKAWINAN', 'KAWIN']):
-            filtered_df = self.add_perkawinan_filters(df_copy)
-        elif any(umur_keyword in sheet_name.upper() for umur_keyword in ['KEL UMUR', 'KELOMPOK UMUR', 'UMUR']):
-            filtered_df = self.add_kelompok_umur_filters(df_copy)
+        # Apply appropriate filter based on sheet type (classified once per sheet name)
+        sheet_filters = {
+            'akta': self.add_akta_filters,
+            'ktp': self.add_ktp_filters,
+            'agama': self.add_agama_filters,
+            'kia': self.add_kia_filters,
+            'kartu_keluarga': self.add_kartu_keluarga_filters,
+            'penduduk': self.add_penduduk_filters,
+            'pendidikan': self.add_pendidikan_filters,
+            'pekerjaan': self.add_pekerjaan_filters,
+            'perkawinan': self.add_perkawinan_filters,
+            'kelompok_umur': self.add_kelompok_umur_filters
+        }
+        sheet_type = classify_sheet_type(sheet_name)
+        if sheet_type in sheet_filters:
+            filtered_df = sheet_filters[sheet_type](df_copy)
         else:
             st.warning(f"Tidak ada filter khusus untuk lembar {sheet_name}")
             filtered_df = df_copy
@@ -6,6 +6,19 @@ import plotly.graph_objs as go
 import os
 import numpy as np
 
+from sheet_kernel import SheetMatrix
+
+
+@st.cache_data(show_spinner=False)
+def read_sheet(file_path, sheet_name):
+    """Baca satu lembar Excel sekali per file dan lembar"""
+    return pd.read_excel(file_path, sheet_name=sheet_name)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def load_sheet_matrix(_visualizer, file_path, sheet_name, by):
+    """Kolom numerik lembar yang sudah dibersihkan sebagai SheetMatrix, dibangun sekali per (lembar, kolom kunci)"""
+    df = _visualizer.clean_dataframe(read_sheet(file_path, sheet_name))
+    return SheetMatrix(df, list(by), df.select_dtypes(include='number').columns.tolist())
 
 
 class MadiunDataVisualizer:
@@ -104,32 +117,31 @@ class MadiunDataVisualizer:
             st.warning("Tidak dapat menemukan kolom Laki-laki/Perempuan")
             return None
         
-        # Proses pengelompokan
-        grouped_data = []
-        
         # Cek apakah kolom Kecamatan tersedia
         if location_columns.get('kecamatan'):
-            # Grupkan berdasarkan Kecamatan
-            kecamatan_groups = df.groupby(location_columns['kecamatan'])
+            # Satu matriks per lembar: baris dikelompokkan per Kecamatan,
+            # kolom LK dan PR dijumlah sekaligus lewat matriks keanggotaan
+            kecamatan_col = location_columns['kecamatan']
+            value_columns = list(dict.fromkeys(lk_columns + pr_columns))
+            # Matriks lembar di-cache per (lembar, kolom kunci); dibangun langsung
+            # hanya bila kolom LK/PR bukan kolom numerik lembar itu
+            matrix = load_sheet_matrix(self, self.file_path, sheet_name, (kecamatan_col,))
+            if not set(value_columns) <= set(matrix.columns):
+                matrix = SheetMatrix(df, [kecamatan_col], value_columns)
             
-            # Untuk setiap Kecamatan
-            for kecamatan, group_df in kecamatan_groups:
-                kecamatan_data = {'Kecamatan': kecamatan}
-                
-                # Proses Laki-laki
-                if lk_columns:
-                    lk_total = group_df[lk_columns].sum().sum()
-                    kecamatan_data['Total Laki-laki'] = lk_total
-                
-                # Proses Perempuan
-                if pr_columns:
-                    pr_total = group_df[pr_columns].sum().sum()
-                    kecamatan_data['Total Perempuan'] = pr_total
-                
-                grouped_data.append(kecamatan_data)
+            column_groups = {}
+            if lk_columns:
+                column_groups['Total Laki-laki'] = matrix.column_positions(lk_columns)
+            if pr_columns:
+                column_groups['Total Perempuan'] = matrix.column_positions(pr_columns)
+            totals = matrix.sum(list(column_groups.values()))
             
-            # Konversi ke DataFrame
-            grouped_df = pd.DataFrame(grouped_data)
+            grouped_df = pd.DataFrame({'Kecamatan': matrix.labels[kecamatan_col]})
+            for group_idx, (name, positions) in enumerate(column_groups.items()):
+                totals_col = totals[:, group_idx]
+                if all(matrix.integer_columns[position] for position in positions):
+                    totals_col = totals_col.astype(np.int64)
+                grouped_df[name] = totals_col
             
             # Tampilkan data yang dikelompokkan
             st.subheader(f"Ringkasan Data Berdasarkan Kecamatan - {sheet_name}")
@@ -293,7 +305,7 @@ def main():
     )
     
     # Baca lembar yang dipilih
-    df = pd.read_excel(file_path, sheet_name=selected_sheet)
+    df = read_sheet(file_path, selected_sheet)
     
     # Tampilkan data mentah
     st.subheader(f"Data Mentah - {selected_sheet}")
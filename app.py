@@ -2,24 +2,206 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
+import plotly.io as pio
 import os
+import json
 import numpy as np
 import time
+from functools import partial
 from PIL import Image
 
 # Import backend functions and classes
 from backend import (
     load_config, get_logo_path, 
-    MadiunDataVisualizer, get_available_files
+    MadiunDataVisualizer, get_available_files, get_data_file_path,
+    sync_data_directory, get_data_directory_signature, get_sheet_dtype_report, NUMERIC_DTYPES,
+    get_filter_result_cache, get_figure_cache, compute_frame_fingerprint, aggregate_by_location, lookup_sheet_cube, get_summary_level,
+    classify_sheet_type, get_column_group_rule, select_column_groups, aggregate_column_groups,
+    SheetWarmer,
+    submit_uploaded_workbook
 )
+# Import the vectorised share-of-total engine
+from sheet_kernel import share_frame, share_of_total, membership_matrix, fold_frame
+# Import the analytical store shared by all semesters
+from data_store import get_semester_store, compute_changes
 # Import the map visualization module
 from madiun_map import create_choropleth_map, render_map_tab, load_madiun_geojson
 
 # ============= VISUALIZATION FUNCTIONS =============
 
-def create_visualizations(filtered_df, sheet_name):
-    """Create visualizations based on filtered data"""
-    numeric_cols = filtered_df.select_dtypes(include=['float64', 'int64']).columns
+# Batas (kolom, baris) per jenis grafik; sisanya dijumlah ke LAINNYA. None = tanpa batas
+CHART_TOP_N = {
+    'bar': (12, 30),
+    'heatmap': (25, 40),
+    'proportion': (12, 30),
+    'line': (8, 30),
+    'column_groups': (None, 30)
+}
+
+# Judul grafik total per kelompok kolom, per aturan COLUMN_GROUP_RULES
+COLUMN_GROUP_TITLES = {
+    'pekerjaan_sector': 'Sektor Pekerjaan',
+    'umur_category': 'Kategori Umur'
+}
+
+def reduce_for_chart(pivot_df, kind):
+    """Keep the chart's top-N columns and rows by total (CHART_TOP_N) and fold the rest into LAINNYA"""
+    n_columns, n_rows = CHART_TOP_N.get(kind, (None, None))
+    return fold_frame(pivot_df, n_columns, n_rows)
+
+# Grafik lokasi dengan sel (baris x kolom) lebih dari ini dibangun langsung dari matriks numpy dan
+# garisnya digambar dengan WebGL. Nilai awal mengikuti render_mode='auto' plotly express (WebGL di atas 1000 titik)
+WEBGL_MIN_CELLS = int(os.environ.get("MADIUN_WEBGL_MIN_CELLS", "1000"))
+
+def use_webgl(plot_df):
+    return plot_df.shape[0] * plot_df.shape[1] > WEBGL_MIN_CELLS
+
+def create_column_traces(plot_df, trace_type, **trace_args):
+    """One trace per column of a location-indexed frame, built from its arrays without plotly express' long-format melt"""
+    x_name = plot_df.index.name
+    locations = [str(label) for label in plot_df.index]
+    return [
+        trace_type(
+            x=locations,
+            y=plot_df[col].to_numpy(),
+            name=str(col),
+            legendgroup=str(col),
+            # Hover sama dengan plotly express format lebar
+            hovertemplate=f'variable={col}<br>{x_name}=%{{x}}<br>value=%{{y}}<extra></extra>',
+            **trace_args
+        )
+        for col in plot_df.columns
+    ]
+
+def _large_location_layout(fig, plot_df, title, height):
+    fig.update_layout(
+        title=title,
+        height=height,
+        xaxis_title=plot_df.index.name,
+        yaxis_title='value',
+        legend_title_text='variable'
+    )
+
+def create_location_bar_figure(plot_df, title, webgl=None):
+    """Grouped bar chart of the columns of a location-indexed frame; large frames skip plotly express.
+
+    Plotly tidak punya batang WebGL, jadi batang tetap batang (satu trace per
+    kolom, dengan legenda); hanya pembangunannya yang langsung dari array.
+    """
+    if webgl if webgl is not None else use_webgl(plot_df):
+        fig_bar = go.Figure(create_column_traces(plot_df, go.Bar))
+        _large_location_layout(fig_bar, plot_df, title, 600)
+        fig_bar.update_layout(barmode='group')
+    else:
+        fig_bar = px.bar(
+            plot_df.reset_index(),
+            x=plot_df.index.name,
+            y=list(plot_df.columns),
+            title=title,
+            barmode='group',
+            height=600
+        )
+    
+    # Rotasi label x untuk kecamatan/desa agar lebih mudah dibaca
+    fig_bar.update_layout(xaxis_tickangle=-45)
+    return fig_bar
+
+def create_location_line_figure(plot_df, title, webgl=None):
+    """Line chart of the columns of a location-indexed frame; large frames use one Scattergl trace per column"""
+    if webgl if webgl is not None else use_webgl(plot_df):
+        fig_line = go.Figure(create_column_traces(plot_df, go.Scattergl, mode='lines+markers'))
+        _large_location_layout(fig_line, plot_df, title, 500)
+    else:
+        fig_line = px.line(
+            plot_df.reset_index(),
+            x=plot_df.index.name,
+            y=list(plot_df.columns),
+            title=title,
+            markers=True,
+            height=500
+        )
+    fig_line.update_layout(xaxis_tickangle=-45)
+    return fig_line
+
+def create_location_heatmap_figure(plot_df, title, y_label, webgl=None):
+    """Heatmap of a location-indexed frame; large frames pass the numpy matrix to a single go.Heatmap"""
+    if webgl if webgl is not None else use_webgl(plot_df):
+        fig_heatmap = go.Figure(go.Heatmap(
+            z=plot_df.to_numpy(),
+            x=[str(col) for col in plot_df.columns],
+            y=[str(label) for label in plot_df.index],
+            coloraxis='coloraxis',
+            hovertemplate=f'Kategori: %{{x}}<br>{y_label}: %{{y}}<br>Jumlah: %{{z}}<extra></extra>'
+        ))
+        fig_heatmap.update_layout(
+            title=title,
+            height=500,
+            coloraxis=dict(colorscale='Viridis', colorbar=dict(title='Jumlah')),
+            xaxis_title='Kategori',
+            yaxis=dict(title=y_label, autorange='reversed')
+        )
+        return fig_heatmap
+    
+    # Membuat heatmap dengan colorscales yang lebih jelas
+    return px.imshow(
+        plot_df,
+        labels=dict(x="Kategori", y=y_label, color="Jumlah"),
+        title=title,
+        color_continuous_scale='Viridis',
+        aspect="auto",  # Menyesuaikan aspek rasio untuk ukuran layar
+        height=500
+    )
+
+def cached_figure(kind, data_key, options, build):
+    """Return a figure from the shared figure cache, calling build() only on a miss.
+
+    data_key adalah sidik data agregat (compute_frame_fingerprint) dan options
+    tuple opsi yang memengaruhi tampilan (judul, label). Grafik yang sama di
+    sesi lain langsung diambil dari spesifikasi JSON tanpa dibangun ulang.
+    """
+    key = (kind, data_key, options, CHART_TOP_N.get(kind), WEBGL_MIN_CELLS)
+    spec = get_figure_cache().get_or_load(key, lambda: pio.to_json(build(), validate=False))
+    # Spesifikasi sudah divalidasi saat dibangun; jangan validasi ulang setiap rerun
+    return go.Figure(json.loads(spec), _validate=False)
+
+def render_figure(kind, data_key, options, build, error_message=None):
+    """Show one cached figure with the time it took to build (or fetch) and send.
+
+    Dengan error_message, kegagalan build() ditampilkan sebagai peringatan
+    alih-alih exception; penjaga ini berada di sini agar juga berlaku saat
+    fragmen grafik dijalankan ulang sendiri.
+    """
+    start = time.perf_counter()
+    try:
+        fig = cached_figure(kind, data_key, options, build)
+    except Exception as e:
+        if error_message is None:
+            raise
+        st.warning(f"{error_message}: {str(e)}")
+        return
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Waktu grafik: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+@st.experimental_fragment
+def lazy_figure(label, kind, data_key, options, build, error_message=None):
+    """Figure built only after its toggle is switched on; the toggle reruns this fragment only"""
+    if st.toggle(label, key=f"show_chart_{kind}"):
+        render_figure(kind, data_key, options, build, error_message)
+
+def show_figure(label, kind, data_key, options, build, lazy=True, error_message=None):
+    if lazy:
+        lazy_figure(label, kind, data_key, options, build, error_message)
+    else:
+        render_figure(kind, data_key, options, build, error_message)
+
+def create_visualizations(filtered_df, sheet_name, cube=None, lazy=True, load_matrix=None):
+    """Create visualizations based on filtered data (sums come from the sheet cube when given).
+
+    Grafik batang pertama selalu ditampilkan; grafik lain baru dibangun saat
+    tombolnya dinyalakan, kecuali lazy=False. load_matrix(by) memberi matriks
+    lembar yang di-cache (MadiunDataVisualizer.load_sheet_matrix) untuk subset desa.
+    """
+    numeric_cols = filtered_df.select_dtypes(include=NUMERIC_DTYPES).columns
     
     if len(numeric_cols) > 0:
         # Ensure KECAMATAN column exists
@@ -28,135 +210,124 @@ def create_visualizations(filtered_df, sheet_name):
             return
             
         # Determine if we should display by desa
-        show_by_desa = 'DESA' in filtered_df.columns and len(filtered_df['DESA'].unique()) > 1 and filtered_df['KECAMATAN'].nunique() == 1
+        show_by_desa = get_summary_level(filtered_df) == 'DESA'
         
         if show_by_desa:
             # Agregasi data per desa untuk visualisasi
-            agg_df = filtered_df.groupby('DESA')[numeric_cols].sum().reset_index()
-            
-            # Bar chart berdasarkan desa
-            fig_bar = px.bar(
-                agg_df,
-                x='DESA',
-                y=numeric_cols,
-                title=f'Visualisasi Data {sheet_name} per Desa',
-                barmode='group',
-                height=600
-            )
+            agg_df = aggregate_by_location(filtered_df, 'DESA', numeric_cols, cube, load_matrix)
         else:
             # Agregasi data per kecamatan untuk visualisasi
-            agg_df = filtered_df.groupby('KECAMATAN')[numeric_cols].sum().reset_index()
-            
-            # Bar chart berdasarkan kecamatan
-            fig_bar = px.bar(
-                agg_df,
-                x='KECAMATAN',
-                y=numeric_cols,
-                title=f'Visualisasi Data {sheet_name} per Kecamatan',
-                barmode='group',
-                height=600
+            agg_df = aggregate_by_location(filtered_df, 'KECAMATAN', numeric_cols, cube, load_matrix)
+        
+        # Semua grafik di bawah diturunkan dari agg_df: satu sidik data untuk semuanya
+        data_key = compute_frame_fingerprint(agg_df)
+        options = (sheet_name, show_by_desa)
+        
+        # Jika filter per desa, gunakan index desa; jika per kecamatan, index kecamatan
+        x_col = 'DESA' if show_by_desa else 'KECAMATAN'
+        x_label = 'Desa' if show_by_desa else 'Kecamatan'
+        pivot_df = agg_df.set_index(x_col)
+        
+        def build_bar():
+            # Lembar lebar (mis. PEKERJAAN): kolom di luar top-N digabung menjadi LAINNYA
+            return create_location_bar_figure(
+                reduce_for_chart(pivot_df, 'bar'),
+                f'Visualisasi Data {sheet_name} per {x_label}'
             )
+        
+        render_figure('bar', data_key, options, build_bar)
+        
+        # Lembar berkelompok kolom (sektor pekerjaan, kategori umur): total per kelompok
+        sheet_type = classify_sheet_type(sheet_name)
+        if select_column_groups(filtered_df, sheet_type) is not None:
+            group_title = COLUMN_GROUP_TITLES.get(get_column_group_rule(sheet_type)[1], 'Kelompok')
+            def build_column_groups():
+                group_df = reduce_for_chart(aggregate_column_groups(filtered_df, x_col, sheet_type, load_matrix), 'column_groups')
+                fig_groups = px.bar(
+                    group_df.reset_index(),
+                    x=x_col,
+                    y=list(group_df.columns),
+                    title=f"Total per {group_title} - {sheet_name} per {x_label}",
+                    barmode='stack',
+                    height=500
+                )
+                fig_groups.update_layout(xaxis_tickangle=-45, legend_title_text=group_title)
+                return fig_groups
             
-        # Rotasi label x untuk kecamatan/desa agar lebih mudah dibaca
-        fig_bar.update_layout(xaxis_tickangle=-45)
-        st.plotly_chart(fig_bar, use_container_width=True)
+            show_figure(f"Tampilkan total per {group_title.lower()}", 'column_groups', data_key, options,
+                        build_column_groups, lazy)
         
         # Visualisasi tambahan untuk data tertentu
         if len(numeric_cols) <= 10:  # Jika kolom tidak terlalu banyak
-            # Pie chart untuk total
-            total_values = agg_df[numeric_cols].sum()
-            fig_pie = go.Figure(data=[go.Pie(
-                labels=total_values.index,
-                values=total_values.values,
-                textinfo='percent+value',
-                hole=0.3,  
-                )])
-            fig_pie.update_layout(
-                title=f'Distribusi Total - {sheet_name}',
-                height=500
-            )
-            st.plotly_chart(fig_pie, use_container_width=True)
+            def build_pie():
+                # Pie chart untuk total
+                total_values = agg_df[numeric_cols].sum()
+                fig_pie = go.Figure(data=[go.Pie(
+                    labels=total_values.index,
+                    values=total_values.values,
+                    textinfo='percent+value',
+                    hole=0.3,  
+                    )])
+                fig_pie.update_layout(
+                    title=f'Distribusi Total - {sheet_name}',
+                    height=500
+                )
+                return fig_pie
+            
+            show_figure("Tampilkan distribusi total", 'pie', data_key, options, build_pie, lazy)
         
         # Heatmap untuk perbandingan 
         if len(agg_df) > 1 and len(numeric_cols) > 1:
-            if show_by_desa:
-                # Jika filter per desa, gunakan index desa
-                pivot_df = agg_df.set_index('DESA')
-                
-                # Membuat heatmap dengan colorscales yang lebih jelas
-                fig_heatmap = px.imshow(
-                    pivot_df,
-                    labels=dict(x="Kategori", y="Desa", color="Jumlah"),
-                    title=f"Heatmap Data {sheet_name} per Desa",
-                    color_continuous_scale='Viridis',
-                    aspect="auto",  # Menyesuaikan aspek rasio untuk ukuran layar
-                    height=500
-                )
-            else:
-                # Jika filter per kecamatan, gunakan index kecamatan
-                pivot_df = agg_df.set_index('KECAMATAN')
-                
-                # Membuat heatmap dengan colorscales yang lebih jelas
-                fig_heatmap = px.imshow(
-                    pivot_df,
-                    labels=dict(x="Kategori", y="Kecamatan", color="Jumlah"),
-                    title=f"Heatmap Data {sheet_name} per Kecamatan",
-                    color_continuous_scale='Viridis',
-                    aspect="auto",  # Menyesuaikan aspek rasio untuk ukuran layar
-                    height=500
+            def build_heatmap():
+                return create_location_heatmap_figure(
+                    reduce_for_chart(pivot_df, 'heatmap'),
+                    f"Heatmap Data {sheet_name} per {x_label}",
+                    x_label
                 )
             
-            st.plotly_chart(fig_heatmap, use_container_width=True)
+            show_figure("Tampilkan heatmap", 'heatmap', data_key, options, build_heatmap, lazy)
             
             # Tambahkan visualisasi khusus untuk lembar tertentu
-            create_special_visualizations(pivot_df, sheet_name, show_by_desa)
+            create_special_visualizations(pivot_df, sheet_name, show_by_desa, data_key, lazy)
             
             # Tambahan visualisasi - Stacked Bar Chart untuk perbandingan proporsi
             if len(numeric_cols) > 1:
-                # Normalisasi data untuk perbandingan proporsi
-                prop_df = pivot_df.copy()
-                for idx in prop_df.index:
-                    row_sum = prop_df.loc[idx].sum()
-                    if row_sum > 0:  # Hindari pembagian dengan nol
-                        prop_df.loc[idx] = (prop_df.loc[idx] / row_sum) * 100
+                def build_proportion():
+                    # Normalisasi data untuk perbandingan proporsi (baris bertotal nol tetap 0)
+                    prop_df = share_frame(reduce_for_chart(pivot_df, 'proportion'), 'row').fillna(0)
+                    
+                    fig_prop = px.bar(
+                        prop_df.reset_index(),
+                        x=x_col,  # Ini akan menjadi DESA atau KECAMATAN
+                        y=prop_df.columns,
+                        title=f"Proporsi Data {sheet_name} per {x_label} (%)",
+                        barmode='stack',
+                        height=500
+                    )
+                    fig_prop.update_layout(xaxis_tickangle=-45)
+                    return fig_prop
                 
-                # Gunakan judul yang sesuai berdasarkan tampilan desa atau kecamatan
-                x_label = 'Desa' if show_by_desa else 'Kecamatan'
-                
-                fig_prop = px.bar(
-                    prop_df.reset_index(),
-                    x=pivot_df.index.name,  # Ini akan menjadi DESA atau KECAMATAN
-                    y=prop_df.columns,
-                    title=f"Proporsi Data {sheet_name} per {x_label} (%)",
-                    barmode='stack',
-                    height=500
-                )
-                fig_prop.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig_prop, use_container_width=True)
+                show_figure("Tampilkan proporsi data", 'proportion', data_key, options, build_proportion, lazy)
                 
             # Tambahan visualisasi - Line Chart untuk trend visual
             if len(numeric_cols) > 1:
-                # Gunakan judul yang sesuai berdasarkan tampilan desa atau kecamatan
-                x_label = 'Desa' if show_by_desa else 'Kecamatan'
-                x_col = 'DESA' if show_by_desa else 'KECAMATAN'
+                def build_line():
+                    return create_location_line_figure(
+                        reduce_for_chart(pivot_df, 'line'),
+                        f"Tren Data {sheet_name} per {x_label}"
+                    )
                 
-                fig_line = px.line(
-                    agg_df,
-                    x=x_col,
-                    y=numeric_cols,
-                    title=f"Tren Data {sheet_name} per {x_label}",
-                    markers=True,
-                    height=500
-                )
-                fig_line.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig_line, use_container_width=True)
+                show_figure(f"Tampilkan tren per {x_label.lower()}", 'line', data_key, options, build_line, lazy)
     else:
         st.warning("Tidak ada kolom numerik untuk divisualisasikan")
 
-def create_special_visualizations(pivot_df, sheet_name, show_by_desa=False):
+def create_special_visualizations(pivot_df, sheet_name, show_by_desa=False, data_key=None, lazy=True):
     """Create special visualizations based on sheet type"""
     # Tentukan label untuk x-axis berdasarkan tampilan
     x_label = 'Desa' if show_by_desa else 'Kecamatan'
+    if data_key is None:
+        data_key = compute_frame_fingerprint(pivot_df)
+    options = (sheet_name, show_by_desa)
     
     if 'AKTA' in sheet_name.upper():
         # Skip the percentage bar chart specifically for AKTA 0 SD 17 sheets
@@ -166,10 +337,12 @@ def create_special_visualizations(pivot_df, sheet_name, show_by_desa=False):
             belum_cols = [col for col in pivot_df.columns if 'BELUM MEMILIKI' in str(col)]
             
             if memiliki_cols and belum_cols:
-                try:
-                    ratio_df = pd.DataFrame()
-                    ratio_df['% Memiliki'] = pivot_df[memiliki_cols].sum(axis=1) / (pivot_df[memiliki_cols].sum(axis=1) + pivot_df[belum_cols].sum(axis=1)) * 100
-                    ratio_df['% Belum Memiliki'] = 100 - ratio_df['% Memiliki']
+                def build_ownership():
+                    ownership_df = pd.DataFrame({
+                        '% Memiliki': pivot_df[memiliki_cols].sum(axis=1),
+                        '% Belum Memiliki': pivot_df[belum_cols].sum(axis=1)
+                    })
+                    ratio_df = share_frame(ownership_df, 'row')
                     
                     fig_ratio = px.bar(
                         ratio_df.reset_index(),
@@ -180,52 +353,50 @@ def create_special_visualizations(pivot_df, sheet_name, show_by_desa=False):
                         height=500
                     )
                     fig_ratio.update_layout(xaxis_tickangle=-45)
-                    st.plotly_chart(fig_ratio, use_container_width=True)
-                except Exception as e:
-                    st.warning(f"Tidak dapat membuat visualisasi persentase: {str(e)}")
+                    return fig_ratio
+                
+                show_figure("Tampilkan persentase kepemilikan akta", 'akta_ownership', data_key, options, build_ownership, lazy,
+                            error_message="Tidak dapat membuat visualisasi persentase")
                 
     elif 'KK KAWIN' in sheet_name.upper() or 'PERKAWINAN' in sheet_name.upper():
         # Special visualization for KK KAWIN or PERKAWINAN
-        try:
-            if any('KAWIN' in str(col) for col in pivot_df.columns):
-                # Group columns by marital status
-                status_groups = {
-                    'BELUM KAWIN': [col for col in pivot_df.columns if 'BELUM KAWIN' in str(col)],
-                    'KAWIN': [col for col in pivot_df.columns if ' KAWIN' in str(col) and 'BELUM' not in str(col)],
-                    'CERAI HIDUP': [col for col in pivot_df.columns if 'CERAI HIDUP' in str(col)],
-                    'CERAI MATI': [col for col in pivot_df.columns if 'CERAI MATI' in str(col)]
-                }
-                
-                # Calculate totals for each status group
-                status_totals = {}
-                for status, cols in status_groups.items():
-                    if cols:
-                        status_totals[status] = pivot_df[cols].sum(axis=1)
-                
-                if status_totals:
-                    ratio_df = pd.DataFrame(status_totals)
-                    row_totals = ratio_df.sum(axis=1)
-                    
-                    # Calculate percentages
-                    for col in ratio_df.columns:
-                        ratio_df[f'% {col}'] = (ratio_df[col] / row_totals * 100).round(2)
+        if any('KAWIN' in str(col) for col in pivot_df.columns):
+            # Group columns by marital status
+            status_groups = {
+                'BELUM KAWIN': [col for col in pivot_df.columns if 'BELUM KAWIN' in str(col)],
+                'KAWIN': [col for col in pivot_df.columns if ' KAWIN' in str(col) and 'BELUM' not in str(col)],
+                'CERAI HIDUP': [col for col in pivot_df.columns if 'CERAI HIDUP' in str(col)],
+                'CERAI MATI': [col for col in pivot_df.columns if 'CERAI MATI' in str(col)]
+            }
+            
+            status_groups = {status: cols for status, cols in status_groups.items() if cols}
+            
+            if status_groups:
+                def build_marital_status():
+                    # Total tiap status dalam satu perkalian matriks, lalu porsi per baris
+                    positions = [[pivot_df.columns.get_loc(col) for col in cols] for cols in status_groups.values()]
+                    values = np.nan_to_num(pivot_df.to_numpy(dtype='float64'))
+                    status_totals = values @ membership_matrix(len(pivot_df.columns), positions)
                     
-                    # Keep only percentage columns for visualization
-                    pct_cols = [col for col in ratio_df.columns if col.startswith('%')]
+                    pct_cols = [f'% {status}' for status in status_groups]
+                    ratio_df = pd.DataFrame(
+                        np.round(share_of_total(status_totals, 'row'), 2),
+                        index=pivot_df.index, columns=pct_cols
+                    )
                     
-                    if pct_cols:
-                        fig_pct = px.bar(
-                            ratio_df.reset_index(),
-                            x=pivot_df.index.name,  # This will be either 'KECAMATAN' or 'DESA'
-                            y=pct_cols,
-                            title=f"Distribusi Status Perkawinan per {x_label} (%)",
-                            barmode='stack',
-                            height=500
-                        )
-                        fig_pct.update_layout(xaxis_tickangle=-45)
-                        st.plotly_chart(fig_pct, use_container_width=True)
-        except Exception as e:
-            st.warning(f"Tidak dapat membuat visualisasi status perkawinan: {str(e)}")
+                    fig_pct = px.bar(
+                        ratio_df.reset_index(),
+                        x=pivot_df.index.name,  # This will be either 'KECAMATAN' or 'DESA'
+                        y=pct_cols,
+                        title=f"Distribusi Status Perkawinan per {x_label} (%)",
+                        barmode='stack',
+                        height=500
+                    )
+                    fig_pct.update_layout(xaxis_tickangle=-45)
+                    return fig_pct
+                
+                show_figure("Tampilkan distribusi status perkawinan", 'marital_status', data_key, options, build_marital_status, lazy,
+                            error_message="Tidak dapat membuat visualisasi status perkawinan")
             
     # Visualisasi untuk kartu keluarga jika relevan
     elif ('KARTU KELUARGA' in sheet_name.upper() or 'KK' in sheet_name.upper()) and 'KAWIN' not in sheet_name.upper():
@@ -234,22 +405,116 @@ def create_special_visualizations(pivot_df, sheet_name, show_by_desa=False):
             'PR (JML KEP. KELUARGA)' in pivot_df.columns and
             'JUMLAH (JML KEP. KELUARGA)' in pivot_df.columns):
             
-            # Hitung persentase kepala keluarga laki-laki dan perempuan
-            ratio_df = pd.DataFrame()
-            ratio_df['% KK Laki-laki'] = pivot_df['LK (JML KEP. KELUARGA)'] / pivot_df['JUMLAH (JML KEP. KELUARGA)'] * 100
-            ratio_df['% KK Perempuan'] = pivot_df['PR (JML KEP. KELUARGA)'] / pivot_df['JUMLAH (JML KEP. KELUARGA)'] * 100
+            def build_kk_gender():
+                # Hitung persentase kepala keluarga laki-laki dan perempuan
+                ratio_df = pd.DataFrame()
+                ratio_df['% KK Laki-laki'] = pivot_df['LK (JML KEP. KELUARGA)'] / pivot_df['JUMLAH (JML KEP. KELUARGA)'] * 100
+                ratio_df['% KK Perempuan'] = pivot_df['PR (JML KEP. KELUARGA)'] / pivot_df['JUMLAH (JML KEP. KELUARGA)'] * 100
+                
+                # Visualisasi persentase
+                fig_ratio = px.bar(
+                    ratio_df.reset_index(),
+                    x=pivot_df.index.name,  # This will be either 'KECAMATAN' or 'DESA'
+                    y=['% KK Laki-laki', '% KK Perempuan'],
+                    title=f"Persentase Kepala Keluarga Berdasarkan Gender per {x_label}",
+                    barmode='stack',
+                    height=500
+                )
+                fig_ratio.update_layout(xaxis_tickangle=-45)
+                return fig_ratio
             
-            # Visualisasi persentase
-            fig_ratio = px.bar(
-                ratio_df.reset_index(),
-                x=pivot_df.index.name,  # This will be either 'KECAMATAN' or 'DESA'
-                y=['% KK Laki-laki', '% KK Perempuan'],
-                title=f"Persentase Kepala Keluarga Berdasarkan Gender per {x_label}",
-                barmode='stack',
-                height=500
-            )
-            fig_ratio.update_layout(xaxis_tickangle=-45)
-            st.plotly_chart(fig_ratio, use_container_width=True)
+            show_figure("Tampilkan persentase kepala keluarga per gender", 'kk_gender', data_key, options, build_kk_gender, lazy,
+                        error_message="Tidak dapat membuat visualisasi kepala keluarga")
+
+@st.cache_resource(max_entries=1, show_spinner="Memuat database semester...")
+def get_synced_semester_store(data_signature):
+    """Sync the analytical store once per state of the data directory (see get_data_directory_signature)"""
+    store = get_semester_store()
+    store.sync()
+    return store
+
+def create_semester_trend(filtered_df, sheet_name, cube=None):
+    """Create a cross-semester trend of the filtered columns from the analytical store"""
+    numeric_cols = list(filtered_df.select_dtypes(include=NUMERIC_DTYPES).columns)
+    if not numeric_cols or 'KECAMATAN' not in filtered_df.columns:
+        return
+    
+    store = get_synced_semester_store(get_data_directory_signature())
+    
+    # Batasi ke kecamatan/desa yang sedang difilter
+    kecamatan = [str(k) for k in filtered_df['KECAMATAN'].dropna().unique()]
+    desa = [str(d) for d in filtered_df['DESA'].dropna().unique()] if 'DESA' in filtered_df.columns else None
+    if desa is not None and lookup_sheet_cube(cube, filtered_df, 'KECAMATAN', numeric_cols) is not None:
+        # Seluruh desa kecamatan terpilih: total dibaca dari kubus kecamatan
+        desa = None
+    trend_df = store.semester_totals(sheet_name, numeric_cols, kecamatan, desa)
+    
+    # Tren hanya bermakna bila lembar ini ada di lebih dari satu semester
+    if len(trend_df) < 2:
+        return
+    
+    fig_trend = px.line(
+        trend_df.reset_index(),
+        x='SEMESTER',
+        y=numeric_cols,
+        title=f"Tren Antar Semester - {sheet_name}",
+        markers=True,
+        height=500
+    )
+    st.plotly_chart(fig_trend, use_container_width=True)
+
+# ============= PEMANASAN DATA =============
+
+@st.cache_resource
+def get_sheet_warmer():
+    """Create the sheet warmer and start ingesting new or changed workbooks, once per server process.
+
+    Mengembalikan (warmer, pesan galat); galat disimpan agar setiap sesi bisa
+    menampilkannya tanpa mengulang sinkronisasi direktori data.
+    """
+    warmer = SheetWarmer()
+    try:
+        # Hanya membaca manifest dan stat file; workbook yang tidak berubah dilewati
+        changed_files = sync_data_directory()
+        if changed_files:
+            warmer.start(changed_files)
+    except Exception as e:
+        return warmer, str(e)
+    return warmer, None
+
+def start_sheet_warmer():
+    """Get the process-wide sheet warmer and report it if warming could not start"""
+    warmer, error = get_sheet_warmer()
+    if error:
+        # Jika process pool tidak tersedia, lembar tetap dimuat saat dibuka
+        st.sidebar.warning(f"Pemanasan data gagal dimulai: {error}. Lembar akan dimuat saat dibuka.")
+    return warmer
+
+def render_warmup_progress(warmer):
+    """Show sheet warm-up progress in the sidebar while it is running"""
+    done, total = warmer.progress()
+    if total and done < total:
+        st.sidebar.progress(done / total, text=f"Menyiapkan data: {done}/{total} lembar")
+
+def ingest_uploaded_file(uploaded_file, available_files):
+    """Hand an uploaded file to the background ingest pipeline once per upload"""
+    # Hash isi file hanya dihitung sekali per unggahan, bukan setiap rerun
+    upload_jobs = st.session_state.setdefault("upload_jobs", {})
+    if uploaded_file.file_id not in upload_jobs:
+        upload_jobs[uploaded_file.file_id] = submit_uploaded_workbook(
+            uploaded_file.getvalue(),
+            uploaded_file.name,
+            [get_data_file_path(f) for f in available_files]
+        )
+    return upload_jobs[uploaded_file.file_id]
+
+def render_upload_progress(upload_job):
+    """Show ingest progress of an uploaded file in the sidebar"""
+    done, total = upload_job.progress()
+    if total and done < total:
+        st.sidebar.progress(done / total, text=f"Memproses file unggahan: {done}/{total} lembar")
+    for sheet_name, error in upload_job.failed:
+        st.sidebar.warning(f"Lembar {sheet_name} gagal diproses: {error}")
 
 # ============= WELCOME PAGE =============
 
@@ -926,58 +1191,223 @@ def render_perkawinan_filters(filter_data):
         
         return filter_data['get_filtered_df']([selected_kecamatan], selected_status, selected_desa)
 
+# Jenis lembar -> (pembuat filter di backend, tampilan filter di sidebar)
+SHEET_FILTER_HANDLERS = {
+    'akta': (MadiunDataVisualizer.add_akta_filters, render_akta_filters),
+    'ktp': (MadiunDataVisualizer.add_ktp_filters, render_ktp_filters),
+    'agama': (MadiunDataVisualizer.add_agama_filters, render_agama_filters),
+    'kia': (MadiunDataVisualizer.add_kia_filters, render_kia_filters),
+    'kartu_keluarga': (MadiunDataVisualizer.add_kartu_keluarga_filters, render_kartu_keluarga_filters),
+    'penduduk': (MadiunDataVisualizer.add_penduduk_filters, render_penduduk_filters),
+    'pendidikan': (MadiunDataVisualizer.add_pendidikan_filters, render_pendidikan_filters),
+    'pekerjaan': (MadiunDataVisualizer.add_pekerjaan_filters, render_pekerjaan_filters),
+    'perkawinan': (MadiunDataVisualizer.add_perkawinan_filters, render_perkawinan_filters),
+    'kelompok_umur': (MadiunDataVisualizer.add_kelompok_umur_filters, render_kelompok_umur_filters)
+}
+
+def create_3d_bar_series(values, y_pos, kecamatan_labels, col, file_name, color):
+    """One file/column series of the 3D comparison: all bars as one Mesh3d, plus their outline and top markers"""
+    value_labels = [str(value) for value in values]
+    values = np.asarray(values)
+    n_bars = len(values)
+    x = np.arange(n_bars)
+    zeros = np.zeros(n_bars, dtype=values.dtype)
+    y_left = np.full(n_bars, y_pos)
+    y_right = y_left + 0.8
+    name = f'{col} - {file_name}'
+    # Teks hover sama seperti sebelumnya: "<kecamatan> - <kolom>: <nilai> (<file>)"; hanya nama
+    # kecamatan dan nilai yang dikirim per titik, sisanya ada sekali di template
+    hovertemplate = f'%{{text}} - {col}: %{{customdata}} ({file_name})<extra></extra>'
+    
+    # Setiap batang adalah persegi panjang di bidang x = indeks kecamatan:
+    # 4 titik (bawah kiri, atas kiri, atas kanan, bawah kanan) dan 2 segitiga
+    corners = np.arange(n_bars) * 4
+    bars = go.Mesh3d(
+        x=np.repeat(x, 4),
+        y=np.column_stack([y_left, y_left, y_right, y_right]).ravel(),
+        z=np.column_stack([zeros, values, values, zeros]).ravel(),
+        i=np.repeat(corners, 2),
+        j=np.column_stack([corners + 1, corners + 2]).ravel(),
+        k=np.column_stack([corners + 2, corners + 3]).ravel(),
+        color=color,
+        opacity=1,
+        flatshading=True,
+        # Warna rata seperti isian surfaceaxis, tanpa bayangan cahaya
+        lighting=dict(ambient=1, diffuse=0, specular=0, roughness=1, fresnel=0),
+        name=name,
+        legendgroup=name,
+        showlegend=True,
+        text=np.repeat(kecamatan_labels, 4),
+        customdata=np.repeat(value_labels, 4),
+        hovertemplate=hovertemplate
+    )
+    
+    # Garis tepi semua batang dalam satu trace; None memutus garis antar batang
+    gap = [None] * n_bars
+    outline = go.Scatter3d(
+        x=np.column_stack([x, x, x, x, x, gap]).ravel(),
+        y=np.column_stack([y_left, y_left, y_right, y_right, y_left, gap]).ravel(),
+        z=np.column_stack([zeros, values, values, zeros, zeros, gap]).ravel(),
+        mode='lines',
+        line=dict(color=color, width=4),
+        legendgroup=name,
+        showlegend=False,
+        hoverinfo='skip'
+    )
+    
+    # Penanda di puncak batang agar lebih mudah terlihat
+    tops = go.Scatter3d(
+        x=x,
+        y=y_left + 0.4,
+        z=values,
+        mode='markers',
+        marker=dict(size=4, color=color),
+        legendgroup=name,
+        showlegend=False,
+        text=kecamatan_labels,
+        customdata=value_labels,
+        hovertemplate=hovertemplate
+    )
+    return [bars, outline, tops]
+
+def create_3d_comparison_figure(merged_df, selected_cols, file1, file2, sheet_name):
+    """Build the 3D bar comparison of two files: three traces per file/column series"""
+    fig_3d = go.Figure()
+    kecamatan_labels = merged_df.index.tolist()
+    
+    for col_idx, col in enumerate(selected_cols):
+        # Use different positions for each file
+        for file_idx, (file_name, color) in enumerate([(file1, '#1f77b4'), (file2, '#ff7f0e')]):
+            fig_3d.add_traces(create_3d_bar_series(
+                merged_df[f'{col} ({file_name})'].tolist(),
+                col_idx * 2 + file_idx,
+                kecamatan_labels,
+                col,
+                file_name,
+                color
+            ))
+    
+    # Update layout
+    fig_3d.update_layout(
+        title=f'Perbandingan Data 3D {sheet_name}',
+        scene=dict(
+            xaxis_title='Kecamatan',
+            yaxis_title='Kategori',
+            zaxis_title='Jumlah',
+            xaxis=dict(
+                ticktext=merged_df.index.tolist(),
+                tickvals=list(range(len(merged_df.index)))
+            ),
+            yaxis=dict(
+                ticktext=[f"{col}" for col in selected_cols],
+                tickvals=[col_idx * 2 + 0.5 for col_idx in range(len(selected_cols))]
+            ),
+            aspectratio=dict(x=1.5, y=1, z=1)
+        ),
+        height=700,
+        margin=dict(l=0, r=0, b=0, t=40),
+        legend=dict(
+            title=dict(text="Dataset"),
+            itemsizing="constant",
+            x=0.9,
+            y=0.9
+        )
+    )
+    
+    # Add camera views
+    fig_3d.update_layout(
+        updatemenus=[dict(
+            type='buttons',
+            showactive=False,
+            buttons=[
+                dict(
+                    label="Tampilan Depan",
+                    method="relayout",
+                    args=["scene.camera", dict(
+                        up=dict(x=0, y=0, z=1),
+                        center=dict(x=0, y=0, z=0),
+                        eye=dict(x=0, y=-2.5, z=0)
+                    )]
+                ),
+                dict(
+                    label="Tampilan Atas",
+                    method="relayout",
+                    args=["scene.camera", dict(
+                        up=dict(x=0, y=1, z=0),
+                        center=dict(x=0, y=0, z=0),
+                        eye=dict(x=0, y=0, z=2.5)
+                    )]
+                ),
+                dict(
+                    label="Tampilan Samping",
+                    method="relayout",
+                    args=["scene.camera", dict(
+                        up=dict(x=0, y=0, z=1),
+                        center=dict(x=0, y=0, z=0),
+                        eye=dict(x=2.5, y=0, z=0)
+                    )]
+                ),
+                dict(
+                    label="Tampilan Isometrik",
+                    method="relayout",
+                    args=["scene.camera", dict(
+                        up=dict(x=0, y=0, z=1),
+                        center=dict(x=0, y=0, z=0),
+                        eye=dict(x=1.5, y=1.5, z=1.5)
+                    )]
+                ),
+            ],
+            direction="down",
+            pad={"r": 10, "t": 10},
+            x=0.9,
+            y=0.05,
+            xanchor="right",
+            yanchor="bottom"
+        )]
+    )
+    
+    return fig_3d
+
 def compare_files_page():
     """Halaman perbandingan data antar file"""
     st.header("Perbandingan Data Antar File")
     
-    # Dapatkan file yang tersedia
-    available_files = get_available_files()
+    # Semester baru atau yang berubah dimuat sekali per isi direktori data
+    store = get_synced_semester_store(get_data_directory_signature())
+    
+    # Semester dari database, urut kronologis (file di direktori data = semester di database)
+    semester_labels = dict(store.list_semesters())
+    available_files = list(semester_labels)
     
     if len(available_files) < 2:
         st.warning("Tidak cukup file untuk dibandingkan. Harap unggah minimal 2 file Excel.")
         return
     
+    def format_semester(semester):
+        return f"{semester_labels[semester]} ({semester})"
+    
     # Pilih file untuk perbandingan
     col1, col2 = st.columns(2)
     
     with col1:
-        file1 = st.selectbox("Pilih File Pertama", available_files)
+        file1 = st.selectbox("Pilih File Pertama", available_files, format_func=format_semester)
     
     with col2:
         file2 = st.selectbox("Pilih File Kedua", 
                            [f for f in available_files if f != file1], 
-                           index=0 if len(available_files) > 1 else None)
+                           index=0 if len(available_files) > 1 else None,
+                           format_func=format_semester)
     
-    # Dapatkan path lengkap file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    file1_path = os.path.join(current_dir, file1)
-    file2_path = os.path.join(current_dir, file2)
     
-    # Ambil nama lembar dari kedua file
-    xls1 = pd.ExcelFile(file1_path)
-    xls2 = pd.ExcelFile(file2_path)
-    
-    # Pilih lembar untuk perbandingan
+    # Pilih lembar yang ada di kedua file
     sheet_name = st.selectbox(
         "Pilih Lembar untuk Dibandingkan", 
-        sorted(set(xls1.sheet_names) & set(xls2.sheet_names))
+        store.common_sheets([file1, file2])
     )
     
     if sheet_name:
-        # Baca data dari kedua file
-        df1 = pd.read_excel(file1_path, sheet_name=sheet_name)
-        df2 = pd.read_excel(file2_path, sheet_name=sheet_name)
-        
-        # Konversi nama kolom ke string untuk konsistensi
-        df1.columns = [str(col) for col in df1.columns]
-        df2.columns = [str(col) for col in df2.columns]
-        
-        # Pilih kolom numerik untuk perbandingan
-        numeric_cols1 = df1.select_dtypes(include=['float64', 'int64']).columns
-        numeric_cols2 = df2.select_dtypes(include=['float64', 'int64']).columns
-        
-        # Temukan kolom yang sama di kedua file
-        common_numeric_cols = sorted(set(numeric_cols1) & set(numeric_cols2))
+        # Temukan kolom numerik yang sama di kedua file
+        common_numeric_cols = store.common_indicators(sheet_name, [file1, file2])
         
         if not common_numeric_cols:
             st.warning("Tidak ada kolom numerik yang sama untuk dibandingkan.")
@@ -991,25 +1421,8 @@ def compare_files_page():
         )
         
         if selected_cols:
-            # Gabungkan data dengan kolom yang dipilih
-            # Pastikan 'KECAMATAN' adalah kolom utama
-            if 'KECAMATAN' in df1.columns and 'KECAMATAN' in df2.columns:
-                # Merge data berdasarkan kecamatan
-                merged_df = pd.merge(
-                    df1[['KECAMATAN'] + list(selected_cols)].groupby('KECAMATAN').sum(), 
-                    df2[['KECAMATAN'] + list(selected_cols)].groupby('KECAMATAN').sum(), 
-                    left_index=True, 
-                    right_index=True, 
-                    suffixes=(f' ({file1})', f' ({file2})')
-                )
-            else:
-                # Jika tidak ada kolom kecamatan, gunakan agregasi global
-                merged_df = pd.DataFrame({
-                    f'{col} ({file1})': [df1[col].sum()] for col in selected_cols
-                })
-                merged_df.update(pd.DataFrame({
-                    f'{col} ({file2})': [df2[col].sum()] for col in selected_cols
-                }))
+            # Agregasi per kecamatan untuk kedua file dihitung dengan SQL
+            merged_df = store.compare_semesters(sheet_name, file1, file2, selected_cols)
             
             # Tampilkan tabel perbandingan
             st.subheader("Tabel Perbandingan")
@@ -1027,169 +1440,7 @@ def compare_files_page():
             # Visualisasi perbandingan
             st.subheader("Visualisasi Perbandingan 3D")
             
-            # Create 3D bar chart using Scatter3d traces
-            fig_3d = go.Figure()
-            
-            # Define grid for our visualization
-            x_vals = list(range(len(merged_df.index)))
-            
-            # Create 3D visualization for file1 and file2
-            for col_idx, col in enumerate(selected_cols):
-                col1_name = f'{col} ({file1})'
-                col2_name = f'{col} ({file2})'
-                
-                # Use different positions for each file
-                y_pos1 = col_idx * 2
-                y_pos2 = col_idx * 2 + 1
-                
-                # Add data for file1
-                for kec_idx, kecamatan in enumerate(merged_df.index):
-                    value = merged_df.loc[kecamatan, col1_name]
-                    fig_3d.add_trace(
-                        go.Scatter3d(
-                            x=[kec_idx, kec_idx, kec_idx, kec_idx, kec_idx],
-                            y=[y_pos1, y_pos1, y_pos1+0.8, y_pos1+0.8, y_pos1],
-                            z=[0, value, value, 0, 0],
-                            mode='lines',
-                            line=dict(color='#1f77b4', width=4),
-                            surfaceaxis=0,
-                            name=f'{col} - {file1}' if kec_idx == 0 else None,
-                            showlegend=True if kec_idx == 0 else False,
-                            hoverinfo='text',
-                            hovertext=f'{kecamatan} - {col}: {value} ({file1})'
-                        )
-                    )
-                    
-                    # Add a marker at the top of the bar for better visibility
-                    fig_3d.add_trace(
-                        go.Scatter3d(
-                            x=[kec_idx],
-                            y=[y_pos1+0.4],
-                            z=[value],
-                            mode='markers',
-                            marker=dict(
-                                size=4,
-                                color='#1f77b4',
-                            ),
-                            showlegend=False,
-                            hoverinfo='text',
-                            hovertext=f'{kecamatan} - {col}: {value} ({file1})'
-                        )
-                    )
-                
-                # Add data for file2
-                for kec_idx, kecamatan in enumerate(merged_df.index):
-                    value = merged_df.loc[kecamatan, col2_name]
-                    fig_3d.add_trace(
-                        go.Scatter3d(
-                            x=[kec_idx, kec_idx, kec_idx, kec_idx, kec_idx],
-                            y=[y_pos2, y_pos2, y_pos2+0.8, y_pos2+0.8, y_pos2],
-                            z=[0, value, value, 0, 0],
-                            mode='lines',
-                            line=dict(color='#ff7f0e', width=4),
-                            surfaceaxis=0,
-                            name=f'{col} - {file2}' if kec_idx == 0 else None,
-                            showlegend=True if kec_idx == 0 else False,
-                            hoverinfo='text',
-                            hovertext=f'{kecamatan} - {col}: {value} ({file2})'
-                        )
-                    )
-                    
-                    # Add a marker at the top of the bar for better visibility
-                    fig_3d.add_trace(
-                        go.Scatter3d(
-                            x=[kec_idx],
-                            y=[y_pos2+0.4],
-                            z=[value],
-                            mode='markers',
-                            marker=dict(
-                                size=4,
-                                color='#ff7f0e',
-                            ),
-                            showlegend=False,
-                            hoverinfo='text',
-                            hovertext=f'{kecamatan} - {col}: {value} ({file2})'
-                        )
-                    )
-            
-            # Update layout
-            fig_3d.update_layout(
-                title=f'Perbandingan Data 3D {sheet_name}',
-                scene=dict(
-                    xaxis_title='Kecamatan',
-                    yaxis_title='Kategori',
-                    zaxis_title='Jumlah',
-                    xaxis=dict(
-                        ticktext=merged_df.index.tolist(),
-                        tickvals=list(range(len(merged_df.index)))
-                    ),
-                    yaxis=dict(
-                        ticktext=[f"{col}" for col in selected_cols],
-                        tickvals=[col_idx * 2 + 0.5 for col_idx in range(len(selected_cols))]
-                    ),
-                    aspectratio=dict(x=1.5, y=1, z=1)
-                ),
-                height=700,
-                margin=dict(l=0, r=0, b=0, t=40),
-                legend=dict(
-                    title=dict(text="Dataset"),
-                    itemsizing="constant",
-                    x=0.9,
-                    y=0.9
-                )
-            )
-            
-            # Add camera views
-            fig_3d.update_layout(
-                updatemenus=[dict(
-                    type='buttons',
-                    showactive=False,
-                    buttons=[
-                        dict(
-                            label="Tampilan Depan",
-                            method="relayout",
-                            args=["scene.camera", dict(
-                                up=dict(x=0, y=0, z=1),
-                                center=dict(x=0, y=0, z=0),
-                                eye=dict(x=0, y=-2.5, z=0)
-                            )]
-                        ),
-                        dict(
-                            label="Tampilan Atas",
-                            method="relayout",
-                            args=["scene.camera", dict(
-                                up=dict(x=0, y=1, z=0),
-                                center=dict(x=0, y=0, z=0),
-                                eye=dict(x=0, y=0, z=2.5)
-                            )]
-                        ),
-                        dict(
-                            label="Tampilan Samping",
-                            method="relayout",
-                            args=["scene.camera", dict(
-                                up=dict(x=0, y=0, z=1),
-                                center=dict(x=0, y=0, z=0),
-                                eye=dict(x=2.5, y=0, z=0)
-                            )]
-                        ),
-                        dict(
-                            label="Tampilan Isometrik",
-                            method="relayout",
-                            args=["scene.camera", dict(
-                                up=dict(x=0, y=0, z=1),
-                                center=dict(x=0, y=0, z=0),
-                                eye=dict(x=1.5, y=1.5, z=1.5)
-                            )]
-                        ),
-                    ],
-                    direction="down",
-                    pad={"r": 10, "t": 10},
-                    x=0.9,
-                    y=0.05,
-                    xanchor="right",
-                    yanchor="bottom"
-                )]
-            )
+            fig_3d = create_3d_comparison_figure(merged_df, selected_cols, file1, file2, sheet_name)
             
             # Tampilkan grafik
             st.plotly_chart(fig_3d, use_container_width=True)
@@ -1200,21 +1451,8 @@ def compare_files_page():
             # Hitung dan tampilkan perubahan persentase
             st.subheader("Analisis Perubahan")
             
-            # Tabel persentase perubahan
-            change_df = pd.DataFrame(index=merged_df.index)
-            
-            for col in selected_cols:
-                col1_name = f'{col} ({file1})'
-                col2_name = f'{col} ({file2})'
-                
-                # Hitung persentase perubahan (dengan penanganan division by zero)
-                change_col = f'% Perubahan {col}'
-                # Hindari division by zero dengan memeriksa nilai nol
-                change_df[change_col] = merged_df.apply(
-                    lambda row: ((row[col2_name] - row[col1_name]) / row[col1_name] * 100).round(2) 
-                    if row[col1_name] != 0 else float('nan'), 
-                    axis=1
-                )
+            # Perubahan absolut, persentase dan porsi semua kolom sekaligus
+            change_df = compute_changes(merged_df, selected_cols, file1, file2)
             
             # Tampilkan tabel perubahan
             st.dataframe(change_df, use_container_width=True)
@@ -1245,6 +1483,32 @@ def compare_files_page():
                 )
                 
                 st.plotly_chart(fig_change, use_container_width=True)
+            
+            # Rincian perubahan per desa, porsi dihitung terhadap total kecamatannya
+            if store.has_desa(sheet_name, [file1, file2]):
+                with st.expander("Rincian Perubahan per Desa"):
+                    desa_df = store.compare_semesters(sheet_name, file1, file2, selected_cols, level='DESA')
+                    desa_change_df = compute_changes(desa_df, selected_cols, file1, file2, share_within='KECAMATAN')
+                    
+                    kecamatan_options = ['SEMUA KECAMATAN'] + list(desa_change_df.index.unique(level='KECAMATAN'))
+                    selected_kecamatan = st.selectbox("Pilih Kecamatan", kecamatan_options, key="compare_desa_kecamatan")
+                    if selected_kecamatan != 'SEMUA KECAMATAN':
+                        desa_change_df = desa_change_df.xs(selected_kecamatan, level='KECAMATAN', drop_level=False)
+                    
+                    st.dataframe(desa_change_df, use_container_width=True)
+
+def describe_filter_view(key):
+    """Readable label of a filter result cache key: sheet, kecamatan, desa and selected parameters"""
+    content_key, sheet_type, _, kecamatan, desa, params = key
+    # Kunci isi berupa (hash workbook, nama lembar) untuk lembar dari load_sheet, selain itu hash isi
+    sheet = content_key[1] if isinstance(content_key, tuple) else sheet_type
+    parts = [str(sheet), 'Semua Kecamatan' if kecamatan == 'ALL' else str(kecamatan)]
+    if desa:
+        parts.append(f"{len(desa)} desa")
+    for param in params:
+        values = param if isinstance(param, tuple) else (param,)
+        parts.append(", ".join(str(value) for value in values[:3]) + (" ..." if len(values) > 3 else ""))
+    return " | ".join(parts)
 
 # ============= MAIN FUNCTION =============
 
@@ -1281,6 +1545,9 @@ def main():
     # Apply the custom theme
     set_custom_theme()
     
+    # Mulai memanaskan cache data sejak pengunjung pertama membuka aplikasi
+    warmer = start_sheet_warmer()
+    
     # Initialize session state for login
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
@@ -1299,6 +1566,9 @@ def main():
     # Add user profile section in sidebar
     user_profile_section()
     
+    # Tampilkan progres pemanasan data jika masih berjalan
+    render_warmup_progress(warmer)
+    
     st.title("DINAS KEPENDUDUKAN DAN PENCATATAN SIPIL KAB.MADIUN")
     
     # PERUBAHAN: Menggunakan menu yang telah ditingkatkan
@@ -1316,35 +1586,39 @@ def main():
     # File selection radio button (only show if there are available files)
     file_path = None
     
-    if uploaded_file:
-        file_path = uploaded_file
-        st.sidebar.success(f"Menggunakan file yang diunggah: {uploaded_file.name}")
-    elif available_files:
-        file_selection = st.sidebar.radio(
-            "Pilih File Data:",
-            options=["Unggah File Baru"] + available_files,
-            index=1 if available_files else 0
-        )
+    try:
+        # File unggahan yang rusak dilaporkan lewat st.error di bawah
+        if uploaded_file:
+            upload_job = ingest_uploaded_file(uploaded_file, available_files)
+            file_path = upload_job.file_path
+            if upload_job.duplicate_of:
+                st.sidebar.success(f"File yang diunggah sama dengan {upload_job.duplicate_of}, menggunakan data yang sudah tersedia")
+            else:
+                st.sidebar.success(f"Menggunakan file yang diunggah: {uploaded_file.name}")
+            render_upload_progress(upload_job)
+        elif available_files:
+            file_selection = st.sidebar.radio(
+                "Pilih File Data:",
+                options=["Unggah File Baru"] + available_files,
+                index=1 if available_files else 0
+            )
         
-        if file_selection == "Unggah File Baru":
-            st.sidebar.info("Silakan unggah file Excel di bagian atas sidebar")
-            if not uploaded_file:
-                # If no file is uploaded, use the first available file as default
-                if available_files:
-                    current_dir = os.path.dirname(os.path.abspath(__file__))
-                    file_path = os.path.join(current_dir, available_files[0])
-                    st.sidebar.info(f"Menggunakan file default: {available_files[0]}")
+            if file_selection == "Unggah File Baru":
+                st.sidebar.info("Silakan unggah file Excel di bagian atas sidebar")
+                if not uploaded_file:
+                    # If no file is uploaded, use the first available file as default
+                    if available_files:
+                        file_path = get_data_file_path(available_files[0])
+                        st.sidebar.info(f"Menggunakan file default: {available_files[0]}")
+            else:
+                file_path = get_data_file_path(file_selection)
+                st.sidebar.success(f"Menggunakan file: {file_selection}")
         else:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            file_path = os.path.join(current_dir, file_selection)
-            st.sidebar.success(f"Menggunakan file: {file_selection}")
-    else:
-        st.error("Tidak ada file data ditemukan. Silakan unggah file Excel.")
-        return
+            st.error("Tidak ada file data ditemukan. Silakan unggah file Excel.")
+            return
     
-    try:
         visualizer = MadiunDataVisualizer(file_path)
-        sheet_names = visualizer.xls.sheet_names
+        sheet_names = visualizer.sheet_names
       
         # PERUBAHAN: Kode untuk setiap tab telah dikonversi ke bagian if-elif
         
@@ -1361,7 +1635,7 @@ def main():
                 st.error(f"Lembar {selected_sheet} tidak ditemukan dalam file")
                 return
             
-            df = pd.read_excel(file_path, sheet_name=selected_sheet)
+            df = visualizer.load_sheet(selected_sheet)
             
             # Tampilkan data mentah terlebih dahulu
             st.subheader(f"Data Mentah - {selected_sheet}")
@@ -1376,42 +1650,12 @@ def main():
             filtered_df = None
             
             with filter_section:
-                # Apply appropriate filter based on sheet name
-                if any(akta_keyword in selected_sheet.upper() for akta_keyword in ['AKTA', 'AKTA 0', 'AKTA 0 SD 17']):
-                    filter_data = visualizer.add_akta_filters(df)
-                    filtered_df = render_akta_filters(filter_data)
-                elif 'KTP' in selected_sheet.upper():
-                    filter_data = visualizer.add_ktp_filters(df)
-                    filtered_df = render_ktp_filters(filter_data)
-                elif 'AGAMA' in selected_sheet.upper():
-                    filter_data = visualizer.add_agama_filters(df)
-                    filtered_df = render_agama_filters(filter_data)
-                elif 'KIA' in selected_sheet.upper():
-                    filter_data = visualizer.add_kia_filters(df)
-                    filtered_df = render_kia_filters(filter_data)
-                elif any(kk_keyword in selected_sheet.upper() for kk_keyword in ['KARTU KELUARGA', 'KK']):
-                    # Make sure it's actually KK data and not KK KAWIN data
-                    if 'KAWIN' not in selected_sheet.upper():
-                        filter_data = visualizer.add_kartu_keluarga_filters(df)
-                        filtered_df = render_kartu_keluarga_filters(filter_data)
-                    else:  # This is for KK KAWIN sheets
-                        filter_data = visualizer.add_perkawinan_filters(df)
-                        filtered_df = render_perkawinan_filters(filter_data)
-                elif 'PENDUDUK' in selected_sheet.upper():
-                    filter_data = visualizer.add_penduduk_filters(df)
-                    filtered_df = render_penduduk_filters(filter_data)
-                elif 'PENDIDIKAN' in selected_sheet.upper():
-                    filter_data = visualizer.add_pendidikan_filters(df)
-                    filtered_df = render_pendidikan_filters(filter_data)
-                elif 'PEKERJAAN' in selected_sheet.upper():
-                    filter_data = visualizer.add_pekerjaan_filters(df)
-                    filtered_df = render_pekerjaan_filters(filter_data)
-                elif any(kawin_keyword in selected_sheet.upper() for kawin_keyword in ['PERKAWINAN', 'KAWIN']):
-                    filter_data = visualizer.add_perkawinan_filters(df)
-                    filtered_df = render_perkawinan_filters(filter_data)
-                elif any(umur_keyword in selected_sheet.upper() for umur_keyword in ['KEL UMUR', 'KELOMPOK UMUR', 'UMUR']):
-                    filter_data = visualizer.add_kelompok_umur_filters(df)
-                    filtered_df = render_kelompok_umur_filters(filter_data)
+                # Pilih filter berdasarkan jenis lembar yang diklasifikasi saat ingest
+                sheet_type = visualizer.get_sheet_profile(selected_sheet)['sheet_type']
+                if sheet_type in SHEET_FILTER_HANDLERS:
+                    add_filters, render_filters = SHEET_FILTER_HANDLERS[sheet_type]
+                    filter_data = add_filters(visualizer, df)
+                    filtered_df = render_filters(filter_data)
                 else:
                     st.warning(f"Tidak ada filter khusus untuk lembar {selected_sheet}")
                     filtered_df = df
@@ -1426,7 +1670,14 @@ def main():
                 st.dataframe(filtered_df, use_container_width=True)
                 
                 # Create visualizations
-                create_visualizations(filtered_df, selected_sheet)
+                cube = visualizer.load_sheet_cube(selected_sheet)
+                create_visualizations(filtered_df, selected_sheet, cube,
+                                      load_matrix=partial(visualizer.load_sheet_matrix, selected_sheet))
+                
+                # Bandingkan dengan semester lain dari database analitik; file unggahan
+                # bukan bagian dari database, jadi tidak dibandingkan hanya lewat nama lembar
+                if not uploaded_file:
+                    create_semester_trend(filtered_df, selected_sheet, cube)
         
         elif active_tab == "compare":
             # Konten untuk perbandingan antar file (tab2)
@@ -1438,7 +1689,7 @@ def main():
             # Karena kita tidak lagi di dalam tab, kita perlu membuat variable filtered_df
             # Sebagai contoh, kita akan menggunakan lembar pertama
             selected_sheet = sheet_names[0]
-            df = pd.read_excel(file_path, sheet_name=selected_sheet)
+            df = visualizer.load_sheet(selected_sheet)
             df.columns = [str(col) for col in df.columns]
             filtered_df = df  # Gunakan df mentah jika tidak ada filter khusus
             
@@ -1480,17 +1731,52 @@ def main():
                 st.subheader("Metadata File")
                 
                 file_name = ""
-                if isinstance(file_path, str):
-                    file_name = os.path.basename(file_path)
-                else:
+                if uploaded_file:
                     file_name = uploaded_file.name
+                else:
+                    file_name = os.path.basename(file_path)
                     
+                sheet_info = visualizer.metadata['sheets']
                 metadata = {
                     "Nama File": file_name,
                     "Jumlah Lembar": len(sheet_names),
-                    "Daftar Lembar": ", ".join(sheet_names)
+                    "Daftar Lembar": ", ".join(sheet_names),
+                    "Ukuran Lembar": {
+                        name: f"{sheet_info[name]['n_rows']} baris x {sheet_info[name]['n_cols']} kolom"
+                        for name in sheet_names
+                    }
                 }
                 
+                # Laporan penghematan memori dari normalisasi tipe data saat ingest
+                memory_info = {}
+                for name in sheet_names:
+                    report = get_sheet_dtype_report(visualizer.file_hash, name)
+                    if report:
+                        memory_info[name] = (
+                            f"{report['bytes_before'] / 1024:.1f} KB -> {report['bytes_after'] / 1024:.1f} KB "
+                            f"(hemat {report['bytes_saved'] / max(report['bytes_before'], 1) * 100:.0f}%)"
+                        )
+                if memory_info:
+                    metadata["Penghematan Memori"] = memory_info
+                
+                # Efektivitas cache hasil filter (dibagi semua sesi)
+                cache_stats = get_filter_result_cache().stats()
+                metadata["Cache Filter"] = (
+                    f"{cache_stats['hits']} hit / {cache_stats['misses']} miss "
+                    f"({cache_stats['hit_rate'] * 100:.0f}%), {cache_stats['sheets']} hasil tersimpan"
+                )
+                top_views = get_filter_result_cache().top_views(5)
+                if top_views:
+                    metadata["Filter Paling Sering Dipakai Ulang"] = [
+                        f"{describe_filter_view(key)} ({hits} hit)" for key, hits in top_views
+                    ]
+                figure_stats = get_figure_cache().stats()
+                metadata["Cache Grafik"] = (
+                    f"{figure_stats['hits']} hit / {figure_stats['misses']} miss "
+                    f"({figure_stats['hit_rate'] * 100:.0f}%), {figure_stats['sheets']} grafik, "
+                    f"{figure_stats['bytes'] / 1024:.0f} KB"
+                )
+                
                 st.json(metadata)
                 
                 # Tampilkan informasi perbandingan jika ada dua file yang tersedia
@@ -1,10 +1,30 @@
 import pandas as pd
+import numpy as np
 import os
+import re
 import hashlib
 import json
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache, partial
 from PIL import Image
 
+from sheet_kernel import SheetMatrix
+
+# Versi skema cache; naikkan jika format hasil ingest berubah agar cache lama diabaikan
+CACHE_SCHEMA_VERSION = 3
+
+# Batas memori registry lembar bersama (MB), bisa diatur lewat environment
+REGISTRY_MAX_MB = int(os.environ.get("MADIUN_REGISTRY_MAX_MB", "256"))
+
+# Batas memori cache hasil filter (MB), dibagi semua sesi
+FILTER_CACHE_MAX_MB = int(os.environ.get("MADIUN_FILTER_CACHE_MAX_MB", "64"))
+
+# Batas memori cache spesifikasi grafik (MB), dibagi semua sesi
+FIGURE_CACHE_MAX_MB = int(os.environ.get("MADIUN_FIGURE_CACHE_MAX_MB", "32"))
+
 # ============= FUNGSI UTILITAS =============
 
 def load_config():
@@ -47,603 +67,1970 @@ def get_logo_path():
     # Return None if no logo file is found
     return None
 
+# ============= CACHE DATA KOLOMNAR =============
+
+# Hash file yang sudah dihitung, dikunci dengan (path, mtime, ukuran) agar tidak hash ulang tiap rerun
+_file_hash_memo = {}
+
+def get_cache_dir():
+    """Get the directory where parsed sheets are stored as Parquet files"""
+    cache_dir = os.environ.get("MADIUN_CACHE_DIR")
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def compute_file_hash(source):
+    """Compute the SHA-256 content hash of a workbook path or uploaded file"""
+    # File yang diunggah (UploadedFile/BytesIO) di-hash langsung dari isinya
+    if hasattr(source, "getvalue"):
+        return hashlib.sha256(source.getvalue()).hexdigest()
+
+    stat = os.stat(source)
+    memo_key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+    if memo_key in _file_hash_memo:
+        return _file_hash_memo[memo_key]
+
+    sha = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    _file_hash_memo[memo_key] = sha.hexdigest()
+    return _file_hash_memo[memo_key]
+
+def get_workbook_cache_dir(file_hash, create=True):
+    """Get the cache directory of one workbook version (content hash + schema version)"""
+    workbook_dir = os.path.join(get_cache_dir(), f"{file_hash[:20]}-v{CACHE_SCHEMA_VERSION}")
+    if create:
+        os.makedirs(workbook_dir, exist_ok=True)
+    return workbook_dir
+
+def get_sheet_cache_path(file_hash, sheet_name):
+    """Get the Parquet path for one sheet of a cached workbook"""
+    # Nama lembar bisa mengandung spasi di akhir atau karakter khusus, jadi
+    # gabungkan slug yang mudah dibaca dengan hash pendek nama aslinya
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', sheet_name).strip('_') or "sheet"
+    name_hash = hashlib.md5(sheet_name.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(get_workbook_cache_dir(file_hash), f"{slug}-{name_hash}.parquet")
+
+def get_sheet_report_path(file_hash, sheet_name):
+    """Get the path of the dtype normalisation report stored next to a sheet's Parquet file"""
+    return get_sheet_cache_path(file_hash, sheet_name)[:-len(".parquet")] + ".dtypes.json"
+
+def get_sheet_cube_path(file_hash, sheet_name):
+    """Get the Parquet path of the pre-aggregated cube stored next to a sheet's Parquet file"""
+    return get_sheet_cache_path(file_hash, sheet_name)[:-len(".parquet")] + ".cube.parquet"
+
+def _write_atomic(path, write_func):
+    """Write a cache file through a temporary file so readers never see partial data"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write_func(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ============= KLASIFIKASI LEMBAR =============
+
+# Urutan aturan sama dengan rantai if/elif lama: aturan pertama yang cocok menang
+SHEET_TYPE_RULES = [
+    ('akta', ['AKTA', 'AKTA 0', 'AKTA 0 SD 17'], []),
+    ('ktp', ['KTP'], []),
+    ('agama', ['AGAMA'], []),
+    ('kia', ['KIA'], []),
+    ('kartu_keluarga', ['KARTU KELUARGA', 'KK'], ['KAWIN']),
+    # Lembar KK yang mengandung KAWIN (mis. KK KAWIN) adalah data perkawinan
+    ('perkawinan', ['KARTU KELUARGA', 'KK'], []),
+    ('penduduk', ['PENDUDUK'], []),
+    ('pendidikan', ['PENDIDIKAN'], []),
+    ('pekerjaan', ['PEKERJAAN'], []),
+    ('perkawinan', ['PERKAWINAN', 'KAWIN'], []),
+    ('kelompok_umur', ['KEL UMUR', 'KELOMPOK UMUR', 'UMUR'], [])
+]
+
+LOCATION_COLUMNS = ['KECAMATAN', 'DESA']
+
+# Semua tipe numerik yang bisa dihasilkan normalisasi ingest; pakai ini untuk
+# select_dtypes menggantikan ['float64', 'int64']
+NUMERIC_DTYPES = [
+    'float64', 'int64', 'float32', 'int32', 'int16', 'int8',
+    'uint64', 'uint32', 'uint16', 'uint8'
+]
+
+# Kata kunci sektor pekerjaan; kolom yang tidak cocok masuk LAINNYA
+PEKERJAAN_SECTOR_KEYWORDS = OrderedDict([
+    ('PERTANIAN', ['TANI', 'NELAYAN', 'TERNAK']),
+    ('PENDIDIKAN', ['GURU', 'DOSEN', 'PENDIDIK']),
+    ('KESEHATAN', ['DOKTER', 'PERAWAT', 'BIDAN']),
+    ('PERDAGANGAN', ['DAGANG', 'JUAL', 'WIRASWASTA']),
+    ('INDUSTRI', ['BURUH', 'KARYAWAN', 'PEGAWAI'])
+])
+
+# Kategori kelompok umur bila kolom umur lebih dari 10: (umur bawah, umur atas), None = tanpa batas.
+# Kolom masuk kategori bila rentang umurnya ("LK (5-9)", "JML (>75)") berada di dalam batas ini
+UMUR_CATEGORY_BOUNDS = OrderedDict([
+    ('Balita (0-4 tahun)', (0, 4)),
+    ('Anak-anak (5-14 tahun)', (5, 14)),
+    ('Remaja (15-24 tahun)', (15, 24)),
+    ('Dewasa Muda (25-34 tahun)', (25, 34)),
+    ('Dewasa (35-54 tahun)', (35, 54)),
+    ('Lansia (55+ tahun)', (55, None))
+])
+
+# Aturan pengelompokan kolom yang dikompilasi sekali per header:
+# ('keywords', {grup: kata kunci}, abaikan_huruf, grup_sisa) | ('age_bounds', {grup: (bawah, atas)})
+COLUMN_GROUP_RULES = {
+    'pekerjaan_sector': ('keywords', PEKERJAAN_SECTOR_KEYWORDS, True, 'LAINNYA'),
+    'umur_category': ('age_bounds', UMUR_CATEGORY_BOUNDS)
+}
+
+# Awalan kolom subtotal (JML = LK + PR); dilewati saat kolom dijumlahkan per grup
+TOTAL_COLUMN_PREFIXES = ('JML', 'JUMLAH', 'TOTAL')
+
+# Rentang umur di nama kolom: "0-4", "5 - 9", ">75", "75+"
+_AGE_BAND_PATTERN = re.compile(r'(\d+)\s*-\s*(\d+)|>\s*=?\s*(\d+)|(\d+)\s*\+')
+
+@lru_cache(maxsize=256)
+def classify_sheet_type(sheet_name):
+    """Map a sheet name to its type ('akta', 'ktp', ...), or None if no filter applies"""
+    name = sheet_name.upper()
+    for sheet_type, keywords, excluded in SHEET_TYPE_RULES:
+        if any(keyword in name for keyword in keywords) and not any(word in name for word in excluded):
+            return sheet_type
+    return None
+
+@lru_cache(maxsize=256)
+def detect_sheet_variant(sheet_type, columns):
+    """Detect the column layout variant of a sheet type from its (tuple of) column names"""
+    upper_cols = [str(col).upper() for col in columns]
+    if sheet_type == 'akta':
+        # Format semester 1 (per usia) diperiksa lebih dulu, seperti sebelumnya
+        if any('(0-5 TAHUN)' in col for col in upper_cols):
+            return 'age_format'
+        if any('LK (MEMILIKI)' in col for col in upper_cols):
+            return 'gender_format'
+        return 'unknown_format'
+    if sheet_type == 'perkawinan':
+        if any(str(col).startswith(('LK', 'PR', 'JML')) for col in columns):
+            return 'gender_breakdown'
+        return 'no_gender_breakdown'
+    return 'default'
+
+# ---------- Kelompok kolom terkompilasi ----------
+
+@lru_cache(maxsize=None)
+def _compile_group_rule(rule_name):
+    """Compile one COLUMN_GROUP_RULES entry into per-group matchers"""
+    rule = COLUMN_GROUP_RULES[rule_name]
+    if rule[0] == 'keywords':
+        _, groups, ignore_case, _ = rule
+        flags = re.IGNORECASE if ignore_case else 0
+        # Satu regex per grup menggantikan any(keyword in col) untuk tiap kata kunci
+        return [
+            (name, re.compile('|'.join(re.escape(keyword) for keyword in keywords), flags).search)
+            for name, keywords in groups.items()
+        ]
+    if rule[0] == 'age_bounds':
+        def bounds_matcher(lower, upper):
+            def match(band):
+                if band is None or band[0] < lower:
+                    return False
+                return upper is None or (band[1] is not None and band[1] <= upper)
+            return match
+        return [(name, bounds_matcher(lower, upper)) for name, (lower, upper) in rule[1].items()]
+    raise ValueError(f"Jenis aturan kelompok tidak dikenal: {rule[0]}")
+
+def parse_age_band(column):
+    """Parse the age range of a column name as (lower, upper), upper None for open ranges; None if absent"""
+    match = _AGE_BAND_PATTERN.search(str(column))
+    if not match:
+        return None
+    if match.group(1) is not None:
+        return int(match.group(1)), int(match.group(2))
+    return int(match.group(3) or match.group(4)), None
+
+@lru_cache(maxsize=4096)
+def classify_column_groups(rule_name, column):
+    """List the groups of one rule a column belongs to, in rule order (or the rule's remainder group)"""
+    rule = COLUMN_GROUP_RULES[rule_name]
+    subject = parse_age_band(column) if rule[0] == 'age_bounds' else column
+    groups = tuple(name for name, match in _compile_group_rule(rule_name) if match(subject))
+    if not groups and rule[0] == 'keywords' and rule[3]:
+        groups = (rule[3],)
+    return groups
+
+class ColumnGroups:
+    """Grouping of one header under one rule, compiled once.
+
+    groups: grup -> tuple nama kolom, positions: grup -> array posisi kolom di
+    header. Sebuah kolom bisa masuk lebih dari satu grup; grup tanpa kolom tetap
+    dicantumkan.
+    """
+
+    def __init__(self, rule_name, columns):
+        rule = COLUMN_GROUP_RULES[rule_name]
+        groups = OrderedDict((name, []) for name, _ in _compile_group_rule(rule_name))
+        if rule[0] == 'keywords' and rule[3]:
+            groups[rule[3]] = []
+        positions = OrderedDict((name, []) for name in groups)
+        for position, col in enumerate(columns):
+            for name in classify_column_groups(rule_name, col):
+                groups[name].append(col)
+                positions[name].append(position)
+        self.rule_name = rule_name
+        self.columns = tuple(columns)
+        self.groups = OrderedDict((name, tuple(cols)) for name, cols in groups.items())
+        self.positions = OrderedDict(
+            (name, np.array(group_positions, dtype=np.intp)) for name, group_positions in positions.items()
+        )
+
+@lru_cache(maxsize=64)
+def compile_column_groups(rule_name, columns):
+    """Group a header (tuple of column names) under one COLUMN_GROUP_RULES entry, as a ColumnGroups"""
+    return ColumnGroups(rule_name, columns)
+
+def classify_sheet(sheet_name, columns):
+    """Fingerprint a sheet header once: sheet type and format variant"""
+    columns = tuple(str(col) for col in columns)
+    sheet_type = classify_sheet_type(sheet_name)
+    variant = detect_sheet_variant(sheet_type, columns)
+    fingerprint = hashlib.md5(json.dumps([sheet_name, columns]).encode("utf-8")).hexdigest()
+    return {
+        'sheet_type': sheet_type,
+        'variant': variant,
+        'fingerprint': fingerprint
+    }
+
+# ============= METADATA WORKBOOK =============
+
+# Metadata yang sudah dibaca, dikunci dengan hash isi workbook
+_workbook_metadata_memo = {}
+
+def _xml_local_name(tag):
+    """Strip the XML namespace from an element tag"""
+    return tag.rsplit('}', 1)[-1]
+
+def _xml_attr(element, name):
+    """Get an attribute by local name, ignoring its namespace"""
+    for key, value in element.attrib.items():
+        if _xml_local_name(key) == name:
+            return value
+    return None
+
+def _parse_cell_range(ref):
+    """Parse 'A1:W207' into (first column, first row, last column, last row), 1-based"""
+    def parse_cell(cell):
+        match = re.match(r'\$?([A-Z]+)\$?(\d+)', cell)
+        letters, row = match.groups()
+        col = 0
+        for letter in letters:
+            col = col * 26 + (ord(letter) - ord('A') + 1)
+        return col, int(row)
+
+    parts = ref.split(':')
+    first_col, first_row = parse_cell(parts[0])
+    last_col, last_row = parse_cell(parts[-1])
+    return first_col, first_row, last_col, last_row
+
+def _dedup_header(header):
+    """Name blank and duplicate header cells like pandas ('Unnamed: 3', 'X.1')"""
+    names = [f"Unnamed: {i}" if value == "" else value for i, value in enumerate(header)]
+    counts = {}
+    for i, name in enumerate(names):
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+def _read_header_row(zf, sheet_path, shared_strings_loader):
+    """Stream a sheet's XML only until its first row; returns (dimension ref, header values)"""
+    import xml.etree.ElementTree as ET
+
+    dimension = None
+    header = {}
+    with zf.open(sheet_path) as f:
+        for event, element in ET.iterparse(f, events=('end',)):
+            name = _xml_local_name(element.tag)
+            if name == 'dimension':
+                dimension = element.get('ref')
+            elif name == 'c':
+                ref = element.get('r')
+                cell_type = element.get('t')
+                value = None
+                for child in element.iter():
+                    child_name = _xml_local_name(child.tag)
+                    if child_name in ('v', 't') and child.text is not None:
+                        value = (value or "") + child.text if child_name == 't' else child.text
+                if value is not None:
+                    if cell_type == 's':
+                        value = shared_strings_loader()[int(value)]
+                    elif cell_type not in ('str', 'inlineStr', 'b', 'e'):
+                        number = float(value)
+                        value = int(number) if number.is_integer() else number
+                    col = _parse_cell_range(ref)[0] if ref else len(header) + 1
+                    header[col] = value
+            elif name == 'row':
+                # Hanya baris pertama (header) yang dibutuhkan
+                break
+
+    values = [header.get(col, "") for col in range(1, max(header, default=0) + 1)]
+    return dimension, [str(name) for name in _dedup_header(values)]
+
+def read_workbook_metadata(source, file_hash=None):
+    """Read sheet names, dimensions and header rows without parsing any sheet data.
+
+    Hanya membaca xl/workbook.xml (termasuk rentang _FilterDatabase), relasi
+    lembar, dan baris pertama tiap lembar dari arsip zip. Hasil di-cache per
+    hash isi file, di memori dan di direktori cache.
+    """
+    import zipfile
+    import posixpath
+    import xml.etree.ElementTree as ET
+
+    file_hash = file_hash or compute_file_hash(source)
+    if file_hash in _workbook_metadata_memo:
+        return _workbook_metadata_memo[file_hash]
+
+    # Direktori cache baru dibuat setelah arsip terbaca: unggahan rusak tidak meninggalkan direktori kosong
+    metadata_path = os.path.join(get_workbook_cache_dir(file_hash, create=False), "metadata.json")
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+        _workbook_metadata_memo[file_hash] = metadata
+        return metadata
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    with zipfile.ZipFile(source) as zf:
+        workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+
+        rel_targets = {}
+        for rel in rels:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                target = target.lstrip('/')
+            else:
+                target = posixpath.normpath(posixpath.join('xl', target))
+            rel_targets[rel.get('Id')] = target
+
+        sheets = []
+        filter_ranges = {}
+        for element in workbook.iter():
+            name = _xml_local_name(element.tag)
+            if name == 'sheet':
+                sheets.append((element.get('name'), rel_targets.get(_xml_attr(element, 'id'))))
+            elif name == 'definedName' and element.get('name') == '_xlnm._FilterDatabase':
+                # Format: 'DATA AGAMA'!$A$1:$W$207
+                filter_ranges[int(element.get('localSheetId'))] = element.text.rsplit('!', 1)[-1]
+
+        shared_strings = []
+
+        def load_shared_strings():
+            if not shared_strings and 'xl/sharedStrings.xml' in zf.namelist():
+                root = ET.fromstring(zf.read('xl/sharedStrings.xml'))
+                for item in root:
+                    shared_strings.append("".join(
+                        t.text or "" for t in item.iter() if _xml_local_name(t.tag) == 't'
+                    ))
+            return shared_strings
+
+        metadata = {'sheet_names': [name for name, _ in sheets], 'sheets': {}}
+        for index, (sheet_name, sheet_path) in enumerate(sheets):
+            dimension, header = None, []
+            if sheet_path and sheet_path in zf.namelist():
+                dimension, header = _read_header_row(zf, sheet_path, load_shared_strings)
+
+            filter_range = filter_ranges.get(index)
+            extent = filter_range or dimension
+            n_rows = n_cols = None
+            if extent:
+                first_col, first_row, last_col, last_row = _parse_cell_range(extent)
+                n_rows = last_row - first_row  # tanpa baris header
+                n_cols = last_col - first_col + 1
+
+            metadata['sheets'][sheet_name] = {
+                'dimension': dimension,
+                'filter_range': filter_range,
+                'n_rows': n_rows,
+                'n_cols': n_cols,
+                'header': header,
+                'profile': classify_sheet(sheet_name, header)
+            }
+
+    def write_metadata(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f)
+
+    get_workbook_cache_dir(file_hash)
+    _write_atomic(metadata_path, write_metadata)
+    _workbook_metadata_memo[file_hash] = metadata
+    return metadata
+
+def get_sheet_names(source, file_hash=None):
+    """Get sheet names of a workbook from its metadata (no sheet is parsed)"""
+    return read_workbook_metadata(source, file_hash)['sheet_names']
+
+def get_sheet_profile(source, sheet_name, file_hash=None):
+    """Get the stored classification of one sheet (see classify_sheet)"""
+    return read_workbook_metadata(source, file_hash)['sheets'][sheet_name]['profile']
+
+# ============= NORMALISASI TIPE DATA =============
+
+def _smallest_unsigned_dtype(max_value):
+    for dtype in ['uint8', 'uint16', 'uint32']:
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return 'uint64'
+
+def normalize_sheet_dtypes(df):
+    """Convert a parsed sheet to compact dtypes and report what changed.
+
+    KECAMATAN/DESA menjadi categorical. Kolom hitungan (bilangan bulat tidak
+    negatif) diturunkan ke unsigned int terkecil yang muat; sel kosong pada
+    kolom hitungan diisi 0 dan jumlahnya dicatat di laporan. Kolom pecahan
+    (mis. persentase) dan kolom dengan nilai negatif tetap seperti semula.
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    df = df.copy()
+    filled_blanks = {}
+    blank_locations = {}
+
+    for col in df.columns:
+        series = df[col]
+        if col in LOCATION_COLUMNS:
+            if series.dtype == object:
+                blanks = int(series.isna().sum())
+                if blanks:
+                    blank_locations[col] = blanks
+                df[col] = series.astype('category')
+            continue
+
+        if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+
+        values = series.dropna()
+        if values.empty or (values < 0).any():
+            continue
+        if pd.api.types.is_float_dtype(series) and not (values % 1 == 0).all():
+            continue
+
+        blanks = len(series) - len(values)
+        if blanks:
+            filled_blanks[col] = blanks
+            series = series.fillna(0)
+        df[col] = series.astype(_smallest_unsigned_dtype(values.max()))
+
+    bytes_after = int(df.memory_usage(deep=True).sum())
+    report = {
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'bytes_saved': bytes_before - bytes_after,
+        'filled_blanks': filled_blanks,
+        'blank_locations': blank_locations
+    }
+    return df, report
+
+def get_sheet_dtype_report(file_hash, sheet_name):
+    """Load the normalisation report written when the sheet was ingested, or None"""
+    report_path = get_sheet_report_path(file_hash, sheet_name)
+    if not os.path.exists(report_path):
+        return None
+    try:
+        with open(report_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def ingest_sheet(source, sheet_name, file_hash=None):
+    """Parse one sheet from Excel, normalise its dtypes and store it in the Parquet cache"""
+    file_hash = file_hash or compute_file_hash(source)
+    cache_path = get_sheet_cache_path(file_hash, sheet_name)
+
+    df = pd.read_excel(source, sheet_name=sheet_name)
+    # Parquet hanya menerima nama kolom string
+    df.columns = [str(col) for col in df.columns]
+    df, report = normalize_sheet_dtypes(df)
+
+    def write_report(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    _write_atomic(get_sheet_report_path(file_hash, sheet_name), write_report)
+    _write_atomic(cache_path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+    write_sheet_cube(file_hash, sheet_name, build_sheet_cube(df))
+    return df
+
+def _load_sheet_from_disk(source, sheet_name, file_hash):
+    """Read one sheet from its Parquet file, ingesting it from Excel if missing"""
+    cache_path = get_sheet_cache_path(file_hash, sheet_name)
+
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            # File cache rusak: parse ulang dari Excel
+            pass
+
+    return ingest_sheet(source, sheet_name, file_hash)
+
+def load_sheet(source, sheet_name, file_hash=None):
+    """Load one sheet through the shared registry and the Parquet cache"""
+    file_hash = file_hash or compute_file_hash(source)
+    df = get_sheet_registry().get_or_load(
+        (file_hash, sheet_name),
+        lambda: _load_sheet_from_disk(source, sheet_name, file_hash)
+    )
+    # DataFrame di registry dipakai bersama semua sesi; salinan dangkal mencegah
+    # perubahan struktur (ganti nama kolom, tambah kolom) bocor ke sesi lain
+    return df.copy(deep=False)
+
+# ============= KUBUS AGREGASI =============
+
+# Kolom penanda di kubus; diawali '_' agar tidak bentrok dengan kolom lembar
+CUBE_LEVEL_COLUMN = '_LEVEL'
+CUBE_ROWS_COLUMN = '_ROWS'
+CUBE_LEVELS = ['DESA', 'KECAMATAN', 'KABUPATEN']
+
+def get_cube_indicators(df):
+    """List the columns summed in the cube: every numeric, non-location column"""
+    return [
+        col for col in df.columns
+        if col not in LOCATION_COLUMNS
+        and pd.api.types.is_numeric_dtype(df[col])
+        and not pd.api.types.is_bool_dtype(df[col])
+    ]
+
+def build_sheet_cube(df):
+    """Pre-aggregate every numeric column of a sheet at desa, kecamatan and kabupaten level.
+
+    Satu baris per desa (bila ada kolom DESA), per kecamatan (bila ada kolom
+    KECAMATAN) dan satu baris total kabupaten ('ALL'). Kolom _ROWS mencatat
+    jumlah baris lembar di tiap kelompok, dipakai untuk memastikan hasil
+    filter mencakup seluruh wilayah sebelum kubus dipakai.
+    """
+    indicators = get_cube_indicators(df)
+
+    group_keys = []
+    if 'KECAMATAN' in df.columns:
+        group_keys = [['KECAMATAN', 'DESA'], ['KECAMATAN']] if 'DESA' in df.columns else [['KECAMATAN']]
+
+    levels = []
+    # Kunci kosong = total kabupaten: satu kelompok berisi semua baris
+    for keys in group_keys + [[]]:
+        level = keys[-1] if keys else 'KABUPATEN'
+        matrix = SheetMatrix(df, keys, indicators)
+        levels.append(matrix.to_frame(extra_columns={
+            CUBE_ROWS_COLUMN: matrix.row_counts(),
+            CUBE_LEVEL_COLUMN: level,
+        }))
+
+    cube = pd.concat(levels, ignore_index=True)
+    for col in LOCATION_COLUMNS:
+        if col in cube.columns:
+            # Lokasi disimpan sebagai teks biasa; level di atasnya berisi kosong
+            cube[col] = cube[col].astype(object)
+    cube = cube.astype({CUBE_ROWS_COLUMN: 'int64'})
+    location_columns = [col for col in LOCATION_COLUMNS if col in cube.columns]
+    return cube[[CUBE_LEVEL_COLUMN] + location_columns + [CUBE_ROWS_COLUMN] + indicators]
+
+def write_sheet_cube(file_hash, sheet_name, cube):
+    """Store the cube of one sheet next to its Parquet file"""
+    _write_atomic(get_sheet_cube_path(file_hash, sheet_name), lambda tmp_path: cube.to_parquet(tmp_path, index=False))
+
+def _load_cube_from_disk(source, sheet_name, file_hash):
+    """Read the cube of one sheet, building it from the sheet if the cache predates cubes"""
+    cube_path = get_sheet_cube_path(file_hash, sheet_name)
+    if os.path.exists(cube_path):
+        try:
+            return pd.read_parquet(cube_path)
+        except Exception:
+            # File kubus rusak: bangun ulang dari lembar
+            pass
+
+    cube = build_sheet_cube(load_sheet(source, sheet_name, file_hash))
+    write_sheet_cube(file_hash, sheet_name, cube)
+    return cube
+
+def load_sheet_cube(source, sheet_name, file_hash=None):
+    """Load the pre-aggregated cube of one sheet through the shared registry"""
+    file_hash = file_hash or compute_file_hash(source)
+    cube = get_sheet_registry().get_or_load(
+        (file_hash, sheet_name, 'cube'),
+        lambda: _load_cube_from_disk(source, sheet_name, file_hash)
+    )
+    return cube.copy(deep=False)
+
+def load_sheet_matrix(source, sheet_name, by, file_hash=None):
+    """Load the numeric columns of one sheet grouped by the `by` columns, through the shared registry"""
+    file_hash = file_hash or compute_file_hash(source)
+    by = tuple(by)
+
+    def build():
+        df = load_sheet(source, sheet_name, file_hash)
+        return SheetMatrix(df, list(by), get_cube_indicators(df))
+
+    return get_sheet_registry().get_or_load((file_hash, sheet_name, 'matrix', by), build)
+
+def select_sheet_matrix(filtered_df, by, columns, load_matrix=None):
+    """SheetMatrix of filtered_df, cut from the cached sheet matrix when possible.
+
+    load_matrix(by) mengembalikan matriks lembar asal filtered_df (lihat
+    MadiunDataVisualizer.load_sheet_matrix). Baris filtered_df harus baris lembar
+    itu dengan label posisinya (lembar Parquet ber-RangeIndex) dan kolomnya belum
+    diubah; selain itu matriks dibangun langsung dari filtered_df.
+    """
+    by = list(by)
+    columns = list(columns)
+    if load_matrix is not None and pd.api.types.is_integer_dtype(filtered_df.index):
+        matrix = load_matrix(tuple(by))
+        rows = filtered_df.index.to_numpy()
+        in_sheet = not len(rows) or (rows.min() >= 0 and rows.max() < matrix.n_rows)
+        if in_sheet and set(columns) <= set(matrix.columns):
+            # Lembar utuh tidak perlu dipotong barisnya
+            whole_sheet = isinstance(filtered_df.index, pd.RangeIndex) and len(rows) == matrix.n_rows
+            return matrix.select(None if whole_sheet else rows, columns)
+    return SheetMatrix(filtered_df, by, columns)
+
+def get_cube_level(cube, level):
+    """Rows of one cube level (DESA, KECAMATAN or KABUPATEN) without the marker column"""
+    level_df = cube[cube[CUBE_LEVEL_COLUMN] == level]
+    return level_df.drop(columns=CUBE_LEVEL_COLUMN).reset_index(drop=True)
+
+def lookup_sheet_cube(cube, filtered_df, by, columns):
+    """Read per-KECAMATAN or per-DESA sums of columns from the cube.
+
+    Hanya dipakai bila baris filtered_df mencakup seluruh baris tiap wilayah
+    yang tampil (jumlah baris sama dengan _ROWS di kubus) dan kolomnya belum
+    diubah. Untuk subset desa sembarang dikembalikan None sehingga pemanggil
+    menjumlah sendiri.
+    """
+    columns = list(columns)
+    if cube is None or by not in ('KECAMATAN', 'DESA') or by not in filtered_df.columns:
+        return None
+    if 'KECAMATAN' not in filtered_df.columns or not set(columns) <= set(cube.columns):
+        return None
+
+    # Hanya kolom penanda kubus yang disentuh sampai baris yang cocok diketahui
+    in_level = cube[CUBE_LEVEL_COLUMN].to_numpy() == by
+    if by == 'DESA':
+        # Nama desa bisa sama di kecamatan berbeda; kubus desa hanya dipakai untuk satu kecamatan
+        kecamatan = filtered_df['KECAMATAN'].dropna().unique()
+        if len(kecamatan) != 1:
+            return None
+        in_level &= cube['KECAMATAN'].to_numpy() == kecamatan[0]
+
+    counts = _location_counts(filtered_df[by])
+    rows = np.flatnonzero(in_level)
+    cube_keys = cube[by].to_numpy()[rows]
+    cube_rows = cube[CUBE_ROWS_COLUMN].to_numpy()[rows]
+    selected = [idx for idx, key in enumerate(cube_keys) if key in counts]
+    if len(selected) != len(counts):
+        return None
+    if any(cube_rows[idx] != counts[cube_keys[idx]] for idx in selected):
+        return None
+
+    agg_df = cube[[by] + columns].iloc[rows[selected]].reset_index(drop=True)
+    agg_df[by] = agg_df[by].astype(filtered_df[by].dtype)
+    return agg_df
+
+def _location_counts(series):
+    """Number of rows per location value (missing values are not counted)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        present = np.flatnonzero(counts)
+        return dict(zip(series.cat.categories[present], counts[present]))
+    value_counts = series.value_counts()
+    return dict(zip(value_counts.index, value_counts.to_numpy()))
+
+def aggregate_by_location(filtered_df, by, columns, cube=None, load_matrix=None):
+    """Sum columns per KECAMATAN or DESA, from the cube when the rows are whole areas, else from the sheet matrix"""
+    columns = list(columns)
+    agg_df = lookup_sheet_cube(cube, filtered_df, by, columns)
+    if agg_df is None:
+        agg_df = select_sheet_matrix(filtered_df, [by], columns, load_matrix).to_frame()
+    return agg_df
+
+def get_column_group_rule(sheet_type):
+    """Get (column set, COLUMN_GROUP_RULES name) of a sheet type's grouped filter option, or None"""
+    for option in FILTER_SPECS.get(sheet_type, {}).get('options', {}).values():
+        if option[0] == 'groups':
+            return option[1], option[2]
+    return None
+
+def select_column_groups(df, sheet_type):
+    """Columns of a frame grouped by its sheet type's rule: (columns, group names, position arrays) or None"""
+    rule = get_column_group_rule(sheet_type)
+    if rule is None:
+        return None
+    set_name, rule_name = rule
+    numeric = [col for col in get_cube_indicators(df) if not str(col).endswith('(%)')]
+    columns = _column_sets(numeric, numeric)[set_name]
+    # Subtotal JML sudah berisi LK + PR; ikut dijumlahkan berarti dihitung dua kali
+    if any(str(col).startswith(('LK', 'PR')) for col in columns):
+        columns = [col for col in columns if not str(col).startswith(TOTAL_COLUMN_PREFIXES)]
+    column_groups = compile_column_groups(rule_name, tuple(columns))
+    names = [name for name, positions in column_groups.positions.items() if len(positions)]
+    if not names:
+        return None
+    return columns, names, [column_groups.positions[name] for name in names]
+
+def aggregate_column_groups(filtered_df, by, sheet_type, load_matrix=None):
+    """Sum the columns of each sector/age category per KECAMATAN or DESA; None if the sheet has no groups"""
+    selected = select_column_groups(filtered_df, sheet_type)
+    if selected is None or by not in filtered_df.columns:
+        return None
+    columns, names, positions = selected
+    matrix = select_sheet_matrix(filtered_df, [by], columns, load_matrix)
+    # Posisi kolom grup sudah terkompilasi; jumlah semua grup satu reduksi
+    group_df = pd.DataFrame(matrix.sum(positions), index=matrix.labels[by].to_numpy(), columns=names)
+    group_df.index.name = by
+    return group_df
+
+class CubeSummaries:
+    """Summaries of some columns for every kecamatan selection, sliced from one projection of the cube.
+
+    Kunci: ('KECAMATAN', None) semua kecamatan, ('KECAMATAN', k) satu kecamatan,
+    ('DESA', k) desa-desa di kecamatan k. Baris tiap kunci dicari sekali;
+    DataFrame ringkasan baru dibentuk saat diminta.
+    """
+
+    def __init__(self, cube, columns, like_df):
+        self.columns = list(columns)
+        location_columns = [col for col in LOCATION_COLUMNS if col in cube.columns and col in like_df.columns]
+        self._projected = cube[[CUBE_LEVEL_COLUMN] + location_columns + self.columns]
+        # Kolom lokasi diubah sekali ke dtype lembar (mis. categorical), bukan per ringkasan
+        self._projected = self._projected.astype({col: like_df[col].dtype for col in location_columns})
+
+        levels = self._projected[CUBE_LEVEL_COLUMN].to_numpy()
+        kecamatan = self._projected['KECAMATAN'].to_numpy()
+        self._frames = {}
+        self._rows = {}
+        for level in ['KECAMATAN', 'DESA']:
+            level_rows = np.flatnonzero(levels == level)
+            if not len(level_rows) or level not in self._projected.columns:
+                continue
+            self._frames[level] = self._projected[[level] + self.columns].iloc[level_rows].reset_index(drop=True)
+            self._rows[(level, None)] = slice(None)
+            for key, rows in pd.Series(level_rows).groupby(kecamatan[level_rows], sort=False).indices.items():
+                # Baris satu kecamatan berurutan di kubus, jadi cukup sebuah slice
+                self._rows[(level, key)] = slice(rows[0], rows[-1] + 1)
+
+    def get(self, level, kecamatan=None):
+        """Summary frame for one level and kecamatan (None = all kecamatan), or None if absent"""
+        rows = self._rows.get((level, kecamatan))
+        if rows is None:
+            return None
+        return self._frames[level].iloc[rows].reset_index(drop=True)
+
+def split_cube_summaries(cube, columns, like_df):
+    """Slice the cube once for every kecamatan selection of columns; None if a column is not in the cube"""
+    columns = list(columns)
+    if cube is None or 'KECAMATAN' not in cube.columns or not set(columns) <= set(cube.columns):
+        return None
+    return CubeSummaries(cube, columns, like_df)
+
+def get_summary_level(filtered_df):
+    """Location level a filtered frame is summarised at: 'DESA' for several desa of one kecamatan, else 'KECAMATAN'"""
+    if ('DESA' in filtered_df.columns and filtered_df['DESA'].nunique(dropna=False) > 1
+            and filtered_df['KECAMATAN'].nunique() == 1):
+        return 'DESA'
+    return 'KECAMATAN'
+
+def summarize_filtered_df(filtered_df, cube=None, load_matrix=None):
+    """Sum the numeric columns of a filtered frame per kecamatan or desa, as the charts show it"""
+    numeric_cols = list(filtered_df.select_dtypes(include=NUMERIC_DTYPES).columns)
+    if not numeric_cols or 'KECAMATAN' not in filtered_df.columns:
+        return None
+    return aggregate_by_location(filtered_df, get_summary_level(filtered_df), numeric_cols, cube, load_matrix)
+
+# ============= REGISTRY LEMBAR BERSAMA =============
+
+class SheetRegistry:
+    """Process-wide LRU store of parsed sheets with a memory budget.
+
+    Semua sesi Streamlit berbagi satu instance, sehingga setiap lembar hanya
+    disimpan sekali per proses. Aman dipakai dari banyak thread skrip.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (df, nbytes)
+        self._loading = {}  # key -> Future untuk lembar yang sedang dimuat
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(df):
+        if isinstance(df, SheetMatrix):
+            return df.nbytes
+        # Sama dengan memory_usage(deep=True), tetapi kolom numerik dihitung dari dtype
+        # saja; menelusuri ratusan kolom satu per satu memperlambat setiap put
+        nbytes = int(df.index.memory_usage(deep=True))
+        deep_positions = []
+        for position, dtype in enumerate(df.dtypes):
+            if isinstance(dtype, np.dtype) and dtype != object:
+                nbytes += dtype.itemsize * len(df)
+            else:
+                deep_positions.append(position)
+        if deep_positions:
+            nbytes += int(df.iloc[:, deep_positions].memory_usage(index=False, deep=True).sum())
+        return nbytes
+
+    def get(self, key):
+        """Return a cached sheet and mark it as recently used, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        """Store a sheet and evict least-recently-used sheets above the budget"""
+        nbytes = self._sizeof(df)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        # Lembar yang baru dimasukkan tidak pernah dikeluarkan, meskipun melebihi batas sendirian
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def reserve(self, key):
+        """Mark a sheet as being loaded; returns a Future to complete, or None if not needed"""
+        with self._lock:
+            if key in self._entries or key in self._loading:
+                return None
+            future = Future()
+            self._loading[key] = future
+            return future
+
+    def complete(self, key, future, df=None, error=None):
+        """Finish a reservation made with reserve(), waking every thread waiting on it"""
+        if error is None:
+            self.put(key, df)
+        with self._lock:
+            self._loading.pop(key, None)
+        if error is None:
+            future.set_result(df)
+        else:
+            future.set_exception(error)
+
+    def get_or_load(self, key, loader):
+        """Return a cached sheet, or load it once even if many threads ask at the same time"""
+        # Percobaan kedua hanya terjadi jika pemuatan oleh thread/proses lain gagal
+        for attempt in range(2):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+
+                self.misses += 1
+                future = self._loading.get(key)
+                is_owner = future is None
+                if is_owner:
+                    future = Future()
+                    self._loading[key] = future
+
+            if not is_owner:
+                # Lembar yang sama sedang dimuat (oleh sesi lain atau pemanasan awal):
+                # tunggu hasil lembar itu saja
+                try:
+                    return future.result()
+                except Exception:
+                    if attempt == 0:
+                        continue
+                    raise
+
+            try:
+                df = loader()
+            except BaseException as e:
+                self.complete(key, future, error=e)
+                raise
+            self.complete(key, future, df)
+            return df
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return usage counters for display or logging"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sheets': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+_sheet_registry = SheetRegistry(REGISTRY_MAX_MB * 1024 * 1024)
+
+def get_sheet_registry():
+    """Get the process-wide sheet registry"""
+    return _sheet_registry
+
+# ============= PEMANASAN CACHE SAAT SERVER MULAI =============
+
+# Jumlah proses pemanasan; default mengikuti jumlah CPU (maksimal 4)
+WARMUP_WORKERS = int(os.environ.get("MADIUN_WARMUP_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+def _warm_sheet_worker(file_path, sheet_name, file_hash):
+    """Parse one sheet into the Parquet cache (runs in a worker process)"""
+    cache_path = get_sheet_cache_path(file_hash, sheet_name)
+    if not os.path.exists(cache_path):
+        ingest_sheet(file_path, sheet_name, file_hash)
+    return cache_path
+
+class SheetWarmer:
+    """Parse every sheet of the given workbooks in a process pool and publish them to the registry.
+
+    Halaman tidak pernah menunggu seluruh pemanasan selesai: load_sheet untuk
+    lembar yang masih diproses hanya menunggu lembar itu sendiri.
+    """
+
+    def __init__(self, max_workers=WARMUP_WORKERS):
+        self.max_workers = max_workers
+        self.total = 0
+        self.done = 0
+        self.failed = []
+        self._remaining = {}  # path workbook -> jumlah lembar yang belum selesai
+        self._failed_files = set()
+        self._started = set()  # (path, mtime_ns, size) yang sudah pernah dikirim
+        self._lock = threading.Lock()
+
+    def start(self, file_paths):
+        """Submit all sheets of all workbooks; returns immediately"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        registry = get_sheet_registry()
+        jobs = []
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            version = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                if version in self._started:
+                    continue
+                self._started.add(version)
+
+            file_hash = compute_file_hash(file_path)
+            file_jobs = []
+            for sheet_name in get_sheet_names(file_path, file_hash):
+                key = (file_hash, sheet_name)
+                registry_future = registry.reserve(key)
+                if registry_future is not None:
+                    file_jobs.append((file_path, sheet_name, file_hash, key, registry_future))
+
+            if file_jobs:
+                with self._lock:
+                    self._remaining[file_path] = self._remaining.get(file_path, 0) + len(file_jobs)
+                jobs.extend(file_jobs)
+            elif all(os.path.exists(get_sheet_cache_path(file_hash, name))
+                     for name in get_sheet_names(file_path, file_hash)):
+                update_manifest_entry(file_path, file_hash, ingested=True)
+
+        with self._lock:
+            self.total += len(jobs)
+        if not jobs:
+            return
+
+        # 'spawn' lebih aman daripada fork di dalam server Streamlit yang multi-thread
+        executor = ProcessPoolExecutor(
+            max_workers=min(self.max_workers, len(jobs)),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        for file_path, sheet_name, file_hash, key, registry_future in jobs:
+            process_future = executor.submit(_warm_sheet_worker, file_path, sheet_name, file_hash)
+            process_future.add_done_callback(partial(self._on_sheet_done, file_path, key, registry_future))
+        executor.shutdown(wait=False)
+
+    def _on_sheet_done(self, file_path, key, registry_future, process_future):
+        registry = get_sheet_registry()
+        error = None
+        try:
+            df = pd.read_parquet(process_future.result())
+        except Exception as e:
+            # Lembar yang gagal dipanaskan akan dimuat biasa saat dibuka
+            error = e
+            registry.complete(key, registry_future, error=e)
+        else:
+            registry.complete(key, registry_future, df)
+
+        with self._lock:
+            self.done += 1
+            if error is not None:
+                self.failed.append((key[1], str(error)))
+                self._failed_files.add(file_path)
+            self._remaining[file_path] -= 1
+            workbook_done = self._remaining[file_path] == 0 and file_path not in self._failed_files
+
+        if workbook_done:
+            # Semua lembar workbook ini sudah di cache: startup berikutnya cukup membaca manifest
+            update_manifest_entry(file_path, key[0], ingested=True)
+
+    @property
+    def finished(self):
+        with self._lock:
+            return self.done >= self.total
+
+    def progress(self):
+        """Return (sheets done, total sheets)"""
+        with self._lock:
+            return self.done, self.total
+
+# ============= INGEST FILE YANG DIUNGGAH =============
+
+class UploadIngestJob:
+    """State of one uploaded workbook being ingested in the background"""
+
+    def __init__(self, file_hash, file_path, name, duplicate_of=None):
+        self.file_hash = file_hash
+        self.file_path = file_path
+        self.name = name
+        self.duplicate_of = duplicate_of
+        self.total = 0
+        self.done = 0
+        self.failed = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        with self._lock:
+            return self.done >= self.total
+
+    def progress(self):
+        """Return (sheets done, total sheets)"""
+        with self._lock:
+            return self.done, self.total
+
+    def _mark_done(self, sheet_name=None, error=None):
+        with self._lock:
+            self.done += 1
+            if error is not None:
+                self.failed.append((sheet_name, str(error)))
+
+_upload_jobs = {}  # hash isi -> UploadIngestJob
+_upload_lock = threading.Lock()
+_upload_executor = None
+
+def get_upload_dir():
+    """Get the directory where uploaded workbooks are kept by content hash"""
+    upload_dir = os.path.join(get_cache_dir(), "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+def _run_upload_job(job, pending):
+    """Parse the pending sheets of an upload one by one (runs in a worker thread)"""
+    registry = get_sheet_registry()
+    for sheet_name, registry_future in pending:
+        key = (job.file_hash, sheet_name)
+        try:
+            df = ingest_sheet(job.file_path, sheet_name, job.file_hash)
+        except Exception as e:
+            registry.complete(key, registry_future, error=e)
+            job._mark_done(sheet_name, e)
+            continue
+        registry.complete(key, registry_future, df)
+        job._mark_done()
+
+def submit_uploaded_workbook(data, name, known_paths=()):
+    """Ingest uploaded workbook bytes in the background, once per distinct content.
+
+    File dengan isi yang sama (termasuk file bawaan di known_paths) tidak
+    di-parse ulang. Mengembalikan UploadIngestJob; job.file_path dapat langsung
+    dipakai oleh MadiunDataVisualizer, load_sheet pada lembar yang belum selesai
+    hanya menunggu lembar tersebut.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    global _upload_executor
+
+    import io
+
+    file_hash = hashlib.sha256(data).hexdigest()
+    with _upload_lock:
+        if file_hash in _upload_jobs:
+            return _upload_jobs[file_hash]
+
+    # Validasi workbook dari isi di memori dulu: file rusak tidak ditulis ke
+    # disk dan tidak didaftarkan, sehingga unggahan ulang gagal dengan error yang sama
+    sheet_names = get_sheet_names(io.BytesIO(data), file_hash)
+
+    with _upload_lock:
+        if file_hash in _upload_jobs:
+            return _upload_jobs[file_hash]
+
+        file_path, duplicate_of = None, None
+        for path in known_paths:
+            if os.path.exists(path) and compute_file_hash(path) == file_hash:
+                file_path, duplicate_of = path, os.path.basename(path)
+                break
+
+        written = False
+        if file_path is None:
+            file_path = os.path.join(get_upload_dir(), f"{file_hash[:20]}.xlsx")
+            if not os.path.exists(file_path):
+                def write_upload(tmp_path):
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                _write_atomic(file_path, write_upload)
+                written = True
+
+        job = UploadIngestJob(file_hash, file_path, name, duplicate_of)
+        _upload_jobs[file_hash] = job
+
+    try:
+        registry = get_sheet_registry()
+        pending = []
+        for sheet_name in sheet_names:
+            if os.path.exists(get_sheet_cache_path(file_hash, sheet_name)):
+                continue
+            registry_future = registry.reserve((file_hash, sheet_name))
+            if registry_future is not None:
+                pending.append((sheet_name, registry_future))
+    except Exception:
+        # Jangan tinggalkan job mati atau file setengah jadi untuk unggahan berikutnya
+        with _upload_lock:
+            _upload_jobs.pop(file_hash, None)
+        if written and os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    job.total = len(pending)
+    if pending:
+        with _upload_lock:
+            if _upload_executor is None:
+                _upload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-ingest")
+        _upload_executor.submit(_run_upload_job, job, pending)
+    return job
+
+# ============= INDEKS LOKASI =============
+
+# Jumlah indeks lokasi yang disimpan; satu per lembar yang sedang dipakai
+LOCATION_INDEX_CACHE_SIZE = 32
+
+class LocationIndex:
+    """Kecamatan -> row positions and (kecamatan, desa) -> row positions of one sheet.
+
+    Dibangun sekali per isi lembar sehingga get_desa_list dan filter lokasi
+    cukup mengambil posisi baris, tanpa membandingkan seluruh kolom.
+    """
+
+    def __init__(self, df):
+        has_desa = 'DESA' in df.columns
+        self.has_desa = has_desa
+        self.kecamatan_list = list(df['KECAMATAN'].unique())
+        self.desa_list = list(df['DESA'].unique()) if has_desa else []
+
+        # Baris dengan KECAMATAN kosong tidak pernah cocok dengan filter kecamatan
+        self._kecamatan_rows = {
+            kecamatan: self._compact(rows)
+            for kecamatan, rows in df.groupby('KECAMATAN', observed=True, sort=False).indices.items()
+        }
+
+        self._desa_by_kecamatan = {}
+        self._desa_rows = {}
+        if has_desa:
+            desa = df['DESA']
+            for kecamatan, rows in self._kecamatan_rows.items():
+                self._desa_by_kecamatan[kecamatan] = list(desa.iloc[rows].unique())
+            for (kecamatan, desa_name), rows in df.groupby(['KECAMATAN', 'DESA'], observed=True, sort=False).indices.items():
+                self._desa_rows.setdefault(kecamatan, {})[desa_name] = rows
+
+    @staticmethod
+    def _compact(rows):
+        # Baris yang berurutan disimpan sebagai slice agar pengambilan tidak perlu array indeks
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            return slice(int(rows[0]), int(rows[-1]) + 1)
+        return rows
+
+    def get_desa_list(self, selected_kecamatan):
+        """List the desa of the selected kecamatan, or of all kecamatan for 'ALL'"""
+        if selected_kecamatan[0] == 'ALL':
+            return list(self.desa_list)
+        return list(self._desa_by_kecamatan.get(selected_kecamatan[0], []))
+
+    def get_rows(self, kecamatan, selected_desa=None):
+        """Row positions for one kecamatan, optionally narrowed to some of its desa"""
+        if selected_desa and self.has_desa:
+            desa_rows = self._desa_rows.get(kecamatan, {})
+            parts = [desa_rows[desa] for desa in selected_desa if desa in desa_rows]
+            # Urutan baris asli dipertahankan seperti pada isin()
+            return np.unique(np.concatenate(parts)) if parts else np.array([], dtype=np.intp)
+        return self._kecamatan_rows.get(kecamatan, np.array([], dtype=np.intp))
+
+    def select_rows(self, selected_kecamatan, selected_desa=None):
+        """Row positions for a kecamatan selection, narrowed by desa; None when 'ALL' keeps every row"""
+        if selected_kecamatan[0] == 'ALL':
+            return None
+        return self.get_rows(selected_kecamatan[0], selected_desa)
+
+_location_indexes = OrderedDict()
+_location_index_lock = threading.Lock()
+
+def _location_fingerprint(df):
+    digest = hashlib.md5(str(len(df)).encode("utf-8"))
+    for col in LOCATION_COLUMNS:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        digest.update(col.encode("utf-8"))
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            digest.update(series.cat.codes.to_numpy().tobytes())
+            digest.update(repr(list(series.cat.categories)).encode("utf-8"))
+        else:
+            digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def get_location_index(df):
+    """Get the shared location index of a sheet, building it once per distinct KECAMATAN/DESA content"""
+    if 'KECAMATAN' not in df.columns:
+        return None
+
+    key = _location_fingerprint(df)
+    with _location_index_lock:
+        if key in _location_indexes:
+            _location_indexes.move_to_end(key)
+            return _location_indexes[key]
+
+    location_index = LocationIndex(df)
+    with _location_index_lock:
+        _location_indexes[key] = location_index
+        while len(_location_indexes) > LOCATION_INDEX_CACHE_SIZE:
+            _location_indexes.popitem(last=False)
+    return location_index
+
+# ============= MESIN FILTER DEKLARATIF =============
+
+# Setiap jenis lembar (dan variannya) dijelaskan sekali:
+# - 'options': daftar pilihan untuk sidebar, statis atau diturunkan dari kolom
+#   ('static', nilai) | ('columns', nama_set) | ('groups', nama_set, aturan COLUMN_GROUP_RULES, minimal_kolom)
+# - 'params': urutan argumen get_filtered_df setelah selected_kecamatan (selected_desa selalu terakhir)
+# - 'projection': bagian kolom hasil, digabung berurutan:
+#   ('contains', [(param, abaikan_huruf), ...])  kolom yang memuat salah satu nilai tiap param
+#   ('template', pola, loop, lewati_yang_hilang[, (param_switch, {nilai: pola})])
+#   ('selected', param)  kolom yang dipilih langsung oleh pengguna
+#   ('columns', nama_set)  seluruh kolom dalam set
+# - 'transform': (param, nilai, jenis) transformasi baris bila param bernilai tersebut
+FILTER_SPECS = {
+    'akta': {
+        'age_format': {
+            'options': {
+                'usia_options': ('static', ['KESELURUHAN', '0-5 TAHUN', '0-17 TAHUN']),
+                'status_options': ('static', ['MEMILIKI', 'BELUM MEMILIKI'])
+            },
+            'params': ['usia', 'status'],
+            'projection': [('contains', [('usia', True), ('status', True)])]
+        },
+        'gender_format': {
+            'options': {
+                'gender_options': ('static', ['LK', 'PR', 'JML']),
+                'status_options': ('static', ['MEMILIKI', 'BELUM MEMILIKI'])
+            },
+            'params': ['gender', 'status'],
+            'projection': [('template', ['{gender} ({status})'], ['gender', 'status'], True)]
+        },
+        'unknown_format': {
+            'options': {},
+            'params': [],
+            'projection': [('columns', 'numeric')]
+        }
+    },
+    'ktp': {
+        'options': {
+            'gender_options': ('static', ['LK', 'PR']),
+            'ktp_categories': ('static', ['WAJIB KTP', 'PEREKAMAN KTP-EL', 'PENCETAKAN KTP-EL'])
+        },
+        'params': ['gender', 'category'],
+        'projection': [('contains', [('gender', False), ('category', False)])]
+    },
+    'agama': {
+        'options': {
+            'agama_list': ('static', ['ISLAM', 'KRISTEN', 'KATHOLIK', 'HINDU', 'BUDHA', 'KONGHUCHU',
+                                      'KEPERCAYAAN TERHADAP TUHAN YME'])
+        },
+        'params': ['agama', 'data_type'],
+        'projection': [('template', ['LK ({agama})', 'PR ({agama})'], ['agama'], False,
+                        ('data_type', {'JUMLAH': ['JUMLAH ({agama})']}))]
+    },
+    'kia': {
+        'options': {
+            'status_options': ('static', ['MEMILIKI KIA', 'BELUM MEMILIKI KIA']),
+            'gender_options': ('static', ['LK', 'PR'])
+        },
+        'params': ['status', 'gender'],
+        'projection': [('template', ['{gender} ({status})'], ['status', 'gender'], False)]
+    },
+    'kartu_keluarga': {
+        'options': {
+            'data_options': ('static', ['JML KEP. KELUARGA', 'JUMLAH PENDUDUK']),
+            'gender_options': ('static', ['LK', 'PR', 'JUMLAH'])
+        },
+        'params': ['data', 'gender'],
+        'projection': [('template', ['{gender} ({data})'], ['gender', 'data'], True)]
+    },
+    'penduduk': {
+        'options': {
+            'gender_options': ('static', ['LAKI-LAKI', 'PEREMPUAN', 'TOTAL']),
+            'usia_groups': ('columns', 'usia')
+        },
+        'params': ['gender', 'usia'],
+        'projection': [('contains', [('gender', True)]), ('selected', 'usia')]
+    },
+    'kelompok_umur': {
+        'options': {
+            'umur_cols': ('columns', 'umur'),
+            'umur_categories': ('groups', 'umur', 'umur_category', 11)
+        },
+        'params': ['umur', 'display'],
+        'projection': [('selected', 'umur')],
+        'transform': ('display', 'Persentase', 'row_percentage')
+    },
+    'pendidikan': {
+        'options': {
+            'pendidikan_list': ('columns', 'non_location')
+        },
+        'params': ['pendidikan'],
+        'projection': [('selected', 'pendidikan')]
+    },
+    'pekerjaan': {
+        'options': {
+            'pekerjaan_list': ('columns', 'non_location'),
+            'pekerjaan_groups': ('groups', 'non_location', 'pekerjaan_sector', 11)
+        },
+        'params': ['pekerjaan'],
+        'projection': [('selected', 'pekerjaan')]
+    },
+    'perkawinan': {
+        'gender_breakdown': {
+            'options': {
+                'status_categories': ('static', ['BELUM KAWIN', 'KAWIN', 'CERAI HIDUP', 'CERAI MATI']),
+                'gender_options': ('static', ['LK', 'PR', 'JML'])
+            },
+            'params': ['status', 'gender'],
+            'projection': [('template', ['{gender} ({status})'], ['gender', 'status'], True)]
+        },
+        'no_gender_breakdown': {
+            'options': {
+                'status_list': ('columns', 'numeric')
+            },
+            'params': ['status'],
+            'projection': [('selected', 'status')]
+        }
+    }
+}
+
+# Jumlah proyeksi kolom yang diingat per rencana filter
+FILTER_PROJECTION_MEMO_SIZE = 256
+
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+def _canonical_selection(value):
+    # Nilai pilihan dibuat hashable agar bisa menjadi kunci memo
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return value
+
+def _column_sets(columns, numeric_columns):
+    """Named column sets that options and projections refer to"""
+    non_location = [col for col in columns if col not in LOCATION_COLUMNS]
+    return {
+        'numeric': list(numeric_columns),
+        'non_location': non_location,
+        'usia': [col for col in columns if 'USIA' in col],
+        # Pola kolom umur: "0-4", "5-9", ">75", "... TAHUN", "... THN"
+        'umur': [col for col in non_location
+                 if isinstance(col, str) and ('-' in col or 'TAHUN' in col.upper() or 'THN' in col.upper()
+                                              or parse_age_band(col) is not None)]
+    }
+
+class FilterPlan:
+    """Compiled filter for one sheet type and one header: options plus a memoised column projection"""
+
+    def __init__(self, sheet_type, variant, spec, columns, numeric_columns):
+        self.sheet_type = sheet_type
+        self.variant = variant
+        self.params = spec['params']
+        self.projection = spec['projection']
+        self.transform = spec.get('transform')
+        self.columns = list(columns)
+        self._column_lookup = set(self.columns)
+        self.base_columns = [col for col in LOCATION_COLUMNS if col in self._column_lookup]
+        self.column_sets = _column_sets(self.columns, numeric_columns)
+
+        self.options = {}
+        for name, option in spec['options'].items():
+            if option[0] == 'static':
+                self.options[name] = list(option[1])
+            elif option[0] == 'columns':
+                self.options[name] = list(self.column_sets[option[1]])
+            elif option[0] == 'groups':
+                _, set_name, rule_name, min_columns = option
+                columns = self.column_sets[set_name]
+                if len(columns) < min_columns:
+                    self.options[name] = {}
+                    continue
+                self.options[name] = {
+                    group: list(cols) for group, cols in compile_column_groups(rule_name, tuple(columns)).groups.items()
+                }
+
+        self._projection_memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def _project_part(self, part, selection):
+        kind = part[0]
+        if kind == 'contains':
+            conditions = [
+                ([v.upper() for v in _as_list(selection[param])] if ignore_case else _as_list(selection[param]),
+                 ignore_case)
+                for param, ignore_case in part[1]
+            ]
+            return [
+                col for col in self.columns
+                if isinstance(col, str) and all(
+                    any(value in (col.upper() if ignore_case else col) for value in values)
+                    for values, ignore_case in conditions
+                )
+            ]
+        if kind == 'template':
+            patterns, loop, skip_missing = part[1], part[2], part[3]
+            if len(part) > 4:
+                switch_param, switch_patterns = part[4]
+                patterns = switch_patterns.get(selection[switch_param], patterns)
+
+            combos = [{}]
+            for param in loop:
+                combos = [dict(combo, **{param: value}) for combo in combos for value in _as_list(selection[param])]
+            names = [pattern.format(**combo) for combo in combos for pattern in patterns]
+            if skip_missing:
+                names = [name for name in names if name in self._column_lookup]
+            return names
+        if kind == 'selected':
+            return list(selection[part[1]] or [])
+        if kind == 'columns':
+            return list(self.column_sets[part[1]])
+        raise ValueError(f"Jenis proyeksi tidak dikenal: {kind}")
+
+    def project(self, selection):
+        """Column names selected by one filter selection (memoised per canonical selection)"""
+        key = tuple(_canonical_selection(selection[param]) for param in self.params)
+        with self._memo_lock:
+            if key in self._projection_memo:
+                self._projection_memo.move_to_end(key)
+                return self._projection_memo[key]
+
+        columns = []
+        for part in self.projection:
+            columns.extend(self._project_part(part, selection))
+
+        with self._memo_lock:
+            self._projection_memo[key] = columns
+            while len(self._projection_memo) > FILTER_PROJECTION_MEMO_SIZE:
+                self._projection_memo.popitem(last=False)
+        return columns
+
+    def apply(self, df, location_index, selected_kecamatan, selection, selected_desa=None):
+        """Apply the location mask and the column projection to df.
+
+        Tanpa salinan lembar: 'ALL' memakai df apa adanya dan satu kecamatan
+        berupa irisan baris, sehingga proyeksi kolom adalah satu-satunya salinan.
+        """
+        if location_index is not None:
+            rows = location_index.select_rows(selected_kecamatan, selected_desa)
+        elif 'DESA' in df.columns and selected_kecamatan[0] != 'ALL' and selected_desa:
+            rows = np.flatnonzero(df['DESA'].isin(selected_desa).to_numpy())
+        else:
+            rows = None
+
+        columns = self.project(selection)
+        # Baris dulu lalu kolom: iloc[baris, kolom] menyalin kolom terpilih untuk semua baris lebih dulu
+        filtered_df = (df if rows is None else df.iloc[rows])[self.base_columns + columns]
+
+        if self.transform:
+            param, value, kind = self.transform
+            if selection[param] == value and columns and kind == 'row_percentage':
+                # Persentase tiap kolom terhadap total baris kolom yang dipilih
+                filtered_df = filtered_df.copy()
+                row_totals = filtered_df[columns].sum(axis=1)
+                for col in columns:
+                    filtered_df[f'{col} (%)'] = (filtered_df[col] / row_totals * 100).round(2)
+                filtered_df = filtered_df[self.base_columns + [f'{col} (%)' for col in columns]]
+
+        return filtered_df
+
+@lru_cache(maxsize=64)
+def compile_filter_plan(sheet_type, header):
+    """Compile the filter spec of a sheet type for one header, a tuple of (column, dtype name) pairs"""
+    columns = [col for col, _ in header]
+    numeric_columns = [col for col, dtype in header if dtype in NUMERIC_DTYPES]
+
+    spec = FILTER_SPECS[sheet_type]
+    variant = detect_sheet_variant(sheet_type, tuple(columns))
+    if variant in spec:
+        spec = spec[variant]
+    return FilterPlan(sheet_type, variant, spec, columns, numeric_columns)
+
+class FilterResultCache(SheetRegistry):
+    """Bounded LRU of filter results shared by all sessions, with hit counts per selection.
+
+    Kunci: (isi lembar, jenis lembar, pilihan kanonik). Hasil yang sudah ada
+    dikembalikan tanpa menyentuh DataFrame lembar sama sekali.
+    """
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes)
+        self.view_hits = {}  # kunci -> jumlah hit, hanya untuk kunci yang masih di cache
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            if key in self._entries:
+                self.view_hits[key] = self.view_hits.get(key, 0) + 1
+        return super().get_or_load(key, loader)
+
+    def _evict(self):
+        super()._evict()
+        for key in [key for key in self.view_hits if key not in self._entries]:
+            del self.view_hits[key]
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self.view_hits.clear()
+
+    def top_views(self, n=10):
+        """Return the n most frequently reused selections as (key, hits) pairs"""
+        with self._lock:
+            return sorted(self.view_hits.items(), key=lambda item: item[1], reverse=True)[:n]
+
+_filter_result_cache = FilterResultCache(FILTER_CACHE_MAX_MB * 1024 * 1024)
+
+def get_filter_result_cache():
+    """Get the process-wide cache of filter results"""
+    return _filter_result_cache
+
+class FigureCache(SheetRegistry):
+    """Bounded LRU of serialised Plotly figure specs (JSON strings) shared by all sessions.
+
+    Kunci: (jenis grafik, sidik data agregat, opsi tata letak). Spesifikasi
+    berupa string sehingga aman dibagi antar sesi tanpa disalin.
+    """
+
+    @staticmethod
+    def _sizeof(spec):
+        return len(spec)
+
+_figure_cache = FigureCache(FIGURE_CACHE_MAX_MB * 1024 * 1024)
+
+def get_figure_cache():
+    """Get the process-wide cache of serialised figures"""
+    return _figure_cache
+
+def compute_frame_fingerprint(df):
+    """Hash an aggregated frame: index, column names, dtypes and values"""
+    digest = hashlib.md5()
+    digest.update(repr((list(df.index.names), list(df.columns))).encode("utf-8"))
+    digest.update(repr(list(df.dtypes.astype(str))).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def compute_sheet_content_hash(df):
+    """Hash the column names, dtypes and values of a sheet"""
+    digest = hashlib.md5()
+    for col in df.columns:
+        series = df[col]
+        digest.update(f"{col}\x00{series.dtype}\x00".encode("utf-8"))
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            digest.update(series.cat.codes.to_numpy().tobytes())
+            digest.update(repr(list(series.cat.categories)).encode("utf-8"))
+        elif series.dtype == object:
+            digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+        else:
+            digest.update(series.to_numpy().tobytes())
+    return digest.hexdigest()
+
+def canonical_filter_key(plan, selected_kecamatan, selection, selected_desa):
+    """Canonical, hashable form of one filter selection"""
+    kecamatan = selected_kecamatan[0]
+    # Desa hanya berlaku untuk kecamatan tertentu, dan urutannya tidak mengubah hasil
+    desa = () if kecamatan == 'ALL' or not selected_desa else tuple(sorted(set(selected_desa), key=str))
+    params = tuple(_canonical_selection(selection[param]) for param in plan.params)
+    return (plan.variant, kecamatan, desa, params)
+
+def build_filter_data(sheet_type, df, content_key=None):
+    """Build the filter_data dict a render_*_filters function expects, from the sheet type's spec.
+
+    content_key mengidentifikasi isi df (mis. hash workbook + nama lembar);
+    tanpa itu isi lembar di-hash sekali saat filter pertama dijalankan.
+    """
+    plan = compile_filter_plan(sheet_type, tuple(zip(df.columns, df.dtypes.astype(str))))
+    location_index = get_location_index(df)
+    content_keys = [content_key]
+
+    def get_desa_list(selected_kecamatan):
+        if location_index is not None:
+            return location_index.get_desa_list(selected_kecamatan)
+        if 'DESA' in df.columns and selected_kecamatan[0] == 'ALL':
+            return list(df['DESA'].unique())
+        return []
+
+    def get_filtered_df(selected_kecamatan, *args):
+        # Argumen mengikuti urutan 'params' di spec, opsional diikuti selected_desa
+        if len(args) not in (len(plan.params), len(plan.params) + 1):
+            raise TypeError(f"get_filtered_df untuk {sheet_type} membutuhkan parameter {plan.params}")
+        selection = dict(zip(plan.params, args))
+        selected_desa = args[len(plan.params)] if len(args) > len(plan.params) else None
+
+        if content_keys[0] is None:
+            content_keys[0] = compute_sheet_content_hash(df)
+        key = (content_keys[0], sheet_type) + canonical_filter_key(plan, selected_kecamatan, selection, selected_desa)
+        result = get_filter_result_cache().get_or_load(
+            key,
+            lambda: plan.apply(df, location_index, selected_kecamatan, selection, selected_desa)
+        )
+        # Hasil dipakai bersama semua sesi; salinan dangkal mencegah perubahan struktur bocor ke sesi lain
+        return result.copy(deep=False)
+
+    filter_data = {
+        'type': plan.variant,
+        'kecamatan_list': ['ALL'] + location_index.kecamatan_list if location_index else [],
+        'get_desa_list': get_desa_list,
+        'get_filtered_df': get_filtered_df,
+        'params': list(plan.params)
+    }
+    filter_data.update(plan.options)
+    return filter_data
+
+def make_filter_selection(sheet_name, selected_kecamatan, *args):
+    """Hashable batch selection: (sheet name, kecamatan, get_filtered_df arguments as tuples)"""
+    if isinstance(selected_kecamatan, (list, tuple)):
+        selected_kecamatan = selected_kecamatan[0]
+    return (sheet_name, selected_kecamatan) + tuple(
+        tuple(arg) if isinstance(arg, list) else arg for arg in args
+    )
+
+def default_filter_args(sheet_type, filter_data, kecamatan):
+    """Build the get_filtered_df arguments the sidebar sends for its default selection, or None"""
+    if sheet_type == 'akta':
+        if filter_data['type'] == 'age_format':
+            return [[kecamatan], filter_data['usia_options'][0], filter_data['status_options']]
+        if filter_data['type'] == 'gender_format':
+            return [[kecamatan], filter_data['gender_options'], filter_data['status_options']]
+        return [[kecamatan]]
+    if sheet_type == 'ktp':
+        return [[kecamatan], filter_data['gender_options'], filter_data['ktp_categories'][0]]
+    if sheet_type == 'agama':
+        return [[kecamatan], filter_data['agama_list'], 'JUMLAH']
+    if sheet_type == 'kia':
+        return [[kecamatan], filter_data['status_options'], filter_data['gender_options']]
+    if sheet_type == 'kartu_keluarga':
+        return [[kecamatan], filter_data['data_options'][0], filter_data['gender_options']]
+    if sheet_type == 'penduduk':
+        return [[kecamatan], filter_data['gender_options'], filter_data['usia_groups']]
+    if sheet_type == 'kelompok_umur':
+        return [[kecamatan], filter_data['umur_cols'], 'Jumlah']
+    if sheet_type == 'pendidikan':
+        return [[kecamatan], filter_data['pendidikan_list']]
+    if sheet_type == 'pekerjaan':
+        return [[kecamatan], filter_data['pekerjaan_list']]
+    if sheet_type == 'perkawinan':
+        if filter_data['type'] == 'gender_breakdown':
+            return [[kecamatan], filter_data['status_categories'], filter_data['gender_options']]
+        return [[kecamatan], filter_data['status_list']]
+    return None
+
 # ============= KELAS VISUALISASI DATA =============
 
 class MadiunDataVisualizer:
     def __init__(self, file_path):
         self.file_path = file_path
-        self.xls = pd.ExcelFile(file_path)
-    
+        self.file_hash = compute_file_hash(file_path)
+        self._xls = None
+        self._loaded_sheets = {}  # id(df) -> (df, nama lembar) untuk kunci cache filter
+
+    @property
+    def xls(self):
+        """Open the Excel file lazily; normal loads go through the Parquet cache"""
+        if self._xls is None:
+            self._xls = pd.ExcelFile(self.file_path)
+        return self._xls
+
+    @property
+    def metadata(self):
+        return read_workbook_metadata(self.file_path, self.file_hash)
+
+    @property
+    def sheet_names(self):
+        return self.metadata['sheet_names']
+
+    def get_sheet_profile(self, sheet_name):
+        """Get the sheet type, format variant and header fingerprint stored with the workbook metadata (see classify_sheet)"""
+        return self.metadata['sheets'][sheet_name]['profile']
+
+    def load_sheet(self, sheet_name):
+        """Load a sheet of this workbook through the Parquet cache"""
+        df = load_sheet(self.file_path, sheet_name, self.file_hash)
+        self._loaded_sheets[id(df)] = (df, sheet_name)
+        return df
+
+    def load_sheet_cube(self, sheet_name):
+        """Load the pre-aggregated desa/kecamatan/kabupaten sums of a sheet"""
+        return load_sheet_cube(self.file_path, sheet_name, self.file_hash)
+
+    def load_sheet_matrix(self, sheet_name, by):
+        """Load the numeric columns of a sheet grouped by the `by` columns (cached per sheet and key)"""
+        return load_sheet_matrix(self.file_path, sheet_name, by, self.file_hash)
+
+    def _content_key(self, df):
+        # Lembar yang dimuat lewat load_sheet dikenali dari hash workbook + nama lembar
+        # (isi lembar tidak diubah di tempat oleh pemanggil); selain itu isinya di-hash
+        loaded = self._loaded_sheets.get(id(df))
+        if loaded is not None and loaded[0] is df:
+            return (self.file_hash, loaded[1])
+        return None
+
+    def _build_filter_data(self, sheet_name):
+        sheet_type = self.get_sheet_profile(sheet_name)['sheet_type']
+        if sheet_type not in FILTER_SPECS:
+            return None
+        df = self.load_sheet(sheet_name)
+        return sheet_type, build_filter_data(sheet_type, df, self._content_key(df))
+
+    def default_selections(self, sheet_names=None):
+        """Every kecamatan ('ALL' first) x every filterable sheet, each with the sidebar's default selection"""
+        selections = []
+        for sheet_name in sheet_names or self.sheet_names:
+            loaded = self._build_filter_data(sheet_name)
+            if loaded is None:
+                continue
+            sheet_type, filter_data = loaded
+            for kecamatan in filter_data['kecamatan_list'] or ['ALL']:
+                args = default_filter_args(sheet_type, filter_data, kecamatan)
+                if args is not None:
+                    selections.append(make_filter_selection(sheet_name, *args))
+        return selections
+
+    def evaluate_filters(self, selections=None, sheet_names=None):
+        """Evaluate many filter selections at once, without Streamlit; returns {selection: result}.
+
+        Selection adalah tuple (nama_lembar, kecamatan, argumen...) dengan
+        argumen sesuai get_filtered_df lembar tersebut (lihat make_filter_selection).
+        Tanpa selections: setiap kecamatan x setiap lembar (default_selections).
+        Tiap lembar dimuat dan filternya dibangun sekali; ringkasan dibaca dari
+        kubus lembar. Hasil: dict dengan 'sheet_type', 'data' (DataFrame
+        terfilter), 'summary_level' dan 'summary' (jumlah per kecamatan, atau
+        per desa bila satu kecamatan dipilih, seperti grafik dashboard).
+        """
+        if selections is None:
+            selections = self.default_selections(sheet_names)
+
+        by_sheet = OrderedDict()
+        for selection in selections:
+            selection = make_filter_selection(*selection)
+            by_sheet.setdefault(selection[0], []).append(selection)
+
+        results = {}
+        for sheet_name, sheet_selections in by_sheet.items():
+            loaded = self._build_filter_data(sheet_name)
+            if loaded is None:
+                raise ValueError(f"Tidak ada filter untuk lembar {sheet_name}")
+            sheet_type, filter_data = loaded
+            n_params = len(filter_data['params'])
+            cube = self.load_sheet_cube(sheet_name)
+            load_matrix = partial(self.load_sheet_matrix, sheet_name)
+            cube_summaries = {}  # kolom numerik -> ringkasan semua kecamatan, dipotong sekali dari kubus
+
+            for selection in sheet_selections:
+                kecamatan = selection[1]
+                args = [list(arg) if isinstance(arg, tuple) else arg for arg in selection[2:]]
+                data = filter_data['get_filtered_df']([kecamatan], *args)
+
+                summary = None
+                whole_areas = len(args) <= n_params or not args[n_params]
+                numeric_cols = tuple(data.select_dtypes(include=NUMERIC_DTYPES).columns)
+                if whole_areas and numeric_cols and 'KECAMATAN' in data.columns:
+                    if numeric_cols not in cube_summaries:
+                        cube_summaries[numeric_cols] = split_cube_summaries(cube, numeric_cols, data)
+                    if cube_summaries[numeric_cols] is not None:
+                        level = get_summary_level(data)
+                        summary = cube_summaries[numeric_cols].get(
+                            level, None if kecamatan == 'ALL' and level == 'KECAMATAN' else kecamatan
+                        )
+                if summary is None:
+                    # Subset desa, kolom hasil transformasi atau lembar tanpa kubus
+                    summary = summarize_filtered_df(data, cube, load_matrix)
+
+                results[selection] = {
+                    'sheet_type': sheet_type,
+                    'data': data,
+                    'summary_level': get_summary_level(data) if summary is not None else None,
+                    'summary': summary
+                }
+        return results
+
+    # Semua filter dibangun dari FILTER_SPECS; metode di bawah dipertahankan
+    # sebagai titik masuk untuk SHEET_FILTER_HANDLERS dan pemanggil lama
     def add_akta_filters(self, df):
         """Filter khusus untuk lembar AKTA"""
-        # Detect format of the AKTA sheet based on column names
-        is_gender_format = any('LK (MEMILIKI)' in str(col).upper() for col in df.columns)
-        is_age_format = any('(0-5 TAHUN)' in str(col).upper() for col in df.columns)
-        
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        if is_age_format:
-            # First semester format (AKTA 0 SD 17 DESA)
-            # Filter Kategori Usia
-            usia_options = ['KESELURUHAN', '0-5 TAHUN', '0-17 TAHUN']
-            status_options = ['MEMILIKI', 'BELUM MEMILIKI']
-            
-            # Kolom yang akan digunakan berdasarkan usia parameter
-            def get_filtered_df(selected_kecamatan, selected_usia, selected_status, selected_desa=None):
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    filtered_df = df.copy()
-                else:
-                    filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-                
-                # Apply desa filter if provided and a specific kecamatan is selected
-                if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                    filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                    
-                cols_to_use = [col for col in df.columns if isinstance(col, str) and selected_usia.lower() in col.lower()]
-                status_cols = [col for col in cols_to_use if any(status.upper() in col.upper() for status in selected_status)]
-                return filtered_df[['KECAMATAN', 'DESA'] + status_cols]
-            
-            return {
-                'type': 'age_format',
-                'kecamatan_list': ['ALL'] + kecamatan_list,
-                'get_desa_list': get_desa_list,
-                'usia_options': usia_options,
-                'status_options': status_options,
-                'get_filtered_df': get_filtered_df
-            }
-            
-        elif is_gender_format:
-            # Second semester format (AKTA with gender breakdown)
-            # Filter Jenis Kelamin
-            gender_options = ['LK', 'PR', 'JML']
-            status_options = ['MEMILIKI', 'BELUM MEMILIKI']
-            
-            def get_filtered_df(selected_kecamatan, selected_gender, selected_status, selected_desa=None):
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    filtered_df = df.copy()
-                else:
-                    filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-                
-                # Apply desa filter if provided and a specific kecamatan is selected
-                if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                    filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                    
-                # Build column selections based on both status and gender
-                status_cols = []
-                for gender in selected_gender:
-                    for status in selected_status:
-                        col_name = f"{gender} ({status})"
-                        if col_name in df.columns:
-                            status_cols.append(col_name)
-                
-                return filtered_df[['KECAMATAN', 'DESA'] + status_cols]
-            
-            return {
-                'type': 'gender_format',
-                'kecamatan_list': ['ALL'] + kecamatan_list,
-                'get_desa_list': get_desa_list,
-                'gender_options': gender_options,
-                'status_options': status_options,
-                'get_filtered_df': get_filtered_df
-            }
-        
-        else:
-            # Fallback for unknown format
-            numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-            
-            def get_filtered_df(selected_kecamatan, selected_desa=None):
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    filtered_df = df.copy()
-                else:
-                    filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-                
-                # Apply desa filter if provided and a specific kecamatan is selected
-                if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                    filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                    
-                return filtered_df[['KECAMATAN', 'DESA'] + list(numeric_cols)]
-            
-            return {
-                'type': 'unknown_format',
-                'kecamatan_list': ['ALL'] + kecamatan_list,
-                'get_desa_list': get_desa_list,
-                'get_filtered_df': get_filtered_df
-            }
+        return build_filter_data('akta', df, self._content_key(df))
 
     def add_ktp_filters(self, df):
         """Filter khusus untuk lembar KTP"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        gender_options = ['LK', 'PR']
-        ktp_categories = ['WAJIB KTP', 'PEREKAMAN KTP-EL', 'PENCETAKAN KTP-EL']
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        def get_filtered_df(selected_kecamatan, selected_gender, selected_category, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            gender_cols = [col for col in df.columns if any(gender in col for gender in selected_gender) 
-                          and selected_category in col]
-            return filtered_df[['KECAMATAN', 'DESA'] + gender_cols]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'gender_options': gender_options,
-            'ktp_categories': ktp_categories,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('ktp', df, self._content_key(df))
 
     def add_agama_filters(self, df):
         """Filter khusus untuk lembar AGAMA"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        agama_list = ['ISLAM', 'KRISTEN', 'KATHOLIK', 'HINDU', 'BUDHA', 'KONGHUCHU', 
-                      'KEPERCAYAAN TERHADAP TUHAN YME']
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        def get_filtered_df(selected_kecamatan, selected_agama, data_type, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            if data_type == 'JUMLAH':
-                agama_cols = [f'JUMLAH ({agama})' for agama in selected_agama]
-            else:
-                agama_cols = []
-                for agama in selected_agama:
-                    agama_cols.extend([f'LK ({agama})', f'PR ({agama})'])
-            
-            return filtered_df[['KECAMATAN', 'DESA'] + agama_cols]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'agama_list': agama_list,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('agama', df, self._content_key(df))
 
     def add_kia_filters(self, df):
         """Filter khusus untuk lembar KIA"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        status_options = ['MEMILIKI KIA', 'BELUM MEMILIKI KIA']
-        gender_options = ['LK', 'PR']
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        def get_filtered_df(selected_kecamatan, selected_status, selected_gender, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            status_cols = []
-            for status in selected_status:
-                status_cols.extend([f'{gender} ({status})' for gender in selected_gender])
-            
-            return filtered_df[['KECAMATAN', 'DESA'] + status_cols]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'status_options': status_options,
-            'gender_options': gender_options,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('kia', df, self._content_key(df))
 
     def add_kartu_keluarga_filters(self, df):
         """Filter khusus untuk lembar Kartu Keluarga"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        data_options = ['JML KEP. KELUARGA', 'JUMLAH PENDUDUK']
-        gender_options = ['LK', 'PR', 'JUMLAH']
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        def get_filtered_df(selected_kecamatan, selected_data, selected_gender, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            columns_to_use = []
-            for gender in selected_gender:
-                column_name = f"{gender} ({selected_data})"
-                if column_name in df.columns:
-                    columns_to_use.append(column_name)
-            
-            return filtered_df[['KECAMATAN', 'DESA'] + columns_to_use]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'data_options': data_options,
-            'gender_options': gender_options,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('kartu_keluarga', df, self._content_key(df))
 
     def add_penduduk_filters(self, df):
         """Filter khusus untuk lembar Penduduk"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        gender_options = ['LAKI-LAKI', 'PEREMPUAN', 'TOTAL']
-        
-        # Filter Kelompok Usia (jika ada)
-        usia_groups = [col for col in df.columns if 'USIA' in col] if any('USIA' in col for col in df.columns) else []
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        def get_filtered_df(selected_kecamatan, selected_gender, selected_usia, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            gender_cols = [col for col in df.columns if any(gender in col.upper() for gender in selected_gender)]
-            usia_cols = selected_usia if selected_usia else []
-            
-            selected_cols = gender_cols + usia_cols
-            
-            return filtered_df[['KECAMATAN', 'DESA'] + selected_cols]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'gender_options': gender_options,
-            'usia_groups': usia_groups,
-            'get_filtered_df': get_filtered_df
-        }
-        
+        return build_filter_data('penduduk', df, self._content_key(df))
+
     def add_kelompok_umur_filters(self, df):
         """Filter khusus untuk lembar Kelompok Umur"""
-        # Get kecamatan list and add ALL option if kecamatan exists
-        kecamatan_list = list(df['KECAMATAN'].unique()) if 'KECAMATAN' in df.columns else []
-        
-        # Deteksi kolom kelompok umur
-        umur_cols = []
-        for col in df.columns:
-            if col not in ['KECAMATAN', 'DESA']:
-                # Deteksi pola kolom umur (misalnya "0-4", "5-9", "10-14", dll.)
-                if isinstance(col, str) and ('-' in col or 'TAHUN' in col.upper() or 'THN' in col.upper()):
-                    umur_cols.append(col)
-        
-        # Jika terlalu banyak kelompok umur, buat kategori
-        umur_categories = {}
-        if len(umur_cols) > 10:
-            # Kelompokkan berdasarkan rentang
-            umur_categories = {
-                'Balita (0-4 tahun)': [col for col in umur_cols if '0-4' in col or '0 - 4' in col],
-                'Anak-anak (5-14 tahun)': [col for col in umur_cols if any(x in col for x in ['5-9', '5 - 9', '10-14', '10 - 14'])],
-                'Remaja (15-24 tahun)': [col for col in umur_cols if any(x in col for x in ['15-19', '15 - 19', '20-24', '20 - 24'])],
-                'Dewasa Muda (25-34 tahun)': [col for col in umur_cols if any(x in col for x in ['25-29', '25 - 29', '30-34', '30 - 34'])],
-                'Dewasa (35-54 tahun)': [col for col in umur_cols if any(x in col for x in ['35-39', '35 - 39', '40-44', '40 - 44', '45-49', '45 - 49', '50-54', '50 - 54'])],
-                'Lansia (55+ tahun)': [col for col in umur_cols if any(x in col for x in ['55-59', '55 - 59', '60-64', '60 - 64', '65-69', '65 - 69', '70-74', '70 - 74', '75+', '75 +'])]
-            }
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            if 'DESA' in df.columns:
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    return list(df['DESA'].unique())
-                else:
-                    return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-            return []
-        
-        def get_filtered_df(selected_kecamatan, selected_umur, selected_display, selected_desa=None):
-            if 'KECAMATAN' in df.columns:
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    filtered_df = df.copy()
-                else:
-                    filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            else:
-                filtered_df = df.copy()
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if 'DESA' in df.columns and selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            # Jika pilihan tampilan adalah persentase, hitung persentase
-            if selected_display == 'Persentase' and selected_umur:
-                # Hitung total untuk setiap baris
-                filtered_df = filtered_df.copy()
-                row_totals = filtered_df[selected_umur].sum(axis=1)
-                
-                # Hitung persentase untuk kolom yang dipilih
-                for col in selected_umur:
-                    filtered_df[f'{col} (%)'] = (filtered_df[col] / row_totals * 100).round(2)
-                
-                # Gunakan kolom persentase
-                selected_cols = [f'{col} (%)' for col in selected_umur]
-                
-                # Kembalikan dataframe dengan kolom yang dipilih
-                base_cols = []
-                if 'KECAMATAN' in df.columns:
-                    base_cols.append('KECAMATAN')
-                if 'DESA' in df.columns:
-                    base_cols.append('DESA')
-                return filtered_df[base_cols + selected_cols]
-            else:
-                # Kembalikan dataframe dengan jumlah absolut
-                base_cols = []
-                if 'KECAMATAN' in df.columns:
-                    base_cols.append('KECAMATAN')
-                if 'DESA' in df.columns:
-                    base_cols.append('DESA')
-                return filtered_df[base_cols + selected_umur]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list if kecamatan_list else [],
-            'get_desa_list': get_desa_list,
-            'umur_cols': umur_cols,
-            'umur_categories': umur_categories,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('kelompok_umur', df, self._content_key(df))
 
     def add_pendidikan_filters(self, df):
         """Filter khusus untuk lembar Pendidikan"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        pendidikan_list = [col for col in df.columns if col not in ['KECAMATAN', 'DESA']]
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        def get_filtered_df(selected_kecamatan, selected_pendidikan, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            return filtered_df[['KECAMATAN', 'DESA'] + selected_pendidikan]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'pendidikan_list': pendidikan_list,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('pendidikan', df, self._content_key(df))
 
     def add_pekerjaan_filters(self, df):
         """Filter khusus untuk lembar Pekerjaan"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        pekerjaan_list = [col for col in df.columns if col not in ['KECAMATAN', 'DESA']]
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        # Kelompokkan pekerjaan jika terlalu banyak
-        pekerjaan_groups = {}
-        if len(pekerjaan_list) > 10:
-            # Buat grouping berdasarkan kata kunci umum
-            pekerjaan_groups = {
-                'PERTANIAN': [col for col in pekerjaan_list if any(k in col.upper() for k in ['TANI', 'NELAYAN', 'TERNAK'])],
-                'PENDIDIKAN': [col for col in pekerjaan_list if any(k in col.upper() for k in ['GURU', 'DOSEN', 'PENDIDIK'])],
-                'KESEHATAN': [col for col in pekerjaan_list if any(k in col.upper() for k in ['DOKTER', 'PERAWAT', 'BIDAN'])],
-                'PERDAGANGAN': [col for col in pekerjaan_list if any(k in col.upper() for k in ['DAGANG', 'JUAL', 'WIRASWASTA'])],
-                'INDUSTRI': [col for col in pekerjaan_list if any(k in col.upper() for k in ['BURUH', 'KARYAWAN', 'PEGAWAI'])],
-                'LAINNYA': [col for col in pekerjaan_list if not any(k in col.upper() for k in ['TANI', 'NELAYAN', 'TERNAK', 'GURU', 'DOSEN', 'PENDIDIK', 'DOKTER', 'PERAWAT', 'BIDAN', 'DAGANG', 'JUAL', 'WIRASWASTA', 'BURUH', 'KARYAWAN', 'PEGAWAI'])]
-            }
-        
-        def get_filtered_df(selected_kecamatan, selected_pekerjaan, selected_desa=None):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                filtered_df = df.copy()
-            else:
-                filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-            
-            # Apply desa filter if provided and a specific kecamatan is selected
-            if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                
-            return filtered_df[['KECAMATAN', 'DESA'] + selected_pekerjaan]
-        
-        return {
-            'kecamatan_list': ['ALL'] + kecamatan_list,
-            'get_desa_list': get_desa_list,
-            'pekerjaan_list': pekerjaan_list,
-            'pekerjaan_groups': pekerjaan_groups,
-            'get_filtered_df': get_filtered_df
-        }
+        return build_filter_data('pekerjaan', df, self._content_key(df))
 
     def add_perkawinan_filters(self, df):
         """Filter khusus untuk lembar Status Perkawinan atau KK KAWIN"""
-        # Get kecamatan list and add ALL option
-        kecamatan_list = list(df['KECAMATAN'].unique())
-        
-        # Function to get desa list based on selected kecamatan
-        def get_desa_list(selected_kecamatan):
-            # Check if ALL is selected or a specific kecamatan
-            if selected_kecamatan[0] == 'ALL':
-                return list(df['DESA'].unique())
-            else:
-                return list(df[df['KECAMATAN'] == selected_kecamatan[0]]['DESA'].unique())
-        
-        # Common status categories across both formats
-        status_categories = ['BELUM KAWIN', 'KAWIN', 'CERAI HIDUP', 'CERAI MATI']
-        
-        # First identify if columns contain gender breakdown (LK, PR, JML)
-        has_gender_breakdown = any(str(col).startswith('LK') or str(col).startswith('PR') or str(col).startswith('JML') 
-                                for col in df.columns)
-        
-        if has_gender_breakdown:
-            # This is the KK KAWIN or PERKAWINAN format with gender breakdown
-            gender_options = ['LK', 'PR', 'JML']
-            
-            def get_filtered_df(selected_kecamatan, selected_status, selected_gender, selected_desa=None):
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    filtered_df = df.copy()
-                else:
-                    filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-                
-                # Apply desa filter if provided and a specific kecamatan is selected
-                if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                    filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                    
-                # Build column selections based on both status and gender
-                status_cols = []
-                for gender in selected_gender:
-                    for status in selected_status:
-                        col_name = f"{gender} ({status})"
-                        if col_name in df.columns:
-                            status_cols.append(col_name)
-                
-                return filtered_df[['KECAMATAN', 'DESA'] + status_cols]
-            
-            return {
-                'type': 'gender_breakdown',
-                'kecamatan_list': ['ALL'] + kecamatan_list,
-                'get_desa_list': get_desa_list,
-                'status_categories': status_categories,
-                'gender_options': gender_options,
-                'get_filtered_df': get_filtered_df
-            }
-        else:
-            # Old PERKAWINAN format without gender breakdown
-            # Get all numeric columns as options
-            numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-            status_list = [col for col in numeric_cols if col not in ['KECAMATAN', 'DESA']]
-            
-            def get_filtered_df(selected_kecamatan, selected_status, selected_desa=None):
-                # Check if ALL is selected or a specific kecamatan
-                if selected_kecamatan[0] == 'ALL':
-                    filtered_df = df.copy()
-                else:
-                    filtered_df = df[df['KECAMATAN'] == selected_kecamatan[0]]
-                
-                # Apply desa filter if provided and a specific kecamatan is selected
-                if selected_kecamatan[0] != 'ALL' and selected_desa and len(selected_desa) > 0:
-                    filtered_df = filtered_df[filtered_df['DESA'].isin(selected_desa)]
-                    
-                return filtered_df[['KECAMATAN', 'DESA'] + selected_status]
-            
-            return {
-                'type': 'no_gender_breakdown',
-                'kecamatan_list': ['ALL'] + kecamatan_list,
-                'get_desa_list': get_desa_list,
-                'status_list': status_list,
-                'get_filtered_df': get_filtered_df
-            }
+        return build_filter_data('perkawinan', df, self._content_key(df))
+
+# ============= PENEMUAN FILE DATA =============
+
+# Nama file data semester, mis. STAT_SMT_I_2024.xlsx atau STAT_SMT_2_2024.xlsx
+DATA_FILE_PATTERN = re.compile(r'^STAT_SMT_(?P<semester>[A-Za-z0-9]+)_(?P<year>\d{4})\.xlsx$', re.IGNORECASE)
+SEMESTER_ORDER = {'I': 1, '1': 1, 'II': 2, '2': 2}
+
+_manifest_lock = threading.Lock()
+
+def get_data_dir():
+    """Get the watched directory that holds the semester workbooks"""
+    return os.environ.get("MADIUN_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
+
+def get_data_file_path(filename):
+    """Get the full path of a workbook listed by get_available_files"""
+    return os.path.join(get_data_dir(), filename)
+
+def parse_semester(filename):
+    """Parse a data file name into (year, semester order, semester), or None if it is not a semester workbook"""
+    match = DATA_FILE_PATTERN.match(os.path.basename(filename))
+    if not match:
+        return None
+    semester = match.group('semester').upper()
+    return (int(match.group('year')), SEMESTER_ORDER.get(semester, len(SEMESTER_ORDER) + 1), semester)
 
 # Function to check available files
 def get_available_files():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    available_files = []
-    
-    # Check for hardcoded files with both naming patterns
-    file1_paths = [
-        os.path.join(current_dir, "STAT_SMT_I_2024.xlsx"),
-        os.path.join(current_dir, "STAT_SMT_1_2024.xlsx")
-    ]
-    
-    file2_paths = [
-        os.path.join(current_dir, "STAT_SMT_2_2024.xlsx"),
-        os.path.join(current_dir, "STAT_SMT_II_2024.xlsx")
-    ]
-    
-    # Check first semester file
-    for file_path in file1_paths:
-        if os.path.exists(file_path):
-            filename = os.path.basename(file_path)
-            available_files.append(filename)
-            break
-    
-    # Check second semester file
-    for file_path in file2_paths:
-        if os.path.exists(file_path):
-            filename = os.path.basename(file_path)
-            available_files.append(filename)
-            break
-    
-    return available_files
\ No newline at end of file
+    """List every STAT_SMT_*_<year>.xlsx workbook in the data directory, oldest semester first"""
+    found = []
+    for filename in os.listdir(get_data_dir()):
+        semester_key = parse_semester(filename)
+        if semester_key:
+            found.append((semester_key, filename))
+
+    return [filename for _, filename in sorted(found)]
+
+def get_data_directory_signature():
+    """Name, mtime and size of every data workbook; changes when a workbook is added, replaced or removed"""
+    signature = []
+    for filename in get_available_files():
+        stat = os.stat(get_data_file_path(filename))
+        signature.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def _get_manifest_path():
+    return os.path.join(get_cache_dir(), "manifest.json")
+
+def load_manifest():
+    """Load the ingest manifest: per workbook its mtime, size, content hash and ingest state"""
+    manifest_path = _get_manifest_path()
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get('schema') == CACHE_SCHEMA_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+    return {'schema': CACHE_SCHEMA_VERSION, 'files': {}}
+
+def update_manifest_entry(file_path, file_hash, ingested):
+    """Record the state of one workbook in the manifest"""
+    stat = os.stat(file_path)
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest['files'][os.path.basename(file_path)] = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': file_hash,
+            'ingested': ingested
+        }
+
+        def write_manifest(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f, indent=2)
+
+        _write_atomic(_get_manifest_path(), write_manifest)
+
+def sync_data_directory():
+    """Compare the data directory with the manifest and return workbooks that need ingesting.
+
+    Workbook yang mtime dan ukurannya sama dengan manifest tidak di-hash ulang
+    dan tidak di-parse; hash-nya langsung diambil dari manifest.
+    """
+    manifest = load_manifest()
+    changed = []
+    for filename in get_available_files():
+        file_path = get_data_file_path(filename)
+        stat = os.stat(file_path)
+        entry = manifest['files'].get(filename)
+
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            _file_hash_memo[(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)] = entry['hash']
+            if entry['ingested']:
+                continue
+        changed.append(file_path)
+
+    return changed
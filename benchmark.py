@@ -0,0 +1,315 @@
+"""Benchmark the data layer of the Madiun dashboard without Streamlit.
+
+Jalankan dengan: python benchmark.py [nama_benchmark ...]
+Tanpa argumen semua benchmark dijalankan.
+"""
+import sys
+import time
+import tracemalloc
+
+from backend import (
+    MadiunDataVisualizer, get_available_files, get_data_file_path,
+    get_filter_result_cache, default_filter_args, get_summary_level, NUMERIC_DTYPES
+)
+
+# ============= ALAT UKUR =============
+
+def measure_allocations(func, repeat=5, setup=None):
+    """Run func and return (peak bytes allocated during one call, bytes still held by its result)"""
+    func()  # pemanasan: indeks lokasi dan cache lain sudah terbentuk
+    peak = 0
+    retained = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        result = func()
+        current, call_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = max(peak, call_peak)
+        retained = max(retained, current)
+        del result
+    return peak, retained
+
+def format_bytes(n_bytes):
+    return f"{n_bytes / 1024:,.1f} KB"
+
+# ============= BENCHMARK FILTER =============
+
+def legacy_filter(df, kecamatan, columns):
+    """The filter path before the location index: full copy or boolean mask, then a column copy"""
+    if kecamatan == 'ALL':
+        filtered_df = df.copy()
+    else:
+        filtered_df = df[df['KECAMATAN'] == kecamatan]
+    return filtered_df[columns]
+
+def benchmark_filters():
+    """Bytes allocated per get_filtered_df call: legacy copy/mask path, filter factory on a cache miss, cache hit"""
+    print("Alokasi memori per panggilan filter (puncak / ditahan hasil)")
+    print(f"{'lembar':<32} {'kecamatan':<12} {'sebelum':>24} {'sesudah':>24} {'cache hit':>24}")
+    result_cache = get_filter_result_cache()
+
+    for file_name in get_available_files():
+        visualizer = MadiunDataVisualizer(get_data_file_path(file_name))
+        for sheet_name in visualizer.sheet_names:
+            sheet_type = visualizer.get_sheet_profile(sheet_name)['sheet_type']
+            add_filters = getattr(visualizer, f"add_{sheet_type}_filters", None)
+            if add_filters is None:
+                continue
+
+            df = visualizer.load_sheet(sheet_name)
+            filter_data = add_filters(df)
+            for kecamatan in ['ALL', filter_data['kecamatan_list'][1]]:
+                args = default_filter_args(sheet_type, filter_data, kecamatan)
+                if args is None:
+                    continue
+                columns = list(filter_data['get_filtered_df'](*args).columns)
+
+                before = measure_allocations(lambda: legacy_filter(df, kecamatan, columns))
+                after = measure_allocations(lambda: filter_data['get_filtered_df'](*args), setup=result_cache.clear)
+                cached = measure_allocations(lambda: filter_data['get_filtered_df'](*args))
+
+                print(
+                    f"{sheet_name.strip()[:32]:<32} {str(kecamatan)[:12]:<12} "
+                    f"{format_bytes(before[0]):>11} /{format_bytes(before[1]):>11} "
+                    f"{format_bytes(after[0]):>11} /{format_bytes(after[1]):>11} "
+                    f"{format_bytes(cached[0]):>11} /{format_bytes(cached[1]):>11}"
+                )
+
+    stats = result_cache.stats()
+    print(f"Cache filter: {stats['hits']} hit, {stats['misses']} miss, hit rate {stats['hit_rate'] * 100:.0f}%")
+
+# ============= BENCHMARK BATCH =============
+
+def per_selection_summaries(visualizer, selections):
+    """One selection at a time, as clicking through the sidebar: build filters, filter, groupby"""
+    results = {}
+    for selection in selections:
+        sheet_name, kecamatan, args = selection[0], selection[1], selection[2:]
+        df = visualizer.load_sheet(sheet_name)
+        sheet_type = visualizer.get_sheet_profile(sheet_name)['sheet_type']
+        filter_data = getattr(visualizer, f"add_{sheet_type}_filters")(df)
+        data = filter_data['get_filtered_df']([kecamatan], *[list(arg) if isinstance(arg, tuple) else arg for arg in args])
+        numeric_cols = list(data.select_dtypes(include=NUMERIC_DTYPES).columns)
+        by = get_summary_level(data)
+        results[selection] = data.groupby(by, observed=True)[numeric_cols].sum().reset_index()
+    return results
+
+def benchmark_batch():
+    """Time evaluate_filters over every kecamatan x every sheet against one selection at a time"""
+    print(f"{'file':<24} {'seleksi':>8} {'satu per satu':>14} {'batch':>10}")
+    for file_name in get_available_files():
+        visualizer = MadiunDataVisualizer(get_data_file_path(file_name))
+        selections = visualizer.default_selections()
+        visualizer.evaluate_filters(selections)  # pemanasan: lembar dan kubus sudah dimuat
+
+        get_filter_result_cache().clear()
+        start = time.perf_counter()
+        per_selection_summaries(visualizer, selections)
+        one_by_one = time.perf_counter() - start
+
+        get_filter_result_cache().clear()
+        start = time.perf_counter()
+        visualizer.evaluate_filters(selections)
+        batch = time.perf_counter() - start
+
+        print(f"{file_name[:24]:<24} {len(selections):>8} {one_by_one * 1000:>11.1f} ms {batch * 1000:>7.1f} ms")
+
+# ============= BENCHMARK GRAFIK 3D =============
+
+def legacy_3d_figure(merged_df, selected_cols, file1, file2):
+    """The 3D comparison before batching: two Scatter3d traces per kecamatan, column and file"""
+    import plotly.graph_objs as go
+
+    fig_3d = go.Figure()
+    for col_idx, col in enumerate(selected_cols):
+        for file_idx, (file_name, color) in enumerate([(file1, '#1f77b4'), (file2, '#ff7f0e')]):
+            y_pos = col_idx * 2 + file_idx
+            for kec_idx, kecamatan in enumerate(merged_df.index):
+                value = merged_df.loc[kecamatan, f'{col} ({file_name})']
+                fig_3d.add_trace(go.Scatter3d(
+                    x=[kec_idx] * 5,
+                    y=[y_pos, y_pos, y_pos + 0.8, y_pos + 0.8, y_pos],
+                    z=[0, value, value, 0, 0],
+                    mode='lines',
+                    line=dict(color=color, width=4),
+                    surfaceaxis=0,
+                    name=f'{col} - {file_name}' if kec_idx == 0 else None,
+                    showlegend=kec_idx == 0,
+                    hoverinfo='text',
+                    hovertext=f'{kecamatan} - {col}: {value} ({file_name})'
+                ))
+                fig_3d.add_trace(go.Scatter3d(
+                    x=[kec_idx],
+                    y=[y_pos + 0.4],
+                    z=[value],
+                    mode='markers',
+                    marker=dict(size=4, color=color),
+                    showlegend=False,
+                    hoverinfo='text',
+                    hovertext=f'{kecamatan} - {col}: {value} ({file_name})'
+                ))
+    return fig_3d
+
+def time_call(func, repeat=3):
+    """Best wall time of func over a few runs, with its last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def benchmark_chart3d():
+    """Build time, trace count and JSON payload of the 3D comparison: per-bar traces vs batched series"""
+    # app.py hanya menjalankan main() bila dijalankan langsung
+    from app import create_3d_comparison_figure
+    from data_store import get_semester_store
+
+    files = get_available_files()
+    if len(files) < 2:
+        print("Perlu minimal dua file data untuk perbandingan")
+        return
+
+    store = get_semester_store()
+    store.sync()
+    file1, file2 = files[0], files[1]
+    print(f"{'lembar':<24} {'kolom':>5} {'trace':>11} {'waktu bangun':>22} {'payload JSON':>26}")
+    for sheet_name in store.common_sheets([file1, file2]):
+        indicators = store.common_indicators(sheet_name, [file1, file2])
+        for selected_cols in [indicators[:4], indicators[:12]]:
+            merged_df = store.compare_semesters(sheet_name, file1, file2, selected_cols)
+            before_time, before_fig = time_call(lambda: legacy_3d_figure(merged_df, selected_cols, file1, file2))
+            after_time, after_fig = time_call(
+                lambda: create_3d_comparison_figure(merged_df, selected_cols, file1, file2, sheet_name)
+            )
+            before_size = len(before_fig.to_json())
+            after_size = len(after_fig.to_json())
+            print(
+                f"{sheet_name.strip()[:24]:<24} {len(selected_cols):>5} "
+                f"{len(before_fig.data):>5} ->{len(after_fig.data):>4} "
+                f"{before_time * 1000:>8.1f} ->{after_time * 1000:>7.1f} ms "
+                f"{format_bytes(before_size):>11} ->{format_bytes(after_size):>11}"
+            )
+
+# ============= BENCHMARK CACHE GRAFIK =============
+
+def benchmark_figures():
+    """Time create_visualizations for the default view of each sheet: all charts with an empty and a warm
+    figure cache, and the on-demand page where only the first chart is built"""
+    # Tanpa server Streamlit, st.plotly_chart tetap menyusun spesifikasi JSON seperti aslinya
+    from app import create_visualizations
+    from backend import get_figure_cache
+
+    print(f"{'file':<24} {'lembar':<28} {'cache kosong':>14} {'cache hangat':>14} {'sesuai permintaan':>18}")
+    for file_name in get_available_files():
+        visualizer = MadiunDataVisualizer(get_data_file_path(file_name))
+        results = visualizer.evaluate_filters(sheet_names=visualizer.sheet_names)
+        for (sheet_name, kecamatan, *_), result in results.items():
+            if kecamatan != 'ALL':
+                continue
+            cube = visualizer.load_sheet_cube(sheet_name)
+
+            def render():
+                create_visualizations(result['data'], sheet_name, cube, lazy=False)
+
+            def render_cold():
+                get_figure_cache().clear()
+                render()
+
+            def render_on_demand():
+                get_figure_cache().clear()
+                create_visualizations(result['data'], sheet_name, cube)
+
+            cold, _ = time_call(render_cold)
+            warm, _ = time_call(render)
+            on_demand, _ = time_call(render_on_demand)
+            print(
+                f"{file_name[:24]:<24} {sheet_name.strip()[:28]:<28} {cold * 1000:>11.1f} ms "
+                f"{warm * 1000:>11.1f} ms {on_demand * 1000:>15.1f} ms"
+            )
+
+    stats = get_figure_cache().stats()
+    print(f"Cache grafik: {stats['sheets']} grafik, {format_bytes(stats['bytes'])}")
+
+# ============= BENCHMARK GRAFIK DESA =============
+
+def benchmark_desa_charts():
+    """Build time and JSON payload of desa-level bar, line and heatmap charts: plotly express vs the WebGL path"""
+    from app import (
+        create_location_bar_figure, create_location_line_figure, create_location_heatmap_figure,
+        reduce_for_chart, use_webgl, WEBGL_MIN_CELLS
+    )
+    from sheet_kernel import group_sum_frame
+
+    charts = {
+        'bar': lambda plot_df, webgl: create_location_bar_figure(plot_df, 'bar', webgl),
+        'line': lambda plot_df, webgl: create_location_line_figure(plot_df, 'line', webgl),
+        'heatmap': lambda plot_df, webgl: create_location_heatmap_figure(plot_df, 'heatmap', 'Desa', webgl)
+    }
+    print(f"Ambang WebGL: lebih dari {WEBGL_MIN_CELLS} sel")
+    print(f"{'lembar':<24} {'tampilan':<18} {'grafik':<8} {'sel':>6} {'otomatis':<9} "
+          f"{'waktu bangun (px -> webgl)':>28} {'payload JSON':>24}")
+    for file_name in get_available_files()[:1]:
+        visualizer = MadiunDataVisualizer(get_data_file_path(file_name))
+        for sheet_name in visualizer.sheet_names:
+            df = visualizer.load_sheet(sheet_name)
+            numeric_cols = list(df.select_dtypes(include=NUMERIC_DTYPES).columns)
+            if 'KECAMATAN' not in df.columns or 'DESA' not in df.columns or len(numeric_cols) < 2:
+                continue
+
+            # Desa dengan nama sama di kecamatan berbeda tetap terpisah, seperti tampilan per desa di dashboard
+            desa_df = group_sum_frame(df, ['KECAMATAN', 'DESA'], numeric_cols)
+            kecamatan_views = [
+                view.drop(columns='KECAMATAN').set_index('DESA')
+                for _, view in desa_df.groupby('KECAMATAN', observed=True)
+            ]
+            kabupaten_view = desa_df.assign(
+                DESA=desa_df['DESA'].astype(str) + ' (' + desa_df['KECAMATAN'].astype(str) + ')'
+            ).drop(columns='KECAMATAN').set_index('DESA')
+
+            for kind, build in charts.items():
+                # Tampilan dashboard (per kecamatan, dengan top-N) dan seluruh desa kabupaten tanpa top-N
+                cases = [
+                    ('kecamatan, top-N', [reduce_for_chart(view, kind) for view in kecamatan_views]),
+                    ('kabupaten, semua', [kabupaten_view])
+                ]
+                for view_label, views in cases:
+                    timings = {False: 0.0, True: 0.0}
+                    sizes = {False: 0, True: 0}
+                    for view in views:
+                        for webgl in (False, True):
+                            elapsed, fig = time_call(lambda: build(view, webgl), repeat=1)
+                            timings[webgl] += elapsed
+                            sizes[webgl] += len(fig.to_json())
+                    max_cells = max(view.size for view in views)
+                    engaged = sum(use_webgl(view) for view in views)
+                    print(
+                        f"{sheet_name.strip()[:24]:<24} {view_label:<18} {kind:<8} {max_cells:>6} "
+                        f"{engaged:>3}/{len(views):<5} "
+                        f"{timings[False] * 1000:>12.1f} ->{timings[True] * 1000:>8.1f} ms "
+                        f"{format_bytes(sizes[False]):>10} ->{format_bytes(sizes[True]):>10}"
+                    )
+
+# ============= MAIN =============
+
+BENCHMARKS = {
+    'filters': benchmark_filters,
+    'batch': benchmark_batch,
+    'chart3d': benchmark_chart3d,
+    'figures': benchmark_figures,
+    'desa': benchmark_desa_charts
+}
+
+def main(names):
+    for name in names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            print(f"Benchmark tidak dikenal: {name}. Pilihan: {', '.join(BENCHMARKS)}")
+            continue
+        print(f"\n=== {name} ===")
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
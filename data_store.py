@@ -0,0 +1,432 @@
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from backend import (
+    get_cache_dir, get_available_files, get_data_file_path, parse_semester,
+    compute_file_hash, get_sheet_names, load_sheet, load_sheet_cube, get_cube_level,
+    LOCATION_COLUMNS, CUBE_ROWS_COLUMN
+)
+from sheet_kernel import safe_divide, share_of_total
+
+# ============= PENYIMPANAN DATA ANTAR SEMESTER =============
+
+# Naikkan versi ini bila struktur tabel berubah; database lama akan dibangun ulang
+STORE_SCHEMA_VERSION = 2
+
+STORE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS semesters (
+        semester TEXT PRIMARY KEY,
+        file_hash TEXT NOT NULL,
+        year INTEGER,
+        semester_order INTEGER,
+        label TEXT,
+        loaded_at REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS sheets (
+        semester TEXT NOT NULL,
+        sheet TEXT NOT NULL,
+        position INTEGER,
+        has_kecamatan INTEGER,
+        PRIMARY KEY (semester, sheet)
+    )""",
+    """CREATE TABLE IF NOT EXISTS sheet_indicators (
+        semester TEXT NOT NULL,
+        sheet TEXT NOT NULL,
+        indicator TEXT NOT NULL,
+        position INTEGER,
+        is_integer INTEGER,
+        PRIMARY KEY (semester, sheet, indicator)
+    )""",
+    # Format panjang: satu baris per desa per indikator
+    """CREATE TABLE IF NOT EXISTS sheet_values (
+        semester TEXT NOT NULL,
+        sheet TEXT NOT NULL,
+        kecamatan TEXT,
+        desa TEXT,
+        indicator TEXT NOT NULL,
+        value REAL
+    )""",
+    # Total per kecamatan dan kabupaten dari kubus lembar (level KECAMATAN/KABUPATEN)
+    """CREATE TABLE IF NOT EXISTS sheet_totals (
+        semester TEXT NOT NULL,
+        sheet TEXT NOT NULL,
+        level TEXT NOT NULL,
+        kecamatan TEXT,
+        indicator TEXT NOT NULL,
+        value REAL
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_sheet_totals_lookup
+        ON sheet_totals (sheet, level, indicator, semester, kecamatan)""",
+    """CREATE INDEX IF NOT EXISTS idx_sheet_values_lookup
+        ON sheet_values (sheet, indicator, semester, kecamatan)""",
+    """CREATE INDEX IF NOT EXISTS idx_sheet_values_semester
+        ON sheet_values (semester)"""
+]
+
+def get_store_path():
+    """Get the path of the embedded SQLite database with all ingested semesters"""
+    return os.path.join(get_cache_dir(), "semester_store.sqlite")
+
+def _location_value(value):
+    if pd.isna(value):
+        return None
+    return str(value)
+
+class SemesterStore:
+    """Long-format store of every ingested sheet, keyed by semester, sheet, kecamatan, desa and indicator.
+
+    Semester adalah nama file workbook (mis. STAT_SMT_I_2024.xlsx), sama dengan
+    yang dipilih pengguna di halaman perbandingan.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_store_path()
+        self._write_lock = threading.Lock()
+        self._init_schema()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != STORE_SCHEMA_VERSION:
+                for table in ['sheet_totals', 'sheet_values', 'sheet_indicators', 'sheets', 'semesters']:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+            for statement in STORE_SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {STORE_SCHEMA_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------- Pemuatan data ----------
+
+    def sync(self):
+        """Load new or changed semester workbooks from the data directory; returns the loaded file names"""
+        current = {}
+        for filename in get_available_files():
+            current[filename] = compute_file_hash(get_data_file_path(filename))
+
+        conn = self._connect()
+        try:
+            stored = dict(conn.execute("SELECT semester, file_hash FROM semesters").fetchall())
+            if stored == current:
+                return []
+
+            loaded = []
+            with self._write_lock:
+                # BEGIN IMMEDIATE mengunci database sehingga dua sesi tidak memuat semester yang sama
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    stored = dict(conn.execute("SELECT semester, file_hash FROM semesters").fetchall())
+                    for semester in set(stored) - set(current):
+                        self._delete_semester(conn, semester)
+                    for filename, file_hash in current.items():
+                        if stored.get(filename) != file_hash:
+                            self._load_workbook(conn, filename, file_hash)
+                            loaded.append(filename)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            return loaded
+        finally:
+            conn.close()
+
+    def _delete_semester(self, conn, semester):
+        for table in ['sheet_totals', 'sheet_values', 'sheet_indicators', 'sheets', 'semesters']:
+            conn.execute(f"DELETE FROM {table} WHERE semester = ?", (semester,))
+
+    def _load_workbook(self, conn, filename, file_hash):
+        file_path = get_data_file_path(filename)
+        self._delete_semester(conn, filename)
+
+        year, semester_order, semester = parse_semester(filename)
+        conn.execute(
+            "INSERT INTO semesters VALUES (?, ?, ?, ?, ?, ?)",
+            (filename, file_hash, year, semester_order, f"SMT {semester} {year}", time.time())
+        )
+
+        for position, sheet_name in enumerate(get_sheet_names(file_path, file_hash)):
+            df = load_sheet(file_path, sheet_name, file_hash)
+            self._insert_sheet(conn, filename, sheet_name, position, df)
+            cube = load_sheet_cube(file_path, sheet_name, file_hash)
+            self._insert_totals(conn, filename, sheet_name, cube)
+
+    def _insert_sheet(self, conn, semester, sheet_name, position, df):
+        indicators = [
+            col for col in df.columns
+            if col not in LOCATION_COLUMNS
+            and pd.api.types.is_numeric_dtype(df[col])
+            and not pd.api.types.is_bool_dtype(df[col])
+        ]
+
+        conn.execute(
+            "INSERT INTO sheets VALUES (?, ?, ?, ?)",
+            (semester, sheet_name, position, int('KECAMATAN' in df.columns))
+        )
+        conn.executemany(
+            "INSERT INTO sheet_indicators VALUES (?, ?, ?, ?, ?)",
+            [
+                (semester, sheet_name, col, col_position, int(pd.api.types.is_integer_dtype(df[col])))
+                for col_position, col in enumerate(indicators)
+            ]
+        )
+        if not indicators:
+            return
+
+        kecamatan = [_location_value(v) for v in df['KECAMATAN']] if 'KECAMATAN' in df.columns else [None] * len(df)
+        desa = [_location_value(v) for v in df['DESA']] if 'DESA' in df.columns else [None] * len(df)
+        values = df[indicators].to_numpy(dtype='float64')
+
+        def rows():
+            for row_idx in range(len(df)):
+                row_values = values[row_idx]
+                for col_idx, col in enumerate(indicators):
+                    value = row_values[col_idx]
+                    yield (semester, sheet_name, kecamatan[row_idx], desa[row_idx], col,
+                           None if value != value else float(value))
+
+        conn.executemany("INSERT INTO sheet_values VALUES (?, ?, ?, ?, ?, ?)", rows())
+
+    def _insert_totals(self, conn, semester, sheet_name, cube):
+        def rows():
+            for level in ['KECAMATAN', 'KABUPATEN']:
+                level_df = get_cube_level(cube, level)
+                indicators = [col for col in level_df.columns if col != CUBE_ROWS_COLUMN and col not in LOCATION_COLUMNS]
+                kecamatan = [_location_value(v) for v in level_df['KECAMATAN']] if level == 'KECAMATAN' else [None] * len(level_df)
+                values = level_df[indicators].to_numpy(dtype='float64')
+                for row_idx in range(len(level_df)):
+                    for col_idx, col in enumerate(indicators):
+                        value = values[row_idx, col_idx]
+                        yield (semester, sheet_name, level, kecamatan[row_idx], col,
+                               None if value != value else float(value))
+
+        conn.executemany("INSERT INTO sheet_totals VALUES (?, ?, ?, ?, ?, ?)", rows())
+
+    # ---------- Query ----------
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def list_semesters(self):
+        """List (semester, label) pairs, oldest first"""
+        return self._query("SELECT semester, label FROM semesters ORDER BY year, semester_order, semester")
+
+    def common_sheets(self, semesters):
+        """List the sheet names present in every given semester, sorted"""
+        placeholders = ", ".join("?" * len(semesters))
+        rows = self._query(
+            f"""SELECT sheet FROM sheets WHERE semester IN ({placeholders})
+                GROUP BY sheet HAVING COUNT(DISTINCT semester) = ? ORDER BY sheet""",
+            (*semesters, len(set(semesters)))
+        )
+        return [row[0] for row in rows]
+
+    def common_indicators(self, sheet_name, semesters):
+        """List the numeric columns of a sheet present in every given semester, sorted"""
+        placeholders = ", ".join("?" * len(semesters))
+        rows = self._query(
+            f"""SELECT indicator FROM sheet_indicators WHERE sheet = ? AND semester IN ({placeholders})
+                GROUP BY indicator HAVING COUNT(DISTINCT semester) = ? ORDER BY indicator""",
+            (sheet_name, *semesters, len(set(semesters)))
+        )
+        return [row[0] for row in rows]
+
+    def _integer_indicators(self, sheet_name, semesters, indicators):
+        placeholders = ", ".join("?" * len(semesters))
+        ind_placeholders = ", ".join("?" * len(indicators))
+        rows = self._query(
+            f"""SELECT indicator FROM sheet_indicators
+                WHERE sheet = ? AND semester IN ({placeholders}) AND indicator IN ({ind_placeholders})
+                GROUP BY indicator HAVING MIN(is_integer) = 1""",
+            (sheet_name, *semesters, *indicators)
+        )
+        return {row[0] for row in rows}
+
+    def _has_kecamatan(self, sheet_name, semesters):
+        placeholders = ", ".join("?" * len(semesters))
+        row = self._query(
+            f"SELECT MIN(has_kecamatan) FROM sheets WHERE sheet = ? AND semester IN ({placeholders})",
+            (sheet_name, *semesters)
+        )[0]
+        return bool(row[0])
+
+    def _totals(self, sheet_name, semester, indicators, group_by_kecamatan):
+        # Dibaca langsung dari total kubus; tidak ada penjumlahan ulang per desa
+        ind_placeholders = ", ".join("?" * len(indicators))
+        if group_by_kecamatan:
+            rows = self._query(
+                f"""SELECT kecamatan, indicator, value FROM sheet_totals
+                    WHERE sheet = ? AND semester = ? AND level = 'KECAMATAN'
+                      AND indicator IN ({ind_placeholders}) AND kecamatan IS NOT NULL""",
+                (sheet_name, semester, *indicators)
+            )
+        else:
+            rows = self._query(
+                f"""SELECT 0, indicator, value FROM sheet_totals
+                    WHERE sheet = ? AND semester = ? AND level = 'KABUPATEN'
+                      AND indicator IN ({ind_placeholders})""",
+                (sheet_name, semester, *indicators)
+            )
+
+        totals = pd.DataFrame(rows, columns=['KECAMATAN', 'indicator', 'value'])
+        totals = totals.pivot(index='KECAMATAN', columns='indicator', values='value')
+        totals.columns.name = None
+        return totals.reindex(columns=list(indicators)).sort_index()
+
+    def has_desa(self, sheet_name, semesters):
+        """Whether every given semester has desa-level rows for the sheet"""
+        for semester in semesters:
+            row = self._query(
+                """SELECT 1 FROM sheet_values
+                    WHERE sheet = ? AND semester = ? AND kecamatan IS NOT NULL AND desa IS NOT NULL LIMIT 1""",
+                (sheet_name, semester)
+            )
+            if not row:
+                return False
+        return True
+
+    def _desa_totals(self, sheet_name, semester, indicators):
+        # Baris desa yang sama (mis. baris ganda di workbook) dijumlah seperti groupby
+        ind_placeholders = ", ".join("?" * len(indicators))
+        rows = self._query(
+            f"""SELECT kecamatan, desa, indicator, TOTAL(value) FROM sheet_values
+                WHERE sheet = ? AND semester = ? AND indicator IN ({ind_placeholders})
+                  AND kecamatan IS NOT NULL AND desa IS NOT NULL
+                GROUP BY kecamatan, desa, indicator""",
+            (sheet_name, semester, *indicators)
+        )
+
+        totals = pd.DataFrame(rows, columns=['KECAMATAN', 'DESA', 'indicator', 'value'])
+        totals = totals.pivot(index=['KECAMATAN', 'DESA'], columns='indicator', values='value')
+        totals.columns.name = None
+        return totals.reindex(columns=list(indicators)).sort_index()
+
+    def compare_semesters(self, sheet_name, semester1, semester2, indicators, level='KECAMATAN'):
+        """Sum the indicators per kecamatan (or per desa) for two semesters, one column per indicator and semester.
+
+        Hasilnya sama dengan merge groupby('KECAMATAN').sum() kedua file: hanya
+        kecamatan yang ada di kedua semester, kolom bernama '<indikator> (<file>)'.
+        Dengan level='DESA' indeksnya (KECAMATAN, DESA) dan hanya desa yang ada
+        di kedua semester yang dipertahankan.
+        """
+        indicators = list(indicators)
+        semesters = [semester1, semester2]
+        if level == 'DESA':
+            totals1 = self._desa_totals(sheet_name, semester1, indicators)
+            totals2 = self._desa_totals(sheet_name, semester2, indicators)
+            group_by_kecamatan = True
+        else:
+            group_by_kecamatan = self._has_kecamatan(sheet_name, semesters)
+            totals1 = self._totals(sheet_name, semester1, indicators, group_by_kecamatan)
+            totals2 = self._totals(sheet_name, semester2, indicators, group_by_kecamatan)
+
+        # Kedua semester diselaraskan lewat join indeks (kecamatan atau kecamatan+desa)
+        merged_df = totals1.join(totals2, how='inner', lsuffix=f' ({semester1})', rsuffix=f' ({semester2})')
+        if not group_by_kecamatan:
+            merged_df = merged_df.reset_index(drop=True)
+
+        # SQLite menjumlah sebagai REAL; kembalikan ke bilangan bulat seperti hasil pandas.
+        # Indikator yang tidak tercatat untuk suatu lokasi bernilai 0, seperti groupby().sum()
+        integer_columns = [
+            f'{col} ({semester})'
+            for col in self._integer_indicators(sheet_name, semesters, indicators)
+            for semester in semesters
+        ]
+        if integer_columns:
+            merged_df[integer_columns] = merged_df[integer_columns].fillna(0).astype('int64')
+        return merged_df
+
+    def semester_totals(self, sheet_name, indicators, kecamatan=None, desa=None):
+        """Sum the indicators of a sheet per semester, optionally limited to some kecamatan/desa.
+
+        Baris diurutkan dari semester terlama; indeks berisi label semester.
+        Tanpa batasan desa, total dibaca dari kubus (level kecamatan/kabupaten);
+        subset desa dijumlah dari nilai per desa.
+        """
+        indicators = list(indicators)
+        conditions = ["v.sheet = ?", f"v.indicator IN ({', '.join('?' * len(indicators))})"]
+        params = [sheet_name, *indicators]
+        if desa is None:
+            table = "sheet_totals"
+            conditions.append("v.level = ?")
+            params.append('KABUPATEN' if kecamatan is None else 'KECAMATAN')
+        else:
+            table = "sheet_values"
+        if kecamatan is not None:
+            conditions.append(f"v.kecamatan IN ({', '.join('?' * len(kecamatan))})")
+            params.extend(kecamatan)
+        if desa is not None:
+            conditions.append(f"v.desa IN ({', '.join('?' * len(desa))})")
+            params.extend(desa)
+
+        rows = self._query(
+            f"""SELECT s.label, v.indicator, TOTAL(v.value) FROM {table} v
+                JOIN semesters s ON s.semester = v.semester
+                WHERE {' AND '.join(conditions)}
+                GROUP BY s.year, s.semester_order, v.semester, v.indicator
+                ORDER BY s.year, s.semester_order, v.semester""",
+            params
+        )
+
+        totals = pd.DataFrame(rows, columns=['SEMESTER', 'indicator', 'value'])
+        labels = list(dict.fromkeys(totals['SEMESTER']))
+        totals = totals.pivot(index='SEMESTER', columns='indicator', values='value')
+        totals.columns.name = None
+        return totals.reindex(index=labels, columns=indicators)
+
+# ============= ANALISIS PERUBAHAN =============
+
+def compute_changes(merged_df, indicators, semester1, semester2, share_within=None):
+    """Absolute, percentage and share-of-total change of every indicator between two semesters.
+
+    merged_df adalah hasil compare_semesters. Porsi dihitung terhadap total
+    kolom per semester, atau per kelompok indeks share_within (mis. 'KECAMATAN'
+    pada tingkat desa). Pembagian dengan nol menghasilkan NaN.
+    """
+    indicators = list(indicators)
+    before = merged_df[[f'{col} ({semester1})' for col in indicators]].to_numpy()
+    after = merged_df[[f'{col} ({semester2})' for col in indicators]].to_numpy()
+
+    difference = after - before
+    percent = np.round(safe_divide(difference, before) * 100, 2)
+
+    if share_within is None:
+        share_change = share_of_total(after, 'column') - share_of_total(before, 'column')
+    else:
+        # Total kelompok disebar kembali ke setiap baris lewat kode kelompok
+        codes, _ = pd.factorize(merged_df.index.get_level_values(share_within))
+        total_before = np.zeros((codes.max() + 1 if len(codes) else 0, len(indicators)))
+        total_after = np.zeros_like(total_before)
+        np.add.at(total_before, codes, before)
+        np.add.at(total_after, codes, after)
+        share_change = (safe_divide(after, total_after[codes]) - safe_divide(before, total_before[codes])) * 100
+    share_change = np.round(share_change, 2)
+
+    changes = {}
+    for col_idx, col in enumerate(indicators):
+        changes[f'Perubahan {col}'] = difference[:, col_idx]
+        changes[f'% Perubahan {col}'] = percent[:, col_idx]
+        changes[f'Perubahan Porsi {col} (poin %)'] = share_change[:, col_idx]
+    return pd.DataFrame(changes, index=merged_df.index)
+
+_semester_store = None
+_semester_store_lock = threading.Lock()
+
+def get_semester_store():
+    """Get the process-wide semester store"""
+    global _semester_store
+    with _semester_store_lock:
+        if _semester_store is None:
+            _semester_store = SemesterStore()
+        return _semester_store
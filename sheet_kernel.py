@@ -0,0 +1,258 @@
+"""Group-sum kernel: one sheet as a contiguous desa x indicator count matrix.
+
+Semua agregasi dashboard (total kecamatan, total sektor, kategori umur, rasio)
+adalah jumlah atas kelompok baris dan kelompok kolom dari matriks yang sama.
+Baris diurutkan per kelompok lokasi sehingga jumlah per kelompok cukup satu
+np.add.reduceat; kelompok kolom dijumlah dengan matriks keanggotaan 0/1.
+"""
+import numpy as np
+import pandas as pd
+
+# ============= KELOMPOK BARIS =============
+
+def _key_codes(series):
+    """Integer codes (-1 for missing) of a key column plus what is needed to decode them"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Urutan kategori = urutan hasil groupby pada kolom categorical
+        return series.cat.codes.to_numpy().astype(np.int64), series.dtype
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), uniques
+
+def _decode_keys(codes, decoder):
+    if isinstance(decoder, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(codes, dtype=decoder)
+    return decoder.take(codes)
+
+def build_row_groups(df, by):
+    """Sort order, start offsets and key labels of the row groups of df.
+
+    by adalah daftar kolom kunci (mis. ['KECAMATAN'] atau ['KECAMATAN', 'DESA']);
+    kosong berarti satu kelompok berisi semua baris. Seperti groupby, baris
+    dengan kunci kosong dibuang dan kelompok diurutkan menurut kuncinya.
+    """
+    n_rows = len(df)
+    if not by:
+        offsets = np.zeros(1 if n_rows else 0, dtype=np.intp)
+        return np.arange(n_rows), offsets, pd.DataFrame(index=range(len(offsets)))
+
+    combined = np.zeros(n_rows, dtype=np.int64)
+    valid = np.ones(n_rows, dtype=bool)
+    keys = []
+    for col in by:
+        codes, decoder = _key_codes(df[col])
+        n_codes = len(decoder.categories) if isinstance(decoder, pd.CategoricalDtype) else len(decoder)
+        combined = combined * max(n_codes, 1) + codes
+        valid &= codes >= 0
+        keys.append((col, codes, decoder))
+
+    rows = np.flatnonzero(valid)
+    order = rows[np.argsort(combined[rows], kind='stable')]
+    sorted_codes = combined[order]
+    if len(order):
+        offsets = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    else:
+        offsets = np.zeros(0, dtype=np.intp)
+
+    first_rows = order[offsets]
+    labels = pd.DataFrame({col: _decode_keys(codes[first_rows], decoder) for col, codes, decoder in keys})
+    return order, offsets, labels
+
+# ============= KELOMPOK KOLOM =============
+
+def membership_matrix(n_columns, column_groups):
+    """0/1 matrix (columns x groups) from a list of column-position arrays, one per group"""
+    membership = np.zeros((n_columns, len(column_groups)))
+    for group_idx, positions in enumerate(column_groups):
+        membership[np.asarray(positions, dtype=np.intp), group_idx] = 1.0
+    return membership
+
+# ============= PEMBAGIAN AMAN =============
+
+def safe_divide(numerator, denominator):
+    """Element-wise numerator / denominator as float64, NaN where the denominator is zero or missing"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    result = np.full(np.broadcast_shapes(numerator.shape, denominator.shape), np.nan)
+    # Pembagi kosong (NaN) tetap menghasilkan NaN lewat pembagian biasa
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+# ============= PORSI TERHADAP TOTAL =============
+
+SHARE_AXES = {'row': 1, 'column': 0, 'total': None}
+
+def share_of_total(values, within='row'):
+    """Percentage of each cell in its row total, column total or the grand total; NaN where that total is zero"""
+    values = np.asarray(values, dtype=np.float64)
+    totals = np.nansum(values, axis=SHARE_AXES[within], keepdims=True)
+    return safe_divide(values, totals) * 100
+
+def share_frame(df, within='row', columns=None):
+    """share_of_total of some numeric columns of df, as a DataFrame with the same index and column names"""
+    columns = list(df.columns if columns is None else columns)
+    return pd.DataFrame(share_of_total(df[columns].to_numpy(), within), index=df.index, columns=columns)
+
+# ============= TOP-N DAN LAINNYA =============
+
+OTHER_LABEL = 'LAINNYA'
+
+def top_n_positions(totals, n):
+    """Positions of the n largest totals in their original order; all positions if n is None or covers them"""
+    if n is not None and n < 1:
+        raise ValueError(f"Jumlah teratas minimal 1, bukan {n}")
+    totals = np.nan_to_num(np.asarray(totals, dtype=np.float64))
+    # Melipat satu kolom saja ke LAINNYA tidak mengurangi apa pun
+    if n is None or len(totals) <= n + 1:
+        return np.arange(len(totals))
+    return np.sort(np.argpartition(-totals, n - 1)[:n])
+
+def fold_top_n(values, n_columns=None, n_rows=None):
+    """Keep the top-N columns and rows of a matrix by total and sum the rest into one last column/row.
+
+    Mengembalikan (matriks, posisi kolom yang dipertahankan, posisi baris yang
+    dipertahankan); kolom/baris LAINNYA ada bila posisi yang dipertahankan
+    lebih sedikit dari aslinya.
+    """
+    values = np.asarray(values)
+    filled = np.nan_to_num(values) if values.dtype.kind == 'f' else values
+    columns = top_n_positions(filled.sum(axis=0), n_columns)
+    rows = top_n_positions(filled.sum(axis=1), n_rows)
+
+    if len(columns) < values.shape[1]:
+        other = np.ones(values.shape[1], dtype=bool)
+        other[columns] = False
+        values = np.column_stack([values[:, columns], filled[:, other].sum(axis=1)])
+        filled = np.nan_to_num(values) if values.dtype.kind == 'f' else values
+    if len(rows) < values.shape[0]:
+        other = np.ones(values.shape[0], dtype=bool)
+        other[rows] = False
+        values = np.vstack([values[rows], filled[other].sum(axis=0)])
+    return values, columns, rows
+
+def fold_frame(df, n_columns=None, n_rows=None, other_label=OTHER_LABEL):
+    """fold_top_n on a frame of numeric columns indexed by location; returns df itself when nothing is folded"""
+    values, columns, rows = fold_top_n(df.to_numpy(), n_columns, n_rows)
+    if len(columns) == df.shape[1] and len(rows) == df.shape[0]:
+        return df
+
+    column_labels = list(df.columns[columns])
+    if len(columns) < df.shape[1]:
+        column_labels.append(other_label)
+    row_labels = list(df.index[rows])
+    if len(rows) < df.shape[0]:
+        row_labels.append(other_label)
+    return pd.DataFrame(values, index=pd.Index(row_labels, name=df.index.name), columns=column_labels)
+
+# ============= MATRIKS LEMBAR =============
+
+class SheetMatrix:
+    """Numeric columns of a sheet as one contiguous array, rows sorted by location group.
+
+    values: array (baris x kolom) int64 bila semua kolom bilangan bulat, selain
+    itu float64 dengan sel kosong dihitung 0 (seperti sum pada pandas).
+    offsets: posisi awal tiap kelompok baris; labels: kunci tiap kelompok.
+    """
+
+    def __init__(self, df, by, columns):
+        self.by = list(by or [])
+        self.columns = list(columns)
+        self.n_rows = len(df)
+        self.order, self.offsets, self.labels = build_row_groups(df, self.by)
+        self.integer_columns = [pd.api.types.is_integer_dtype(df[col]) for col in self.columns]
+
+        dtype = np.int64 if all(self.integer_columns) else np.float64
+        values = df[self.columns].to_numpy(dtype=dtype)
+        if dtype == np.float64:
+            values = np.nan_to_num(values, nan=0.0)
+        self.values = np.ascontiguousarray(values[self.order])
+
+    @property
+    def nbytes(self):
+        """Memory held by the value array and the row order"""
+        return self.values.nbytes + self.order.nbytes
+
+    def select(self, rows=None, columns=None):
+        """Sub-matrix of some rows (positions in the original frame) and columns, without re-sorting.
+
+        Kelompok baris tetap urut seperti matriks asal; kelompok yang tidak
+        punya baris terpilih dibuang, sama seperti SheetMatrix(df.iloc[rows], ...).
+        """
+        if rows is None and columns is None:
+            return self
+        matrix = SheetMatrix.__new__(SheetMatrix)
+        matrix.by = self.by
+        matrix.n_rows = self.n_rows
+        positions = np.arange(len(self.columns)) if columns is None else self.column_positions(columns)
+        matrix.columns = [self.columns[position] for position in positions]
+        matrix.integer_columns = [self.integer_columns[position] for position in positions]
+
+        if rows is None:
+            matrix.order, matrix.offsets, matrix.labels = self.order, self.offsets, self.labels
+            values = self.values[:, positions]
+        else:
+            selected = np.zeros(self.n_rows, dtype=bool)
+            selected[rows] = True
+            keep = selected[self.order]
+            if len(self.offsets):
+                counts = np.add.reduceat(keep.astype(np.intp), self.offsets)
+            else:
+                counts = np.zeros(0, dtype=np.intp)
+            non_empty = counts > 0
+            counts = counts[non_empty]
+            matrix.order = self.order[keep]
+            matrix.offsets = np.r_[0, np.cumsum(counts)[:-1]].astype(np.intp) if len(counts) else counts
+            matrix.labels = self.labels[non_empty].reset_index(drop=True)
+            values = self.values[np.ix_(np.flatnonzero(keep), positions)]
+
+        # Kolom terpilih semuanya bilangan bulat: kembali ke int64 seperti matriks yang dibangun langsung
+        if all(matrix.integer_columns) and values.dtype != np.int64:
+            values = values.astype(np.int64)
+        matrix.values = np.ascontiguousarray(values)
+        return matrix
+
+    def row_counts(self):
+        """Number of sheet rows in each row group"""
+        return np.diff(np.r_[self.offsets, len(self.values)])
+
+    def column_positions(self, columns):
+        """Positions of the given columns in this matrix"""
+        lookup = {col: position for position, col in enumerate(self.columns)}
+        return np.array([lookup[col] for col in columns], dtype=np.intp)
+
+    def sum(self, column_groups=None):
+        """Row-group x column sums, or row-group x column-group sums for a list of position arrays"""
+        if len(self.offsets) == 0:
+            sums = np.zeros((0, len(self.columns)), dtype=self.values.dtype)
+        else:
+            sums = np.add.reduceat(self.values, self.offsets, axis=0)
+        if column_groups is None:
+            return sums
+        return sums @ membership_matrix(len(self.columns), column_groups)
+
+    def to_frame(self, sums=None, extra_columns=None):
+        """Key columns plus one sum column per indicator, like groupby(...).sum().reset_index()
+
+        extra_columns: kolom tambahan per kelompok (nama -> nilai) yang ikut
+        digabung dalam satu concat, supaya frame lebar tidak terfragmentasi.
+        """
+        sums = self.sum() if sums is None else sums
+        # Jumlah bilangan bulat dikembalikan sebagai int64 (float64 tepat sampai 2**53);
+        # astype per kolom hanya bila jenis kolomnya campuran
+        if all(self.integer_columns):
+            frame = pd.DataFrame(sums.astype(np.int64, copy=False), columns=self.columns)
+        elif not any(self.integer_columns):
+            frame = pd.DataFrame(sums.astype(np.float64, copy=False), columns=self.columns)
+        else:
+            frame = pd.DataFrame(sums, columns=self.columns).astype({
+                col: 'int64' if is_integer else 'float64'
+                for col, is_integer in zip(self.columns, self.integer_columns)
+            })
+        parts = [self.labels, frame]
+        if extra_columns:
+            parts.append(pd.DataFrame(extra_columns, index=frame.index))
+        return pd.concat(parts, axis=1)
+
+def group_sum_frame(df, by, columns):
+    """Sum columns of df per group of the by columns; drop-in for groupby(by)[columns].sum().reset_index()"""
+    by = [by] if isinstance(by, str) else list(by)
+    return SheetMatrix(df, by, columns).to_frame()
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+import backend
+
+AGE_BANDS = ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44',
+             '45-49', '50-54', '55-59', '60-64', '65-69', '70-74', '>75']
+
+
+def kel_umur_sheet():
+    """Header lembar DATA KEL UMUR: LK/PR/JML per rentang umur, termasuk '>75'"""
+    columns = [f'{prefix} ({band})' for band in AGE_BANDS for prefix in ('LK', 'PR', 'JML')]
+    df = pd.DataFrame(np.ones((2, len(columns)), dtype=np.int64), columns=columns)
+    df.insert(0, 'DESA', ['D1', 'D2'])
+    df.insert(0, 'KECAMATAN', ['K1', 'K1'])
+    return df
+
+
+def test_umur_cols_include_open_ended_band():
+    filter_data = backend.build_filter_data('kelompok_umur', kel_umur_sheet())
+    assert len(filter_data['umur_cols']) == 48
+    assert filter_data['umur_cols'][-3:] == ['LK (>75)', 'PR (>75)', 'JML (>75)']
+
+
+def test_umur_categories_use_parsed_bounds():
+    categories = backend.build_filter_data('kelompok_umur', kel_umur_sheet())['umur_categories']
+    assert categories['Balita (0-4 tahun)'] == ['LK (0-4)', 'PR (0-4)', 'JML (0-4)']
+    assert 'JML (40-44)' in categories['Dewasa (35-54 tahun)']
+    assert 'JML (>75)' in categories['Lansia (55+ tahun)']
+    assert sum(len(cols) for cols in categories.values()) == 48
+
+
+def test_parse_age_band():
+    assert backend.parse_age_band('LK (5 - 9)') == (5, 9)
+    assert backend.parse_age_band('JML (>75)') == (75, None)
+    assert backend.parse_age_band('75+') == (75, None)
+    assert backend.parse_age_band('KECAMATAN') is None
+
+
+def test_pekerjaan_sector_remainder_group():
+    column_groups = backend.compile_column_groups('pekerjaan_sector', ('PETANI', 'BURUH TANI', 'XYZ'))
+    assert 'XYZ' in column_groups.groups['LAINNYA']
+    assert list(column_groups.groups)[-1] == 'LAINNYA'
+    assert column_groups.positions['LAINNYA'].tolist() == [2]
+
+
+def test_umur_category_sums_skip_subtotals():
+    df = kel_umur_sheet()
+    group_df = backend.aggregate_column_groups(df, 'KECAMATAN', 'kelompok_umur')
+    # Dua desa x (LK + PR) per rentang; kolom JML tidak ikut dijumlahkan
+    assert group_df.loc['K1', 'Balita (0-4 tahun)'] == 4
+    assert group_df.loc['K1'].sum() == 2 * 32
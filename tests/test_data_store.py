@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from data_store import SemesterStore
+
+SHEET = 'DATA AGREGAT'
+SEMESTER1 = 'STAT_SMT_I_2024.xlsx'
+SEMESTER2 = 'STAT_SMT_2_2024.xlsx'
+
+
+def write_semester(data_dir, filename, df):
+    with pd.ExcelWriter(data_dir / filename) as writer:
+        df.to_excel(writer, sheet_name=SHEET, index=False)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setenv("MADIUN_DATA_DIR", str(data_dir))
+    monkeypatch.setenv("MADIUN_CACHE_DIR", str(tmp_path / "cache"))
+
+    # Semester 1: kecamatan A dan B; semester 2: B dan C, dengan desa B2 hanya di semester 2.
+    # Kolom LANSIA hanya ada di semester 1
+    write_semester(data_dir, SEMESTER1, pd.DataFrame({
+        'KECAMATAN': ['A', 'B'],
+        'DESA': ['A1', 'B1'],
+        'LK': [1, 2],
+        'PR': [3, 4],
+        'LANSIA': [5, 6]
+    }))
+    write_semester(data_dir, SEMESTER2, pd.DataFrame({
+        'KECAMATAN': ['B', 'B', 'C'],
+        'DESA': ['B1', 'B2', 'C1'],
+        'LK': [5, 6, 7],
+        'PR': [8, 9, 10]
+    }))
+
+    store = SemesterStore(str(tmp_path / "store.sqlite"))
+    assert sorted(store.sync()) == sorted([SEMESTER1, SEMESTER2])
+    return store
+
+
+def test_sync_lists_semesters_and_common_indicators(store):
+    assert [semester for semester, _ in store.list_semesters()] == [SEMESTER1, SEMESTER2]
+    assert store.common_indicators(SHEET, [SEMESTER1, SEMESTER2]) == ['LK', 'PR']
+    assert store.sync() == []
+
+
+def test_compare_semesters_keeps_locations_in_both(store):
+    merged = store.compare_semesters(SHEET, SEMESTER1, SEMESTER2, ['LK', 'PR'])
+    assert list(merged.index) == ['B']
+    assert merged.loc['B', f'LK ({SEMESTER1})'] == 2
+    assert merged.loc['B', f'LK ({SEMESTER2})'] == 11
+    assert (merged.dtypes == 'int64').all()
+
+
+def test_compare_semesters_by_desa(store):
+    merged = store.compare_semesters(SHEET, SEMESTER1, SEMESTER2, ['LK', 'PR'], level='DESA')
+    assert list(merged.index) == [('B', 'B1')]
+    assert merged.loc[('B', 'B1'), f'PR ({SEMESTER2})'] == 8
+    assert (merged.dtypes == 'int64').all()
+
+
+def test_compare_semesters_missing_indicator_counts_as_zero(store):
+    # LANSIA tidak tercatat di semester 2: setelah inner join kolomnya kosong dan diisi 0
+    merged = store.compare_semesters(SHEET, SEMESTER1, SEMESTER2, ['LK', 'LANSIA'])
+    assert merged.loc['B', f'LANSIA ({SEMESTER1})'] == 6
+    assert merged.loc['B', f'LANSIA ({SEMESTER2})'] == 0
+    assert merged[f'LANSIA ({SEMESTER2})'].dtype == 'int64'
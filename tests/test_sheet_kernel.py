@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sheet_kernel import OTHER_LABEL, SheetMatrix, fold_frame, group_sum_frame, top_n_positions
+
+
+def test_top_n_positions_keeps_original_order():
+    assert list(top_n_positions([5, 1, 9, 3, 7], 2)) == [2, 4]
+
+
+def test_top_n_positions_keeps_all_when_folding_one():
+    # Melipat satu posisi saja ke LAINNYA tidak mengurangi apa pun
+    assert list(top_n_positions([5, 1, 9], 2)) == [0, 1, 2]
+    assert list(top_n_positions([5, 1, 9], None)) == [0, 1, 2]
+
+
+def test_top_n_positions_treats_nan_as_zero():
+    assert list(top_n_positions([np.nan, 4, 1, 2], 2)) == [1, 3]
+
+
+@pytest.mark.parametrize("n", [0, -1])
+def test_top_n_positions_rejects_n_below_one(n):
+    with pytest.raises(ValueError):
+        top_n_positions([5, 1, 9, 3], n)
+
+
+def test_fold_frame_sums_the_rest_into_other():
+    df = pd.DataFrame(
+        {'A': [1, 2, 3], 'B': [10, 20, 30], 'C': [0, 0, 1], 'D': [5, 5, 5]},
+        index=pd.Index(['K1', 'K2', 'K3'], name='KECAMATAN')
+    )
+    folded = fold_frame(df, n_columns=2)
+    assert list(folded.columns) == ['B', 'D', OTHER_LABEL]
+    assert list(folded[OTHER_LABEL]) == [1, 2, 4]
+    assert folded.index.name == 'KECAMATAN'
+    assert fold_frame(df) is df
+
+
+def test_sheet_matrix_select_matches_direct_build():
+    df = pd.DataFrame({
+        'KECAMATAN': ['K2', 'K1', 'K2', 'K3', None, 'K1'],
+        'A': [1, 2, 3, 4, 5, 6],
+        'B': [0.5, 1.0, np.nan, 2.0, 1.0, 3.0],
+        'C': [10, 20, 30, 40, 50, 60]
+    })
+    matrix = SheetMatrix(df, ['KECAMATAN'], ['A', 'B', 'C'])
+    rows = np.array([0, 2, 4, 5])
+    selected = matrix.select(rows, ['C', 'A'])
+    # K3 tidak punya baris terpilih sehingga kelompoknya hilang; kolom bilangan bulat tetap int64
+    expected = group_sum_frame(df.iloc[rows], ['KECAMATAN'], ['C', 'A'])
+    pd.testing.assert_frame_equal(selected.to_frame(), expected)
+    assert selected.values.dtype == np.int64
+    assert matrix.select() is matrix
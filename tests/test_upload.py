@@ -0,0 +1,12 @@
+import zipfile
+
+import pytest
+
+import backend
+
+
+def test_corrupt_upload_leaves_no_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("MADIUN_CACHE_DIR", str(tmp_path))
+    with pytest.raises(zipfile.BadZipFile):
+        backend.submit_uploaded_workbook(b"bukan workbook", "rusak.xlsx")
+    assert list(tmp_path.iterdir()) == []